@@ -0,0 +1,184 @@
+"""Admission control for the chatbot's inference endpoints.
+
+At most CHATBOT_MAX_CONCURRENT requests run at once; the rest wait in a
+queue of CHATBOT_MAX_QUEUE, served round-robin across users so one client
+sending a burst cannot starve everyone else. A user may hold at most
+CHATBOT_MAX_PER_USER running or queued requests; the next gets a 429.
+
+A request is turned away up front (503) when the queue is full, or when its
+expected wait, from its place in the queue and the recent service time,
+already exceeds CHATBOT_LATENCY_BUDGET_MS; one still queued when the budget
+runs out is turned away too. Either way the client hears within the budget
+instead of joining a backlog that makes every request slow.
+
+Waiting requests hold a request thread, so keep concurrency plus queue well
+under the server's threads (ASGI_REQUEST_THREADS): the rest stay free for
+the health check and the other endpoints.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+import metrics
+
+CHATBOT_ADMISSION = os.environ.get("CHATBOT_ADMISSION", "1") == "1"
+# Inference is CPU-bound: a few requests per core keep the cores busy, and
+# more only stretch every request's latency.
+CHATBOT_MAX_CONCURRENT = int(os.environ.get("CHATBOT_MAX_CONCURRENT", 4 * (os.cpu_count() or 1)))
+CHATBOT_MAX_QUEUE = int(os.environ.get("CHATBOT_MAX_QUEUE", "32"))
+CHATBOT_MAX_PER_USER = int(os.environ.get("CHATBOT_MAX_PER_USER", "4"))
+CHATBOT_LATENCY_BUDGET_MS = float(os.environ.get("CHATBOT_LATENCY_BUDGET_MS", "1000"))
+
+# Weight of the latest request in the service-time average.
+SERVICE_TIME_ALPHA = 0.1
+
+ADMISSIONS = metrics.counter(
+    "remedi_admission_total",
+    "Requests through admission control: admitted at once, admitted after queueing, or shed and why.",
+    ("limiter", "result"),
+)
+ADMISSION_ACTIVE = metrics.gauge(
+    "remedi_admission_active", "Admitted requests running.", ("limiter",),
+)
+ADMISSION_QUEUED = metrics.gauge(
+    "remedi_admission_queued", "Requests waiting for admission.", ("limiter",),
+)
+ADMISSION_WAIT = metrics.histogram(
+    "remedi_admission_wait_seconds", "Time requests spent queued for admission, admitted or not.", ("limiter",),
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of admitting a request. ``status`` is 429 when the
+    user is over their share, 503 when the service is."""
+
+    def __init__(self, limiter: str, reason: str, status: int, retry_after: int = 1):
+        super().__init__(f"{limiter}: {reason}")
+        self.limiter = limiter
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, max_per_user: int,
+                 latency_budget: float, initial_service_time: float = 0.05):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.latency_budget = latency_budget
+        self.service_time = initial_service_time
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        self._held: Dict[str, int] = {}  # running + queued, per user
+        # Per-user FIFOs; the user at the front of the ring is served next.
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdmissionController":
+        return cls(name, CHATBOT_MAX_CONCURRENT, CHATBOT_MAX_QUEUE, CHATBOT_MAX_PER_USER,
+                   CHATBOT_LATENCY_BUDGET_MS / 1000.0)
+
+    def expected_wait(self, position: int) -> float:
+        """Seconds until the ``position``-th queued request (1-based) is admitted."""
+        return position * self.service_time / self.max_concurrent
+
+    def _reject(self, reason: str, status: int, wait: float = 0.0):
+        ADMISSIONS.inc(limiter=self.name, result=f"shed_{reason}")
+        raise AdmissionRejected(self.name, reason, status, max(1, math.ceil(wait)))
+
+    def acquire(self, user: str) -> None:
+        with self._lock:
+            held = self._held.get(user, 0)
+            if held >= self.max_per_user:
+                self._reject("user_limit", 429, self.service_time)
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self._held[user] = held + 1
+                ADMISSION_ACTIVE.set(self._active, limiter=self.name)
+                ADMISSIONS.inc(limiter=self.name, result="admitted")
+                return
+            if self._queued >= self.max_queue:
+                self._reject("queue_full", 503, self.expected_wait(self._queued))
+            wait = self.expected_wait(self._queued + 1)
+            if wait > self.latency_budget:
+                self._reject("over_budget", 503, wait)
+
+            waiter = _Waiter()
+            queue = self._queues.get(user)
+            if queue is None:
+                queue = self._queues[user] = deque()
+            queue.append(waiter)
+            self._queued += 1
+            self._held[user] = held + 1
+            ADMISSION_QUEUED.set(self._queued, limiter=self.name)
+
+        queued_at = time.perf_counter()
+        waiter.event.wait(self.latency_budget)
+        ADMISSION_WAIT.observe(time.perf_counter() - queued_at, limiter=self.name)
+        with self._lock:
+            if waiter.granted:
+                ADMISSIONS.inc(limiter=self.name, result="queued")
+                return
+            # Timed out before a slot came up: leave the queue.
+            queue = self._queues[user]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user]
+            self._queued -= 1
+            self._drop(user)
+            ADMISSION_QUEUED.set(self._queued, limiter=self.name)
+            self._reject("timeout", 503, self.expected_wait(self._queued))
+
+    def release(self, user: str, service_time: float) -> None:
+        with self._lock:
+            self.service_time += SERVICE_TIME_ALPHA * (service_time - self.service_time)
+            self._drop(user)
+            if self._queues:
+                # Hand the slot straight to the next user in turn.
+                next_user, queue = next(iter(self._queues.items()))
+                waiter = queue.popleft()
+                if queue:
+                    self._queues.move_to_end(next_user)
+                else:
+                    del self._queues[next_user]
+                self._queued -= 1
+                waiter.granted = True
+                waiter.event.set()
+                ADMISSION_QUEUED.set(self._queued, limiter=self.name)
+            else:
+                self._active -= 1
+                ADMISSION_ACTIVE.set(self._active, limiter=self.name)
+
+    def _drop(self, user: str) -> None:
+        held = self._held[user] - 1
+        if held:
+            self._held[user] = held
+        else:
+            del self._held[user]
+
+    @contextmanager
+    def admit(self, user: str):
+        """Hold a slot for ``user`` for the duration of the block; raises AdmissionRejected."""
+        self.acquire(user)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(user, time.perf_counter() - start)
@@ -1,17 +1,58 @@
 from flask import Flask
 from flask_cors import CORS
+import os
+import metrics
+import observability
+
+observability.setup_logging()
 
 app = Flask(__name__)
 CORS(app)
+observability.instrument(app)
 
 from routes import auth, chatbot_routes, prescription
 app.register_blueprint(auth.auth_bp, url_prefix='/api')
 app.register_blueprint(chatbot_routes.chatbot_bp, url_prefix='/chatbot')
 app.register_blueprint(prescription.upload_bp, url_prefix='/upload')
+
+# Chatbot artifacts load lazily; warm them in the background so the first
+# chat request doesn't pay for it while auth/upload routes serve immediately.
+if os.environ.get("WARMUP_MODELS", "1") == "1":
+    chatbot_routes.s.registry.start_warm_up()
+
+# Create any missing indexes without holding up startup (no-op once they exist).
+import indexes
+if indexes.MONGO_ENSURE_INDEXES:
+    indexes.ensure_indexes_in_background(prescription.db)
+
+# Reclaim prescription files no prescription points at any more.
+if os.environ.get("BLOB_GC", "1") == "1":
+    prescription.blob_store.start_gc()
+
+# Drop upload sessions nobody finished.
+if os.environ.get("UPLOAD_SESSION_GC", "1") == "1":
+    prescription.upload_sessions.start_gc()
+
+# OCR normally runs in separate `python jobs.py` workers; small deployments
+# can run one inside the web process instead.
+if os.environ.get("OCR_WORKER_IN_APP", "0") == "1":
+    import jobs
+    jobs.JobWorker(prescription.prescriptions_collection, prescription.db['ocr_dead_letters']).start()
+
 @app.route('/')
 def health_check():
     return {"status": "Server is running", "message": "Welcome to the API"}, 200
 
+@app.route('/ready')
+def readiness_check():
+    registry = chatbot_routes.s.registry
+    ready = registry.ready()
+    return {"ready": ready, "artifacts": registry.report()}, 200 if ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
 @app.errorhandler(404)
 def not_found(error):
     return {"error": "Endpoint not found"}, 404
@@ -0,0 +1,35 @@
+"""ASGI entry point.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    python asgi.py            # same, configured from ASGI_* variables
+
+Needs the optional extras ``pip install uvicorn a2wsgi``; app.py alone does not.
+
+The event loop owns the sockets, so slow clients and idle keep-alive
+connections cost no threads. Each request then runs the Flask app on a
+bounded request-thread pool (ASGI_REQUEST_THREADS), and that pool is what
+Mongo calls block on; keep it at or below the pymongo connection pool size.
+Model inference is handed on to the "inference" pool (see pools.py), so the
+number of concurrent encodes stays fixed however many requests are in flight.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app
+
+ASGI_REQUEST_THREADS = int(os.environ.get("ASGI_REQUEST_THREADS", "64"))
+
+app = WSGIMiddleware(flask_app, workers=ASGI_REQUEST_THREADS)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "asgi:app",
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", "5000")),
+        workers=int(os.environ.get("ASGI_WORKERS", "1")),
+        backlog=int(os.environ.get("ASGI_BACKLOG", "2048")),
+        timeout_keep_alive=int(os.environ.get("ASGI_KEEP_ALIVE_SECONDS", "5")),
+    )
@@ -0,0 +1,63 @@
+"""Shared request authentication with per-process caches.
+
+Both blueprints authenticate through here: ``verify_token`` caches the
+claims of tokens whose signature has already been checked, and ``get_user``
+caches a small projection of the user document. Cached claims are never
+used past the token's own ``exp``. Each worker process has its own caches,
+so a change made through another worker is seen here after at most
+AUTH_USER_CACHE_TTL_SECONDS; changes made here call ``invalidate_user``.
+"""
+import os
+import time
+from typing import Optional
+
+import jwt
+from bson import ObjectId
+
+import utils
+from cache import LRUCache
+
+AUTH_TOKEN_CACHE_MAX_BYTES = int(os.environ.get("AUTH_TOKEN_CACHE_MAX_BYTES", str(1024 * 1024)))
+AUTH_TOKEN_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+AUTH_USER_CACHE_MAX_BYTES = int(os.environ.get("AUTH_USER_CACHE_MAX_BYTES", str(1024 * 1024)))
+AUTH_USER_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+
+# What request handlers get as the current user; anything else is fetched by the route.
+USER_PROJECTION = {"_id": 1, "email": 1}
+
+token_cache = LRUCache("auth_tokens", AUTH_TOKEN_CACHE_MAX_BYTES, ttl=AUTH_TOKEN_CACHE_TTL_SECONDS)
+user_cache = LRUCache("auth_users", AUTH_USER_CACHE_MAX_BYTES, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+
+
+def bearer_token(header: Optional[str]) -> Optional[str]:
+    if not header:
+        return None
+    return header[7:] if header.startswith("Bearer ") else header
+
+
+def verify_token(token: str) -> dict:
+    """Claims of a valid token. Raises jwt.ExpiredSignatureError or
+    jwt.InvalidTokenError like ``jwt.decode``; failures are not cached."""
+    claims = token_cache.get(token)
+    if claims is not None:
+        if claims.get("exp") is None or claims["exp"] > time.time():
+            return claims
+        token_cache.pop(token, reason="expired")
+
+    claims = jwt.decode(token, utils.SECRET_KEY, algorithms=["HS256"])
+    token_cache.put(token, claims, nbytes=len(token) + 512)
+    return claims
+
+
+def get_user(user_id: str, users_collection) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is None:
+        user = users_collection.find_one({"_id": ObjectId(user_id)}, USER_PROJECTION)
+        if user is None:
+            return None
+        user_cache.put(user_id, user, nbytes=512)
+    return user
+
+
+def invalidate_user(user_id: str) -> None:
+    user_cache.pop(str(user_id))
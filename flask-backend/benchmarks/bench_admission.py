@@ -0,0 +1,194 @@
+"""Overload: chatbot latency, shedding and health checks with admission control off vs on.
+
+Starts the app (threaded dev server, mongomock) once per mode and runs,
+for --duration seconds, at the same time:
+
+    --users       well-behaved users, one connection each, sending
+                  /chatbot/extract_symptoms/next back to back
+    --heavy       connections of a single user sending /chatbot/predict_batch
+                  with --batch symptom sets each, more than the CPU can serve
+    one client    polling the health check at /
+
+Without admission control every request is accepted and latency grows with
+the backlog; with it, p99 of the admitted requests stays near the latency
+budget, the excess gets a fast 503 or 429, and the heavy user's burst does
+not crowd out the others. The load generator shares the machine with the
+server, so on few cores part of every latency is the generator's own.
+
+Run from flask-backend/:
+    python benchmarks/bench_admission.py --users 100 --heavy 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from load_test import build_request, percentile, read_response, wait_until_ready  # noqa: E402
+
+
+def serve(port):
+    # Stand-in database, patched in before the routes bind their collections.
+    sys.path.insert(0, BACKEND_DIR)
+    import mongomock
+    import dbConnect
+    dbConnect.db = mongomock.MongoClient()["remedi"]
+    dbConnect.users_collection = dbConnect.db["users"]
+    import app
+    app.app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def batch_request(url, token, batch, seed):
+    sys.path.insert(0, BACKEND_DIR)
+    from chatbot import sym_utils as s
+    rng = random.Random(seed)
+    symptoms = list(s.symptom_descriptions) or ["itching", "skin_rash", "nodal_skin_eruptions"]
+    body = json.dumps({"symptom_sets": [rng.sample(symptoms, 4) for _ in range(batch)]}).encode()
+    host = url.split("//", 1)[1]
+    return (f"POST /chatbot/predict_batch HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n"
+            f"Connection: keep-alive\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+            ).encode() + body
+
+
+def summarize(stats, elapsed):
+    latencies = stats["latencies"]
+    ok = [t for t, code in zip(latencies, stats["codes"]) if code == 200]
+    return {
+        "requests": len(latencies),
+        "ok_per_s": len(ok) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "ok_p99_ms": percentile(ok, 0.99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+        "status": {str(k): v for k, v in sorted(stats["status"].items())},
+        "connection_errors": stats["errors"],
+    }
+
+
+def admission_counts(url):
+    """remedi_admission_total by result, scraped from /metrics."""
+    with urllib.request.urlopen(f"{url}/metrics", timeout=10) as response:
+        text = response.read().decode()
+    counts = {}
+    for line in text.splitlines():
+        if line.startswith("remedi_admission_total{"):
+            labels, value = line.rsplit(" ", 1)
+            counts[labels.split('result="', 1)[1].split('"', 1)[0]] = float(value)
+    return counts
+
+
+async def timed_client(host, port, request, deadline, stats):
+    """load_test.client, keeping each response's latency by status."""
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, close = await read_response(reader)
+            stats["latencies"].append(time.perf_counter() - start)
+            stats["codes"].append(status)
+            stats["status"][status] = stats["status"].get(status, 0) + 1
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats["errors"] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run_phase(url, user_requests, heavy_request, heavy, health_request, duration):
+    host, port = url.split("//", 1)[1].split(":")
+    port = int(port)
+    users, hog, health = ({"latencies": [], "codes": [], "status": {}, "errors": 0} for _ in range(3))
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(timed_client(host, port, request, deadline, users) for request in user_requests),
+        *(timed_client(host, port, heavy_request, deadline, hog) for _ in range(heavy)),
+        timed_client(host, port, health_request, deadline, health),
+    )
+    elapsed = time.perf_counter() - started
+    return {name: summarize(stats, elapsed) for name, stats in
+            (("users", users), ("heavy user", hog), ("health", health))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--heavy", type=int, default=30, help="connections of the single heavy user")
+    parser.add_argument("--batch", type=int, default=2048, help="symptom sets per heavy request")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="CHATBOT_LATENCY_BUDGET_MS with admission on")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    # One socket per client on each side.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 8192)), hard))
+
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(16))
+    sys.path.insert(0, BACKEND_DIR)
+    from utils import generate_jwt
+    url = f"http://127.0.0.1:{args.port}"
+    user_requests = [build_request(url, "next", generate_jwt(f"{i:024x}", f"user{i}@example.com"))
+                     for i in range(1, args.users + 1)]
+    heavy_request = batch_request(url, generate_jwt("f" * 24, "heavy@example.com"), args.batch, 0)
+    health_request = build_request(url, "health", "")
+
+    results = {}
+    print(f"{'mode':<5} {'clients':<11} {'ok/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'ok p99 ms':>10}"
+          f" {'max ms':>9} {'200':>7} {'429':>6} {'503':>6} {'conn err':>9}")
+    for mode, enabled in (("off", "0"), ("on", "1")):
+        env = dict(os.environ, CHATBOT_ADMISSION=enabled, CHATBOT_LATENCY_BUDGET_MS=str(args.budget_ms),
+                   CHAT_SESSION_PERSIST="0", BLOB_GC="0", MONGO_ENSURE_INDEXES="0")
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(args.port)],
+                                  cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  start_new_session=True)
+        try:
+            wait_until_ready(url, timeout=120)
+            asyncio.run(run_phase(url, user_requests[:1], heavy_request, 1, health_request, 2.0))  # loads the artifacts
+            results[mode] = asyncio.run(run_phase(url, user_requests, heavy_request, args.heavy, health_request,
+                                                  args.duration))
+            for name, r in results[mode].items():
+                status = r["status"]
+                print(f"{mode:<5} {name:<11} {r['ok_per_s']:>8.1f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+                      f" {r['ok_p99_ms']:>10.1f} {r['max_ms']:>9.1f} {status.get('200', 0):>7}"
+                      f" {status.get('429', 0):>6} {status.get('503', 0):>6} {r['connection_errors']:>9}")
+            results[mode]["admission"] = admission_counts(url)
+            if results[mode]["admission"]:
+                print(f"{mode:<5} admission  " + ", ".join(f"{k}={v:.0f}" for k, v in results[mode]["admission"].items()))
+        finally:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Per-request authentication overhead with and without the auth caches.
+
+Times a no-op route behind each decorator through the Flask test client:
+- auth.auth_required, which verifies the JWT
+- prescription.token_required, which verifies the JWT and loads the user
+The users collection is mongomock; --db-latency-ms adds a simulated
+round-trip to every user lookup, to stand in for a real MongoDB server.
+
+Run from flask-backend/:
+    python benchmarks/bench_auth.py --db-latency-ms 0.5
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class SlowCollection:
+    def __init__(self, collection, latency):
+        self.collection = collection
+        self.latency = latency
+
+    def find_one(self, *args, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.collection.find_one(*args, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--db-latency-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(32))
+    sys.path.insert(0, BACKEND_DIR)
+    import mongomock
+    from flask import Flask, jsonify
+
+    import auth_cache
+    import dbConnect
+    dbConnect.db = mongomock.MongoClient()["remedi"]
+    dbConnect.users_collection = dbConnect.db["users"]
+    from routes import auth, prescription
+    from utils import generate_jwt
+
+    user_id = dbConnect.users_collection.insert_one({"email": "bench@example.com", "name": "Bench"}).inserted_id
+    prescription.users_collection = SlowCollection(dbConnect.users_collection, args.db_latency_ms / 1000)
+    headers = {"Authorization": f"Bearer {generate_jwt(user_id, 'bench@example.com')}"}
+
+    app = Flask(__name__)
+
+    @app.route("/chatbot-style")
+    @auth.auth_required
+    def chatbot_style(user_id):
+        return jsonify(ok=True)
+
+    @app.route("/upload-style")
+    @prescription.token_required
+    def upload_style(current_user):
+        return jsonify(ok=True)
+
+    @app.route("/none")
+    def unauthenticated():
+        return jsonify(ok=True)
+
+    client = app.test_client()
+
+    def per_request_us(path, cached):
+        caches = (auth_cache.token_cache, auth_cache.user_cache)
+        budgets = [c.max_bytes for c in caches]
+        if not cached:
+            for c in caches:
+                c.clear()
+                c.max_bytes = 0  # every put is refused, every get misses
+        try:
+            for _ in range(50):
+                client.get(path, headers=headers)
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.get(path, headers=headers)
+            return (time.perf_counter() - start) / args.requests * 1e6
+        finally:
+            for c, budget in zip(caches, budgets):
+                c.max_bytes = budget
+
+    baseline = per_request_us("/none", cached=True)
+    print(f"db latency {args.db_latency_ms} ms, {args.requests} requests; unauthenticated route {baseline:.0f} us/request")
+    print(f"{'decorator':<22} {'uncached us':>12} {'cached us':>10} {'auth overhead uncached':>23} {'cached':>8}")
+    for name, path in (("auth_required", "/chatbot-style"), ("token_required", "/upload-style")):
+        uncached = per_request_us(path, cached=False)
+        cached = per_request_us(path, cached=True)
+        print(f"{name:<22} {uncached:>12.0f} {cached:>10.0f} {uncached - baseline:>23.0f} {cached - baseline:>8.0f}")
+    print(f"token cache {auth_cache.token_cache.stats()}")
+    print(f"user cache  {auth_cache.user_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
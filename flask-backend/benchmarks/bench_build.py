@@ -0,0 +1,174 @@
+"""Artifact build at scale: MI matrix time and memory on a synthetic symptom table.
+
+Rows are drawn like the real table: each has one disease and each of that
+disease's --profile symptoms with probability 1/2, diseases picking their
+symptoms with a skew towards common ones. The MI matrix is computed with
+chatbot.pipeline.mutual_information for each --jobs value; --check compares
+a column subset with sklearn's normalized_mutual_info_score, and
+--reference times that pair-by-pair approach on a few columns and
+extrapolates it to the full matrix. --forest also times the forest on the
+first --forest-rows rows.
+
+--full instead runs the whole chatbot.pipeline.build on the table (saved as
+a sparse .npz), with its outputs in a scratch directory: load, MI, forest,
+embeddings and bundle, plus the MI CSV export with --mi-csv.
+
+Run from flask-backend/:
+    python benchmarks/bench_build.py --rows 1000000 --symptoms 10000 --jobs 1,2,4
+    python benchmarks/bench_build.py --rows 1000000 --symptoms 10000 --full [--mi-csv]
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.pipeline import build, mutual_information, train_forest  # noqa: E402
+
+
+def make_table(rows, symptoms, diseases, profile, seed):
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, symptoms + 1) ** 0.8
+    popularity /= popularity.sum()
+    profiles = np.stack([rng.choice(symptoms, profile, replace=False, p=popularity) for _ in range(diseases)])
+    labels = rng.integers(diseases, size=rows)
+    present = rng.random((rows, profile)) < 0.5
+    cols = profiles[labels][present]
+    indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))])
+    X = sparse.csr_matrix((np.ones(cols.size, dtype=np.float32), cols, indptr), shape=(rows, symptoms))
+    X.sort_indices()
+    return X, labels.astype(str)
+
+
+def check(X, mi, columns, seed):
+    from sklearn.metrics import normalized_mutual_info_score
+
+    rng = np.random.default_rng(seed)
+    counts = np.asarray(X.sum(axis=0)).ravel()
+    cols = rng.choice(np.flatnonzero(counts > 0), columns, replace=False)
+    dense = X[:, cols].toarray()
+    worst = 0.0
+    for a in range(columns):
+        for b in range(a + 1, columns):
+            expected = normalized_mutual_info_score(dense[:, a], dense[:, b])
+            worst = max(worst, abs(expected - float(mi[cols[a], cols[b]])))
+    return worst
+
+
+def reference_seconds(X, columns):
+    # Pair by pair over dense columns, as a straightforward build would do it.
+    from sklearn.metrics import normalized_mutual_info_score
+
+    dense = X[:, :columns].toarray()
+    start = time.perf_counter()
+    for a in range(columns):
+        for b in range(a + 1, columns):
+            normalized_mutual_info_score(dense[:, a], dense[:, b])
+    per_pair = (time.perf_counter() - start) / (columns * (columns - 1) / 2)
+    return per_pair * X.shape[1] * (X.shape[1] - 1) / 2
+
+
+def full_build(X, labels, symptoms, jobs, mi_csv, scratch):
+    table = os.path.join(scratch, "table.npz")
+    np.savez(table, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+             symptoms=np.array(symptoms), labels=labels)
+    timings = {}
+    start = time.perf_counter()
+    path = build(table, jobs, out_dir=os.path.join(scratch, "out"), bundle_dir=os.path.join(scratch, "bundle"),
+                 mi_csv=mi_csv, timings=timings)
+    timings["total"] = time.perf_counter() - start
+    sizes = {}
+    for directory in (os.path.join(scratch, "out"), path):
+        for name in os.listdir(directory):
+            sizes[name] = os.path.getsize(os.path.join(directory, name))
+    return timings, sizes
+
+
+def max_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--symptoms", type=int, default=10_000)
+    parser.add_argument("--diseases", type=int, default=1_000)
+    parser.add_argument("--profile", type=int, default=12, help="symptoms per disease")
+    parser.add_argument("--jobs", default="1", help="comma-separated process counts")
+    parser.add_argument("--check", type=int, default=40, help="columns compared with sklearn (0 skips)")
+    parser.add_argument("--reference", type=int, default=0, help="columns timed pair by pair (0 skips)")
+    parser.add_argument("--forest", action="store_true")
+    parser.add_argument("--forest-rows", type=int, default=100_000)
+    parser.add_argument("--full", action="store_true", help="time the whole pipeline build instead")
+    parser.add_argument("--mi-csv", action="store_true", help="with --full, also write mi_matrix.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    X, labels = make_table(args.rows, args.symptoms, args.diseases, args.profile, args.seed)
+    result = {
+        "rows": args.rows, "symptoms": args.symptoms, "nnz": int(X.nnz),
+        "table_seconds": time.perf_counter() - start, "mi": [],
+    }
+    print(f"table: {args.rows} x {args.symptoms}, {X.nnz} non-zeros, {result['table_seconds']:.1f}s")
+
+    if args.full:
+        jobs = int(args.jobs.split(",")[-1])
+        with tempfile.TemporaryDirectory() as scratch:
+            timings, sizes = full_build(X, labels, [f"s{i:05d}" for i in range(args.symptoms)], jobs,
+                                        args.mi_csv, scratch)
+        result.update(build=timings, sizes=sizes, max_rss_mb=max_rss_mb())
+        for name, seconds in timings.items():
+            print(f"{name}: {seconds:.1f}s")
+        for name, size in sorted(sizes.items(), key=lambda item: -item[1])[:6]:
+            print(f"{name}: {size / 1e6:.1f} MB")
+        print(f"max RSS {max_rss_mb():.0f} MB")
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+        return
+
+    digest = None
+    with tempfile.TemporaryDirectory() as scratch:
+        for jobs in (int(j) for j in args.jobs.split(",")):
+            start = time.perf_counter()
+            mi = mutual_information(X, jobs, out_path=os.path.join(scratch, f"mi-{jobs}.f32"))
+            seconds = time.perf_counter() - start
+            same = digest is None or np.array_equal(digest, mi[:, :64])
+            digest = np.array(mi[:, :64]) if digest is None else digest
+            result["mi"].append({"jobs": jobs, "seconds": seconds, "same_as_first": same})
+            print(f"mutual information, {jobs} job(s): {seconds:.1f}s, max RSS {max_rss_mb():.0f} MB"
+                  f"{'' if same else ', DIFFERENT from the first run'}")
+        if args.check:
+            result["max_abs_error"] = check(X, mi, args.check, args.seed)
+            print(f"max |error| vs sklearn over {args.check} columns: {result['max_abs_error']:.2e}")
+        del mi
+
+    if args.reference:
+        result["reference_seconds"] = reference_seconds(X, args.reference)
+        print(f"pair-by-pair estimate for the full matrix: {result['reference_seconds'] / 3600:.1f} h")
+
+    if args.forest:
+        start = time.perf_counter()
+        train_forest(X[:args.forest_rows], labels[:args.forest_rows], [f"s{i}" for i in range(args.symptoms)],
+                     jobs=int(args.jobs.split(",")[-1]))
+        result["forest_seconds"] = time.perf_counter() - start
+        print(f"forest on {args.forest_rows} rows: {result['forest_seconds']:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
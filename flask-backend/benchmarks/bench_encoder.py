@@ -0,0 +1,110 @@
+"""Encoder backends: query latency, batch throughput and top-k agreement with fp32 mpnet.
+
+Each backend is loaded as the app would load it (ENCODER_MAX_SEQ_LENGTH
+applies) and searched against its own description embeddings, generating
+and storing them first if needed. Agreement compares every backend's
+semantic top-k with the mpnet fp32 one over the same synthetic chat
+messages: overlap@k is the mean fraction of shared symptoms, top1 how often
+the first symptom is the same.
+
+Needs torch and sentence-transformers. Run from flask-backend/:
+    python benchmarks/bench_encoder.py --backends mpnet,mpnet-int8,small --threads 1,2,4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from suite import messages, percentile  # noqa: E402
+from chatbot import sym_utils as s  # noqa: E402
+from chatbot.encoders import BACKENDS, encode_descriptions, load_embeddings, load_model, save_embeddings  # noqa: E402
+from chatbot.semantic_index import ExactIndex  # noqa: E402
+
+
+def backend_index(backend, model):
+    texts = s.registry.get("description_texts")
+    embeddings = load_embeddings(backend, texts)
+    if embeddings is None:
+        embeddings = encode_descriptions(model, texts)
+        save_embeddings(backend, texts, embeddings)
+    return ExactIndex(embeddings, s.registry.get("description_labels"))
+
+
+def latency(model, queries):
+    model.encode(queries[:5], convert_to_numpy=True)  # warm-up
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        model.encode([q], convert_to_numpy=True)
+        times.append(time.perf_counter() - start)
+    return percentile(times, 0.50) * 1000, percentile(times, 0.99) * 1000
+
+
+def throughput(model, queries, batch):
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch):
+        model.encode(queries[i:i + batch], batch_size=batch, convert_to_numpy=True)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="mpnet,mpnet-int8,small")
+    parser.add_argument("--threads", default="0", help="comma-separated torch thread counts; 0 = torch default")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    import torch
+
+    queries = [s.clean_text(m) for m in messages(s, random.Random(args.seed), args.queries)]
+    names = args.backends.split(",")
+    if "mpnet" not in names:
+        names.insert(0, "mpnet")  # the reference for agreement
+
+    results, reference = [], None
+    print(f"{'backend':<12} {'threads':>7} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} {'texts/s':>9}"
+          f" {'overlap@k':>10} {'top1':>6}")
+    for name in names:
+        backend = BACKENDS[name]
+        start = time.perf_counter()
+        model = load_model(backend)
+        load_seconds = time.perf_counter() - start
+        index = backend_index(backend, model)
+        top = [index.search(row, args.top_k) for row in model.encode(queries, convert_to_numpy=True)]
+        if reference is None:
+            reference = top
+        overlap = float(np.mean([len(set(a) & set(b)) / args.top_k for a, b in zip(top, reference)]))
+        top1 = float(np.mean([a[:1] == b[:1] for a, b in zip(top, reference)]))
+
+        for threads in (int(t) for t in args.threads.split(",")):
+            if threads > 0:
+                torch.set_num_threads(threads)
+            p50, p99 = latency(model, queries)
+            rate = throughput(model, queries, args.batch)
+            results.append({
+                "backend": name, "encoder": backend.version, "threads": torch.get_num_threads(),
+                "load_seconds": load_seconds, "p50_ms": p50, "p99_ms": p99, "texts_per_s": rate,
+                f"overlap_at_{args.top_k}": overlap, "top1_agreement": top1,
+            })
+            print(f"{name:<12} {torch.get_num_threads():>7} {load_seconds:>7.1f} {p50:>8.2f} {p99:>8.2f} {rate:>9.1f}"
+                  f" {overlap:>10.3f} {top1:>6.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Forest inference throughput: rf_model.predict vs FlatForest at several batch sizes.
+
+Run from flask-backend/:  python benchmarks/bench_forest.py
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.forest import FlatForest  # noqa: E402
+
+RF_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot", "random_forest_model.joblib")
+
+
+def random_bitsets(n, n_features, rng):
+    # Real conversations confirm a handful of symptoms, so keep rows sparse.
+    X = np.zeros((n, n_features), dtype=np.float32)
+    for row in range(n):
+        X[row, rng.choice(n_features, size=rng.integers(1, 8), replace=False)] = 1.0
+    return X
+
+
+def throughput(fn, X, min_seconds):
+    calls, start = 0, time.perf_counter()
+    while True:
+        fn(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return calls * X.shape[0] / elapsed, elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 4096])
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay-pool", type=int, default=256,
+                        help="distinct symptom sets in the replay-style batch (0 to skip)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    rf_model = joblib.load(RF_MODEL_PATH)
+    forest = FlatForest.from_sklearn(rf_model)
+    rng = np.random.default_rng(args.seed)
+
+    def sklearn_loop(X):
+        # The pre-existing serving path: one rf_model.predict call per row.
+        return [rf_model.predict(X[i:i + 1])[0] for i in range(X.shape[0])]
+
+    cases = [(str(batch), random_bitsets(batch, forest.n_features, rng)) for batch in args.batch_sizes]
+    if args.replay_pool:
+        # Triage replays repeat the same confirmed-symptom sets many times over.
+        batch = max(args.batch_sizes)
+        pool = random_bitsets(args.replay_pool, forest.n_features, rng)
+        cases.append((f"{batch}r", pool[rng.integers(0, args.replay_pool, size=batch)]))
+
+    print(f"{'batch':>6} {'impl':<16} {'rows/s':>12} {'ms/call':>10}")
+    for batch, X in cases:
+        if not np.array_equal(rf_model.predict(X), forest.predict(X)):
+            raise SystemExit(f"FlatForest disagrees with rf_model.predict at batch {batch}")
+
+        impls = [("sklearn batch", rf_model.predict), ("flat_forest", forest.predict)]
+        if X.shape[0] <= 64:
+            impls.insert(0, ("sklearn per-row", sklearn_loop))
+        for name, fn in impls:
+            rows_per_s, per_call = throughput(fn, X, args.seconds)
+            print(f"{batch:>6} {name:<16} {rows_per_s:>12.0f} {per_call * 1e3:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
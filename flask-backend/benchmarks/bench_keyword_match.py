@@ -0,0 +1,113 @@
+"""Keyword matching: per-symptom substring scan vs the token Aho-Corasick matcher.
+
+Measures build time and per-message latency on long free-text inputs, for the
+shipped vocabulary and for synthetic vocabularies of up to 10k symptoms.
+
+Run from flask-backend/:  python benchmarks/bench_keyword_match.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.keyword_matcher import KeywordMatcher, tokenize  # noqa: E402
+
+DESC_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot", "sym_desc.json")
+
+FALLBACK_STOP_WORDS = {
+    "i", "me", "my", "a", "an", "the", "and", "or", "of", "in", "on", "at", "to", "for", "with",
+    "is", "am", "are", "was", "have", "has", "had", "it", "this", "that", "be", "been", "very",
+}
+
+
+def load_stop_words():
+    try:
+        from nltk.corpus import stopwords
+        return set(stopwords.words("english"))
+    except LookupError:
+        return FALLBACK_STOP_WORDS
+
+
+def synthetic_vocabulary(base, size, rng):
+    words = sorted({w for s in base for w in s.split("_")})
+    vocab = list(base)
+    seen = set(vocab)
+    while len(vocab) < size:
+        name = "_".join(rng.sample(words, rng.randint(1, 4)))
+        if name not in seen:
+            seen.add(name)
+            vocab.append(name)
+    return vocab
+
+
+def free_text(vocab, n_words, rng, stop_words):
+    filler = sorted(stop_words) + ["feel", "since", "yesterday", "really", "bad", "also", "sometimes"]
+    words = []
+    while len(words) < n_words:
+        if rng.random() < 0.1:
+            words.extend(rng.choice(vocab).split("_"))
+        else:
+            words.append(rng.choice(filler))
+    return " ".join(words[:n_words]) + "."
+
+
+def substring_scan(vocab, cleaned):
+    return [s for s in vocab if s.replace("_", " ") in cleaned]
+
+
+def percentiles(fn, texts):
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        fn(text)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1e3
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vocab-sizes", type=int, nargs="+", default=[0, 1000, 10000],
+                        help="0 means the shipped vocabulary")
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 500, 5000])
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    stop_words = load_stop_words()
+    with open(DESC_FILE) as f:
+        base = list(json.load(f).keys())
+
+    def clean(text):
+        return " ".join(w for w in tokenize(text) if w not in stop_words)
+
+    print(f"{'vocab':>6} {'words':>6} {'build ms':>9} {'scan p50':>9} {'scan p99':>9} {'ac p50':>8} {'ac p99':>8} {'missed':>7}")
+    for size in args.vocab_sizes:
+        vocab = base if size == 0 else synthetic_vocabulary(base, size, rng)
+        start = time.perf_counter()
+        matcher = KeywordMatcher(vocab, stop_words)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        for n_words in args.words:
+            texts = [free_text(vocab, n_words, rng, stop_words) for _ in range(args.messages)]
+            scan = percentiles(lambda t: substring_scan(vocab, clean(t)), texts)
+            ac = percentiles(matcher.match, texts)
+            # Whole-word phrases in the cleaned text that the matcher misses (should be 0).
+            missed = sum(
+                len(set(substring_scan([f" {s} " for s in vocab], f" {clean(t)} ")) - {f" {s} " for s in matcher.match(t)})
+                for t in texts
+            )
+            print(f"{len(vocab):>6} {n_words:>6} {build_ms:>9.1f} {scan[0]:>9.3f} {scan[1]:>9.3f}"
+                  f" {ac[0]:>8.3f} {ac[1]:>8.3f} {missed:>7}")
+    print("latencies in ms per message; scan includes clean_text, as in hybrid_symptom_match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""p50/p99 latency of next-symptom selection: legacy pandas loop vs MIEngine.
+
+Run from flask-backend/:  python benchmarks/bench_next_symptom.py
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.mi_engine import MIEngine  # noqa: E402
+
+MI_MATRIX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chatbot", "mi_matrix.csv")
+
+
+def legacy_find_next_best_symptom(MI_MATRIX, symptom_weights, asked_symptoms, threshold=0.01):
+    confirmed_symptoms = [s for s, present in symptom_weights.items() if present == 1]
+    if not confirmed_symptoms:
+        print("No confirmed symptoms yet.")
+        return None
+
+    potential_symptoms = set(MI_MATRIX.index) - set(asked_symptoms)
+    if not potential_symptoms:
+        print("No more potential symptoms to ask.")
+        return None
+
+    scores = {}
+    for potential in potential_symptoms:
+        total_mi = sum(MI_MATRIX.loc[conf, potential] for conf in confirmed_symptoms)
+        avg_mi = total_mi / len(confirmed_symptoms)
+        scores[potential] = avg_mi
+        print(f"Potential: {potential}, Avg MI: {avg_mi:.4f}")
+
+    next_symptom, next_score = max(scores.items(), key=lambda x: x[1])
+    print(f"Next candidate: {next_symptom}, Score: {next_score:.4f}")
+    if next_score < threshold or len(asked_symptoms) > 10:
+        print("Score below threshold or too many questions asked, stopping.")
+        return None
+
+    return next_symptom
+
+
+def make_states(symptoms, n, seed):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(n):
+        asked = rng.sample(symptoms, rng.randint(1, 10))
+        weights = {s: 1 for s in asked[:rng.randint(1, len(asked))]}
+        states.append((weights, asked))
+    return states
+
+
+def time_calls(fn, states):
+    samples = []
+    for weights, asked in states:
+        start = time.perf_counter()
+        fn(weights, asked)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1e6
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = pd.read_csv(MI_MATRIX_PATH, index_col=0)
+    engine = MIEngine.from_csv(MI_MATRIX_PATH)
+    states = make_states(list(df.index), args.calls, args.seed)
+
+    def legacy(weights, asked):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return legacy_find_next_best_symptom(df, weights, asked)
+
+    def vectorized(weights, asked):
+        return engine.next_best([s for s, v in weights.items() if v == 1], asked)
+
+    # The legacy loop breaks ties in set order, so compare the chosen scores.
+    def chosen_score(weights, choice):
+        if choice is None:
+            return None
+        return round(float(engine.score([s for s, v in weights.items() if v == 1])[engine.index[choice]]), 5)
+
+    mismatches = sum(
+        chosen_score(w, legacy(w, a)) != chosen_score(w, vectorized(w, a)) for w, a in states
+    )
+
+    print(f"{'implementation':<12} {'p50 (us)':>10} {'p99 (us)':>10}")
+    for name, fn in (("legacy", legacy), ("mi_engine", vectorized)):
+        p50, p99 = time_calls(fn, states)
+        print(f"{name:<12} {p50:>10.1f} {p99:>10.1f}")
+    print(f"decision mismatches: {mismatches}/{len(states)}")
+
+
+if __name__ == "__main__":
+    main()
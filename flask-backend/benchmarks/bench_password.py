@@ -0,0 +1,130 @@
+"""Login storm: login throughput and chatbot latency with hashing inline vs in the password pool.
+
+Starts the app (threaded dev server, users in mongomock) once per mode,
+then runs --chat-clients sending /chatbot/extract_symptoms/next back to
+back, alone and again alongside --login-clients hammering /api/login.
+
+Run from flask-backend/:
+    python benchmarks/bench_password.py --login-clients 50 --chat-clients 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from load_test import build_request, client, percentile, wait_until_ready  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+USERS = 100
+
+
+def serve(port):
+    # Stand-in database, patched in before the routes bind their collections.
+    sys.path.insert(0, BACKEND_DIR)
+    import mongomock
+    import dbConnect
+    dbConnect.db = mongomock.MongoClient()["remedi"]
+    dbConnect.users_collection = dbConnect.db["users"]
+    from werkzeug.security import generate_password_hash
+    import passwords
+    stored = generate_password_hash(PASSWORD, method=passwords.PASSWORD_HASH_METHOD)
+    dbConnect.users_collection.insert_many([
+        {"email": f"user{i}@example.com", "password": stored, "name": "Bench", "age": 30, "gender": "x"}
+        for i in range(USERS)
+    ])
+    import app
+    app.app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def login_request(url, i):
+    body = json.dumps({"email": f"user{i % USERS}@example.com", "password": PASSWORD}).encode()
+    host = url.split("//", 1)[1]
+    return (f"POST /api/login HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+def summarize(stats, elapsed):
+    latencies = stats["latencies"]
+    return {
+        "requests": len(latencies),
+        "ok_per_s": stats["status"].get(200, 0) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "status": {str(k): v for k, v in sorted(stats["status"].items())},
+        "connection_errors": stats["errors"],
+    }
+
+
+async def run_phase(url, chat_request, chat_clients, login_clients, duration):
+    host, port = url.split("//", 1)[1].split(":")
+    chat = {"latencies": [], "status": {}, "errors": 0}
+    login = {"latencies": [], "status": {}, "errors": 0}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client(host, int(port), chat_request, deadline, chat) for _ in range(chat_clients)),
+        *(client(host, int(port), login_request(url, i), deadline, login) for i in range(login_clients)),
+    )
+    elapsed = time.perf_counter() - started
+    return summarize(chat, elapsed), summarize(login, elapsed) if login_clients else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--login-clients", type=int, default=50)
+    parser.add_argument("--chat-clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(16))
+    sys.path.insert(0, BACKEND_DIR)
+    from utils import generate_jwt
+    url = f"http://127.0.0.1:{args.port}"
+    chat_request = build_request(url, "next", generate_jwt("000000000000000000000000", "bench@example.com"))
+
+    results = {}
+    print(f"{'mode':<8} {'phase':<12} {'chat p50 ms':>12} {'chat p99 ms':>12} {'chat ok/s':>10}"
+          f" {'logins ok/s':>12} {'login p99 ms':>13} {'login 503':>10}")
+    for mode, offload in (("inline", "0"), ("pool", "1")):
+        env = dict(os.environ, PASSWORD_HASH_OFFLOAD=offload, CHAT_SESSION_PERSIST="0",
+                   BLOB_GC="0", MONGO_ENSURE_INDEXES="0")
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(args.port)],
+                                  cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  start_new_session=True)
+        try:
+            wait_until_ready(url, timeout=120)
+            asyncio.run(run_phase(url, chat_request, 1, 1, 2.0))  # loads the artifacts, starts the pool processes
+            results[mode] = {}
+            for phase, logins in (("chat only", 0), ("login storm", args.login_clients)):
+                chat, login = asyncio.run(run_phase(url, chat_request, args.chat_clients, logins, args.duration))
+                results[mode][phase] = {"chat": chat, "login": login}
+                login = login or {"ok_per_s": 0.0, "p99_ms": 0.0, "status": {}}
+                print(f"{mode:<8} {phase:<12} {chat['p50_ms']:>12.1f} {chat['p99_ms']:>12.1f} {chat['ok_per_s']:>10.1f}"
+                      f" {login['ok_per_s']:>12.1f} {login['p99_ms']:>13.1f} {login['status'].get('503', 0):>10}")
+        finally:
+            # The whole group: forked pool workers would otherwise keep the port.
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=30)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
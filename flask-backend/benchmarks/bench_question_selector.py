@@ -0,0 +1,168 @@
+"""Offline simulation: questions to diagnosis, accuracy and per-step latency of the MI vs info-gain selectors.
+
+There is no labelled conversation data, so patients are simulated from the
+forest in two ways:
+
+- ``likelihoods``: pick a disease and draw each symptom independently from
+  the forest's own P(symptom | disease) estimates (``symptom_likelihoods``
+  with no smoothing). These are the same estimates the info-gain posterior
+  is built on (smoothed there), so its accuracy on them is an upper bound.
+- ``forest``: pick a disease and a tree and walk it from the root, taking
+  each branch with the disease's share of the node's samples that went
+  there; splits taken to the right are the patient's symptoms. This keeps
+  the symptom correlations the independent estimates lose. Symptoms the
+  path never tests count as absent, so these patients report fewer
+  symptoms than real ones.
+
+Each conversation opens with --initial of the present symptoms (what the
+user confirms after /extract_symptoms/initial) and every question is
+answered truthfully, except for a --flip fraction of answers. The
+diagnosis is what the app would return at the end: ``predict`` on the
+confirmed symptoms for MI, the top class of the selector's posterior for
+info gain.
+
+Run from flask-backend/:  python benchmarks/bench_question_selector.py --patients 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot import sym_utils as s  # noqa: E402
+from chatbot.info_gain import InfoGainSelector, left_shares, symptom_likelihoods  # noqa: E402
+from chatbot.prediction_cache import top_classes  # noqa: E402
+
+MAX_TURNS = 40
+
+
+def likelihood_symptoms(forest, rng):
+    profile = symptom_likelihoods(forest, prior_strength=1e-6, noise=0.0)
+    while True:
+        disease = int(rng.integers(forest.classes.size))
+        yield disease, np.flatnonzero(rng.random(forest.n_features) < profile[disease])
+
+
+def forest_symptoms(forest, rng):
+    left, right = forest.children[0::2], forest.children[1::2]
+    share, proba = left_shares(forest), forest.leaf_proba
+    while True:
+        disease = int(rng.integers(forest.classes.size))
+        node = int(rng.choice(forest.roots))
+        if proba[node, disease] == 0:  # not in this tree's bootstrap sample
+            continue
+        present = []
+        while left[node] != node:
+            p_left = share[node] * proba[left[node], disease] / proba[node, disease]
+            if rng.random() < p_left:
+                node = left[node]
+            else:
+                present.append(forest.feature[node])
+                node = right[node]
+        yield disease, np.unique(present)
+
+
+SOURCES = {"likelihoods": likelihood_symptoms, "forest": forest_symptoms}
+
+
+def make_patients(forest, source, n, initial, seed):
+    rng = np.random.default_rng(seed)
+    patients = []
+    for disease, present in SOURCES[source](forest, rng):
+        if len(patients) == n:
+            break
+        if present.size < initial:
+            continue
+        opening = rng.choice(present, initial, replace=False)
+        patients.append((
+            str(forest.classes[disease]),
+            {forest.feature_names[i] for i in present},
+            [forest.feature_names[i] for i in opening],
+        ))
+    return patients
+
+
+def converse(select, diagnose, patient, flip, rng):
+    disease, present, opening = patient
+    state = {symptom: 1 for symptom in opening}
+    steps = []
+    for _ in range(MAX_TURNS):
+        confirmed = [k for k, v in state.items() if v == 1]
+        start = time.perf_counter()
+        question = select(confirmed, list(state))
+        steps.append(time.perf_counter() - start)
+        if question is None:
+            break
+        answer = int(question in present)
+        state[question] = 1 - answer if rng.random() < flip else answer
+    confirmed = [k for k, v in state.items() if v == 1]
+    denied = [k for k, v in state.items() if v == 0]
+    return len(state) - len(opening), diagnose(confirmed, denied) == disease, steps
+
+
+def run(name, source, select, diagnose, patients, flip, seed):
+    rng = np.random.default_rng(seed)
+    questions, correct, steps = [], [], []
+    for patient in patients:
+        asked, ok, times = converse(select, diagnose, patient, flip, rng)
+        questions.append(asked)
+        correct.append(ok)
+        steps.extend(times)
+    steps = np.array(steps) * 1e6
+    return {
+        "selector": name,
+        "patients": source,
+        "mean_questions": float(np.mean(questions)),
+        "p90_questions": float(np.percentile(questions, 90)),
+        "accuracy": float(np.mean(correct)),
+        "step_p50_us": float(np.percentile(steps, 50)),
+        "step_p99_us": float(np.percentile(steps, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--initial", type=int, default=2, help="present symptoms the conversation starts with")
+    parser.add_argument("--flip", type=float, default=0.0, help="fraction of answers given wrong")
+    parser.add_argument("--confidence", type=float, default=s.INFO_GAIN_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--source", choices=sorted(SOURCES), action="append",
+                        help="how patients are simulated (repeatable; default: both)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    forest = s.registry.get("forest")
+    engine = s.registry.get("mi_engine")
+    selector = InfoGainSelector.from_forest(forest, confidence=args.confidence, min_gain_bits=s.INFO_GAIN_MIN_BITS)
+
+    def mi_diagnosis(confirmed, denied):
+        return s.predict(confirmed)
+
+    def info_gain_diagnosis(confirmed, denied):
+        return top_classes(selector.classes, selector.posterior(confirmed, denied), 1)[0][0]
+
+    results = []
+    for source in args.source or ["likelihoods", "forest"]:
+        patients = make_patients(forest, source, args.patients, args.initial, args.seed)
+        results += [
+            run("mi", source, engine.next_best, mi_diagnosis, patients, args.flip, args.seed),
+            run("info_gain", source, selector.next_best, info_gain_diagnosis, patients, args.flip, args.seed),
+        ]
+    print(f"{'patients':<12} {'selector':<10} {'mean questions':>15} {'p90 questions':>14} {'accuracy':>9}"
+          f" {'step p50 (us)':>14} {'step p99 (us)':>14}")
+    for r in results:
+        print(f"{r['patients']:<12} {r['selector']:<10} {r['mean_questions']:>15.2f} {r['p90_questions']:>14.0f}"
+              f" {r['accuracy']:>9.3f} {r['step_p50_us']:>14.1f} {r['step_p99_us']:>14.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Recall@k vs latency for the semantic index backends against exact search.
+
+Uses the shipped description embeddings and synthetic clustered vocabularies
+(several description rows per symptom, like synonym expansion would add).
+
+Run from flask-backend/:  python benchmarks/bench_semantic_index.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from chatbot.semantic_index import build_index, normalize  # noqa: E402
+
+BACKENDS = ["exact", "float16", "int8", "ivf"]
+
+
+def shipped():
+    embeddings = np.load(os.path.join(BACKEND_DIR, "chatbot", "symptom_embeddings.npy"))
+    with open(os.path.join(BACKEND_DIR, "chatbot", "sym_desc.json")) as f:
+        labels = list(json.load(f).keys())
+    return embeddings, labels
+
+
+def synthetic(rows, dim, rows_per_symptom, rng):
+    # Topic clusters -> symptoms -> description rows, so neighbours are meaningful.
+    n_symptoms = max(1, rows // rows_per_symptom)
+    topics = normalize(rng.standard_normal((max(8, n_symptoms // 50), dim)).astype(np.float32))
+    symptoms = normalize(topics[rng.integers(0, len(topics), n_symptoms)]
+                         + 0.6 * normalize(rng.standard_normal((n_symptoms, dim)).astype(np.float32)))
+    owner = rng.integers(0, n_symptoms, rows)
+    embeddings = normalize(symptoms[owner] + 0.35 * normalize(rng.standard_normal((rows, dim)).astype(np.float32)))
+    return embeddings, [f"symptom_{i}" for i in owner]
+
+
+def queries_for(embeddings, n, rng):
+    picks = embeddings[rng.integers(0, len(embeddings), n)]
+    return normalize(picks + 0.5 * normalize(rng.standard_normal(picks.shape).astype(np.float32)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[0, 10000, 50000], help="0 = shipped embeddings")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--rows-per-symptom", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'rows':>7} {'backend':<8} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall@k':>9} {'MB':>7}")
+    for rows in args.rows:
+        embeddings, labels = shipped() if rows == 0 else synthetic(rows, args.dim, args.rows_per_symptom, rng)
+        queries = queries_for(embeddings, args.queries, rng)
+        truth = None
+        for backend in BACKENDS:
+            start = time.perf_counter()
+            index = build_index(backend, embeddings, labels)
+            build_s = time.perf_counter() - start
+
+            results, samples = [], []
+            for q in queries:
+                start = time.perf_counter()
+                results.append(index.search(q, args.top_k))
+                samples.append(time.perf_counter() - start)
+            if truth is None:
+                truth = results
+            recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])
+            samples = np.array(samples) * 1e3
+            print(f"{len(embeddings):>7} {backend:<8} {build_s:>8.2f} {np.percentile(samples, 50):>8.3f}"
+                  f" {np.percentile(samples, 99):>8.3f} {recall:>9.3f} {index.vectors.nbytes / 2**20:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
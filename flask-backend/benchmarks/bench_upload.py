@@ -0,0 +1,138 @@
+"""Prescription upload ingest: the old parse/save/re-hash path vs single-pass streaming.
+
+Each (mode, size) runs in a fresh process so peak RSS is its own. The
+multipart body is streamed from a file on disk, as a WSGI server would hand
+it over, and the file is written to a temp upload directory.
+
+Run from flask-backend/:
+    python benchmarks/bench_upload.py
+    python benchmarks/bench_upload.py --fsync     # include the fsync before rename
+"""
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import resource
+import secrets
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024 - 1024]
+BOUNDARY = "----remedi-bench-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def write_body(path, size):
+    with open(path, "wb") as f:
+        f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="scan.pdf"\r\n'
+                "Content-Type: application/pdf\r\n\r\n".encode())
+        f.write(b"%PDF-")
+        remaining = size - 5
+        while remaining > 0:
+            n = min(remaining, 64 * 1024)
+            f.write(secrets.token_bytes(n))
+            remaining -= n
+        f.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+
+
+def legacy_upload(request, out_dir):
+    # What routes/prescription.py did before: werkzeug parses the whole body
+    # into a spooled temp file, the route seeks to measure it, saves it, then
+    # reopens the saved copy and hashes it in 4 KB reads.
+    file = request.files["file"]
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    path = os.path.join(out_dir, secrets.token_urlsafe(16) + ".pdf")
+    file.save(path)
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(4096), b""):
+            sha256.update(block)
+    return size, sha256.hexdigest()
+
+
+def streaming_upload(request, out_dir):
+    from storage import UPLOAD_FSYNC, IngestWriter, ingest_multipart
+
+    stored = ingest_multipart(
+        request.stream, request.content_type, field="file", allowed_extensions={".pdf"},
+        open_writer=lambda ext: IngestWriter(ext, 10 * 1024 * 1024, directory=out_dir),
+    )
+    if UPLOAD_FSYNC:
+        with open(stored.path, "rb") as f:
+            os.fsync(f.fileno())
+    os.replace(stored.path, os.path.join(out_dir, stored.sha256))
+    return stored.size, stored.sha256
+
+
+def run_case(mode, size, repeat, fsync, results):
+    os.environ["UPLOAD_FSYNC"] = "1" if fsync else "0"
+    sys.path.insert(0, BACKEND_DIR)
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+
+    upload = legacy_upload if mode == "legacy" else streaming_upload
+    workdir = tempfile.mkdtemp(prefix="bench-upload-")
+    body = os.path.join(workdir, "body")
+    write_body(body, size)
+    length = os.path.getsize(body)
+    out_dir = os.path.join(workdir, "out")
+    os.makedirs(out_dir)
+
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    try:
+        for _ in range(repeat):
+            with open(body, "rb") as f:
+                environ = EnvironBuilder(method="POST", input_stream=f, content_type=CONTENT_TYPE,
+                                         content_length=length).get_environ()
+                start = time.perf_counter()
+                stored_size, _ = upload(Request(environ), out_dir)
+                times.append(time.perf_counter() - start)
+            assert stored_size == size
+            for name in os.listdir(out_dir):
+                os.remove(os.path.join(out_dir, name))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times.sort()
+    median = times[len(times) // 2]
+    results.put({
+        "mode": mode, "size": size, "median_ms": median * 1000,
+        "mb_per_s": size / median / 1e6, "peak_rss_growth_kb": peak_rss - base_rss,
+    })
+
+
+def human(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.0f} GB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--fsync", action="store_true")
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    print(f"{'size':>8} {'mode':<10} {'median ms':>10} {'MB/s':>9} {'peak RSS +KB':>13}")
+    for size in SIZES:
+        for mode in ("legacy", "streaming"):
+            results = ctx.Queue()
+            proc = ctx.Process(target=run_case, args=(mode, size, args.repeat, args.fsync, results))
+            proc.start()
+            r = results.get()
+            proc.join()
+            print(f"{human(size):>8} {mode:<10} {r['median_ms']:>10.2f} {r['mb_per_s']:>9.1f} {r['peak_rss_growth_kb']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Per-worker memory with and without the memory-mapped artifact bundle.
+
+Starts N fresh worker processes per mode. Each one loads the chatbot's
+numeric artifacts, touches every page, and reports RSS, PSS and USS while
+all its siblings are still alive. PSS and USS show how much memory really
+belongs to one worker; shared, memory-mapped pages only count once.
+
+Run from flask-backend/ (build the bundle first with `python -m chatbot.bundle build`):
+    python benchmarks/bench_worker_memory.py --workers 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACTS = ["mi_engine", "forest", "desc_embeddings"]
+
+
+def memory_kb():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def worker(bundle_dir, barrier, results):
+    os.environ["ARTIFACT_BUNDLE_DIR"] = bundle_dir
+    sys.path.insert(0, BACKEND_DIR)
+    import numpy as np
+    from chatbot import sym_utils as s
+
+    baseline = memory_kb()
+    names = list(ARTIFACTS)
+    try:
+        import torch  # noqa: F401
+        names.append("desc_embeddings_tensor")
+    except ImportError:
+        pass
+    s.registry.warm_up(names)
+
+    # Touch every page, as serving would.
+    float(np.asarray(s.registry.get("desc_embeddings"), dtype=np.float32).sum())
+    float(s.registry.get("mi_engine").matrix.sum())
+    s.predict(["itching", "skin_rash"])
+    forest = s.registry.get("forest")
+    float(forest.leaf_proba.sum())
+
+    barrier.wait()
+    loaded = memory_kb()
+    results.put({
+        "bundle": s.registry.get("bundle") is not None,
+        **{f"{k}_delta": loaded[k] - baseline[k] for k in loaded},
+        **loaded,
+    })
+    barrier.wait()
+
+
+def run(mode, bundle_dir, workers):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(bundle_dir, barrier, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    avg = {k: sum(r[k] for r in rows) / len(rows) for k in rows[0] if k != "bundle"}
+    used = all(r["bundle"] for r in rows)
+    print(f"{mode:<8} bundle={'yes' if used else 'no ':<4}"
+          f" rss={avg['rss'] / 1024:7.1f} MB  pss={avg['pss'] / 1024:7.1f} MB  uss={avg['uss'] / 1024:7.1f} MB"
+          f"  | artifacts: rss +{avg['rss_delta'] / 1024:6.1f} MB  pss +{avg['pss_delta'] / 1024:6.1f} MB"
+          f"  uss +{avg['uss_delta'] / 1024:6.1f} MB")
+
+
+def main():
+    from chatbot.bundle import DEFAULT_BUNDLE_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--bundle-dir", default=DEFAULT_BUNDLE_DIR)
+    args = parser.parse_args()
+
+    print(f"per-worker averages over {args.workers} concurrent workers")
+    run("files", "", args.workers)
+    run("bundle", args.bundle_dir, args.workers)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, BACKEND_DIR)
+    main()
@@ -0,0 +1,202 @@
+"""Load test: the WSGI dev server (python app.py) vs the ASGI entry point (python asgi.py).
+
+Starts each server in turn, then holds N keep-alive connections open, each
+sending requests back to back for --duration seconds, and reports
+throughput, latency percentiles and errors per concurrency level.
+
+The default endpoint, /chatbot/extract_symptoms/next, exercises auth, the MI
+engine and forest prediction without needing the sentence encoder;
+--endpoint initial adds the encoder path.
+
+Run from flask-backend/:
+    python benchmarks/load_test.py --servers wsgi,asgi --clients 50,200,1000
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --clients 50   # already running
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import secrets
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py's dev server has a fixed port, so start it the same way on PORT.
+SERVERS = {
+    "wsgi": [sys.executable, "-c",
+             "import os, app; app.app.run(host='127.0.0.1', port=int(os.environ['PORT']), threaded=True)"],
+    "asgi": [sys.executable, "asgi.py"],
+}
+
+ENDPOINTS = {
+    "next": ("POST", "/chatbot/extract_symptoms/next",
+             {"symptom_state": {"itching": 1, "skin_rash": 1, "nodal_skin_eruptions": 0}}),
+    "initial": ("POST", "/chatbot/extract_symptoms/initial",
+                {"text": "I have itching and a rash on my skin"}),
+    "health": ("GET", "/", None),
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed")
+    status = int(status_line.split()[1])
+    length, close = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "connection" and value.strip().lower() == "close":
+            close = True
+    if length:
+        await reader.readexactly(length)
+    return status, close
+
+
+async def client(host, port, request, deadline, stats):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, close = await read_response(reader)
+            stats["latencies"].append(time.perf_counter() - start)
+            stats["status"][status] = stats["status"].get(status, 0) + 1
+            if close:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError):
+            stats["errors"] += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.05)
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(url, request, clients, duration):
+    parts = urlsplit(url)
+    stats = {"latencies": [], "status": {}, "errors": 0}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(client(parts.hostname, parts.port or 80, request, deadline, stats) for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+
+    latencies = stats["latencies"]
+    ok = sum(n for code, n in stats["status"].items() if code < 400)
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "ok": ok,
+        "rps": ok / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "status": {str(k): v for k, v in sorted(stats["status"].items())},
+        "connection_errors": stats["errors"],
+    }
+
+
+def build_request(url, endpoint, token):
+    method, path, body = ENDPOINTS[endpoint]
+    payload = json.dumps(body).encode() if body is not None else b""
+    host = urlsplit(url).netloc
+    lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"Authorization: Bearer {token}",
+             "Connection: keep-alive"]
+    if body is not None:
+        lines += ["Content-Type: application/json", f"Content-Length: {len(payload)}"]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + payload
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"server at {url} did not become ready within {timeout}s")
+
+
+def report(name, rows):
+    print(f"\n{name}")
+    print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ok':>8} {'non-2xx':>8} {'conn err':>9}")
+    for r in rows:
+        bad = r["requests"] - r["ok"]
+        print(f"{r['clients']:>8} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+              f" {r['ok']:>8} {bad:>8} {r['connection_errors']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="wsgi,asgi", help="comma-separated: wsgi, asgi")
+    parser.add_argument("--url", help="test an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--clients", default="50,200,1000")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="next")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # One socket per client on each side.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, 8192)), hard))
+
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(16))
+    sys.path.insert(0, BACKEND_DIR)
+    from utils import generate_jwt
+    token = generate_jwt("000000000000000000000000", "loadtest@example.com")
+    levels = [int(c) for c in args.clients.split(",")]
+
+    targets = [("external", args.url, None)] if args.url else [
+        (name, f"http://127.0.0.1:{args.port}", SERVERS[name]) for name in args.servers.split(",")
+    ]
+    results = {}
+    for name, url, command in targets:
+        server = None
+        if command:
+            env = dict(os.environ, PORT=str(args.port), HOST="127.0.0.1", CHAT_SESSION_PERSIST="0")
+            server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(url, timeout=120)
+            request = build_request(url, args.endpoint, token)
+            asyncio.run(run_level(url, request, 1, 2.0))  # loads the artifacts the endpoint needs
+            results[name] = [asyncio.run(run_level(url, request, c, args.duration)) for c in levels]
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+        report(f"{name} ({args.endpoint})", results[name])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"endpoint": args.endpoint, "duration": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Startup profile: app import time, slowest imports and per-artifact load times.
+
+Run from flask-backend/:  python benchmarks/startup_profile.py [--skip-warmup] [--json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+imported = time.perf_counter() - t0
+registry = app.chatbot_routes.s.registry
+t1 = time.perf_counter()
+if not {skip_warmup}:
+    registry.warm_up()
+print(json.dumps({{
+    "import_seconds": imported,
+    "warmup_seconds": None if {skip_warmup} else time.perf_counter() - t1,
+    "artifacts": registry.report(),
+}}))
+"""
+
+
+def parse_importtime(stderr, top):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), module.rstrip()))
+    # Nested imports are indented by two extra spaces per level; only the
+    # top-level ones are independent costs.
+    top_level = [(us, m.strip()) for us, m in rows if not m.startswith("   ")]
+    return sorted(top_level, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--skip-warmup", action="store_true", help="only measure the import")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    env = dict(os.environ, WARMUP_MODELS="0")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(skip_warmup=args.skip_warmup)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(proc.returncode)
+
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report["process_seconds"] = wall
+    report["slowest_imports"] = [
+        {"module": m, "cumulative_ms": us / 1000} for us, m in parse_importtime(proc.stderr, args.top)
+    ]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"app import: {report['import_seconds'] * 1000:.0f} ms (process total {wall:.2f} s)")
+    print("slowest top-level imports:")
+    for row in report["slowest_imports"]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    if report["warmup_seconds"] is not None:
+        print(f"artifact warm-up: {report['warmup_seconds']:.2f} s")
+        for name, info in sorted(report["artifacts"].items(), key=lambda kv: -(kv[1]["seconds"] or 0)):
+            status = f"{info['seconds']:.3f} s" if info["loaded"] else f"not loaded ({' '.join(info.get('error', '').split())[:60]})"
+            print(f"  {name:<24} {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""Benchmark suite: micro, endpoint, conversation and startup timings as one JSON report.
+
+Groups (select with --only):
+- micro: clean_text, hybrid_symptom_match (cold and cached),
+  find_next_best_symptom, forest prediction (single and batched)
+- endpoint: /chatbot/extract_symptoms/initial, /chatbot/extract_symptoms/next,
+  /api/login and /upload/prescription through the Flask test client, with
+  MongoDB replaced by mongomock and uploads going to a temp directory
+- conversation: simulated diagnoses through the session endpoints. Each
+  patient is a random set of the forest's own features; the conversation
+  starts from two of them and answers every question from the set
+- startup: app import and artifact warm-up, in a fresh process
+
+When the sentence transformer isn't installed (or with --encoder stub) a
+deterministic hash encoder stands in for it, so the rest of the matching
+path is still measured; the report records which one ran, and comparing
+reports made with different encoders is refused.
+
+Run from flask-backend/:
+    python benchmarks/suite.py --out results.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json   # exits 1 on a regression
+    python benchmarks/suite.py --only micro --scale 0.2              # quick check
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+GROUPS = ("micro", "endpoint", "conversation", "startup")
+PASSWORD = "correct horse battery staple"
+FILLER = ["i", "have", "been", "having", "really", "bad", "and", "some", "since", "yesterday", "also", "a", "lot", "of"]
+MAX_TURNS = 40
+
+# Metric suffixes, and which way is better, for the baseline comparison.
+LOWER_IS_BETTER = ("_us", "_ms", "_seconds")
+HIGHER_IS_BETTER = ("_per_s", "_rate")
+
+
+# ---------------- Timing ----------------
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def measure(fn, inputs, iterations, warmup=10):
+    """Latency of ``fn(x)`` cycling through ``inputs``."""
+    for i in range(min(warmup, iterations)):
+        fn(inputs[i % len(inputs)])
+    times = []
+    for i in range(iterations):
+        x = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - start)
+    return {
+        "iterations": iterations,
+        "p50_us": percentile(times, 0.50) * 1e6,
+        "p99_us": percentile(times, 0.99) * 1e6,
+        "mean_us": sum(times) / len(times) * 1e6,
+        "ops_per_s": len(times) / sum(times),
+    }
+
+
+def n(base, scale):
+    return max(5, int(base * scale))
+
+
+# ---------------- Fixtures ----------------
+
+def use_stub_encoder(s):
+    dim = s.registry.get("desc_embeddings").shape[1]
+
+    class HashEncoder:
+        def encode(self, texts, convert_to_numpy=True):
+            rows = []
+            for text in texts:
+                v = np.random.default_rng(zlib.crc32(text.encode())).standard_normal(dim).astype(np.float32)
+                rows.append(v / np.linalg.norm(v))
+            return np.stack(rows)
+
+    s.registry.register("model", HashEncoder)
+    s.registry.invalidate("model", "encoder")
+
+
+def pick_encoder(s, choice):
+    if choice == "stub":
+        use_stub_encoder(s)
+        return "stub"
+    try:
+        s.registry.get("model")
+        return s.MODEL_NAME
+    except Exception:
+        if choice == "real":
+            raise
+        use_stub_encoder(s)
+        return "stub"
+
+
+def messages(s, rng, count):
+    names = s.registry.get("symptom_names")
+    out = []
+    for _ in range(count):
+        words = [w for name in rng.sample(names, rng.randint(1, 3)) for w in name.replace("_", " ").split()]
+        words += rng.sample(FILLER, 6)
+        rng.shuffle(words)
+        out.append(" ".join(words))
+    return out
+
+
+def symptom_sets(features, rng, count, low=1, high=6):
+    return [rng.sample(features, rng.randint(low, high)) for _ in range(count)]
+
+
+def make_app(workdir):
+    """The real app, with MongoDB swapped for mongomock before the routes bind it."""
+    os.environ.update({
+        "CHAT_SESSION_PERSIST": "0", "WARMUP_MODELS": "0", "BLOB_GC": "0",
+        "MONGO_ENSURE_INDEXES": "0", "OCR_WORKER_IN_APP": "0",
+    })
+    os.environ.setdefault("JWT_SECRET", secrets.token_hex(32))
+    import mongomock
+    import dbConnect
+    dbConnect.db = mongomock.MongoClient()["remedi"]
+    dbConnect.users_collection = dbConnect.db["users"]
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # the upload directory is relative to the working directory
+    try:
+        import app
+    finally:
+        os.chdir(cwd)
+    from routes import prescription
+    from storage import BlobStore
+    prescription.blob_store = BlobStore(os.path.join(workdir, "blobs"), dbConnect.db["blobs"])
+
+    from werkzeug.security import generate_password_hash
+    import passwords
+    from utils import generate_jwt
+    stored = generate_password_hash(PASSWORD, method=passwords.PASSWORD_HASH_METHOD)
+    user_id = dbConnect.users_collection.insert_one(
+        {"email": "bench@example.com", "password": stored, "name": "Bench", "age": 30, "gender": "x"}
+    ).inserted_id
+    headers = {"Authorization": f"Bearer {generate_jwt(user_id, 'bench@example.com')}"}
+    return app.app.test_client(), headers
+
+
+# ---------------- Groups ----------------
+
+def bench_micro(s, rng, scale):
+    forest = s.registry.get("forest")
+    features = list(forest.feature_names)
+    texts = messages(s, rng, 200)
+    mi_symptoms = list(s.registry.get("mi_engine").symptoms)
+    states = []
+    for confirmed in symptom_sets(mi_symptoms, rng, 200):
+        denied = rng.sample(mi_symptoms, rng.randint(0, 5))
+        states.append(({sym: 1 for sym in confirmed}, confirmed + denied))
+    singles = symptom_sets(features, rng, 200)
+    batches = [symptom_sets(features, rng, 256) for _ in range(4)]
+
+    def cold_match(text):
+        s.match_cache.clear()
+        s.hybrid_symptom_match(text, top_k=5)
+
+    def cold_predict(symptoms):
+        s.prediction_cache.clear()
+        s.predict(symptoms)
+
+    return {
+        "micro.clean_text": measure(s.clean_text, texts, n(20000, scale)),
+        "micro.hybrid_symptom_match.cold": measure(cold_match, texts, n(500, scale)),
+        "micro.hybrid_symptom_match.cached": measure(lambda t: s.hybrid_symptom_match(t, top_k=5), texts, n(20000, scale),
+                                                     warmup=len(texts)),
+        "micro.find_next_best_symptom": measure(lambda st: s.find_next_best_symptom(*st), states, n(5000, scale)),
+        "micro.forest_predict": measure(cold_predict, singles, n(5000, scale)),
+        "micro.forest_predict.cached": measure(s.predict, singles, n(20000, scale), warmup=len(singles)),
+        "micro.forest_predict_batch_256": measure(s.predict_batch, batches, n(200, scale)),
+    }
+
+
+def bench_endpoints(s, rng, scale, client, headers):
+    texts = messages(s, rng, 200)
+    mi_symptoms = list(s.registry.get("mi_engine").symptoms)
+    states = [{sym: rng.randint(0, 1) for sym in group} for group in symptom_sets(mi_symptoms, rng, 200, 2, 8)]
+    png = b"\x89PNG\r\n\x1a\n" + os.urandom(100 * 1024)
+    uploads = itertools.count()
+
+    def call(method, path, expect, **kwargs):
+        response = client.open(path, method=method, headers=headers, **kwargs)
+        if response.status_code != expect:
+            raise RuntimeError(f"{method} {path}: {response.status_code} {response.get_data(as_text=True)[:200]}")
+
+    def upload(_):
+        # Distinct bytes per upload, so every call stores a new blob.
+        data = png[:-8] + next(uploads).to_bytes(8, "big")
+        call("POST", "/upload/prescription", 201, data={"file": (io.BytesIO(data), "scan.png")},
+             content_type="multipart/form-data")
+
+    login = {"email": "bench@example.com", "password": PASSWORD}
+    return {
+        "endpoint.extract_symptoms_initial": measure(
+            lambda t: call("POST", "/chatbot/extract_symptoms/initial", 200, json={"text": t}), texts, n(500, scale)),
+        "endpoint.extract_symptoms_next": measure(
+            lambda st: call("POST", "/chatbot/extract_symptoms/next", 200, json={"symptom_state": st}), states, n(2000, scale)),
+        "endpoint.login": measure(lambda body: call("POST", "/api/login", 200, json=body), [login], n(50, scale), warmup=2),
+        "endpoint.upload_prescription": measure(upload, [None], n(200, scale)),
+    }
+
+
+def bench_conversation(s, rng, scale, client, headers):
+    forest = s.registry.get("forest")
+    features = list(forest.feature_names)
+    patients = symptom_sets(features, rng, n(100, scale), 3, 7)
+    turn_times, totals, turns, agree = [], [], [], 0
+
+    for patient in patients:
+        truth = set(patient)
+        start = time.perf_counter()
+        t0 = time.perf_counter()
+        r = client.post("/chatbot/session", headers=headers, json={"answers": {sym: 1 for sym in patient[:2]}}).get_json()
+        turn_times.append(time.perf_counter() - t0)
+        session_id, count = r["session_id"], 1
+        while r.get("next_symptom") and count < MAX_TURNS:
+            symptom = r["next_symptom"]
+            t0 = time.perf_counter()
+            r = client.post(f"/chatbot/session/{session_id}/answer", headers=headers,
+                            json={"symptom": symptom, "present": int(symptom in truth)}).get_json()
+            turn_times.append(time.perf_counter() - t0)
+            count += 1
+        totals.append(time.perf_counter() - start)
+        turns.append(count)
+        if r.get("predicted_disease") is not None and r["predicted_disease"] == s.predict(patient):
+            agree += 1
+        client.delete(f"/chatbot/session/{session_id}", headers=headers)
+
+    return {
+        "conversation.diagnosis": {
+            "conversations": len(patients),
+            "turn_p50_us": percentile(turn_times, 0.50) * 1e6,
+            "turn_p99_us": percentile(turn_times, 0.99) * 1e6,
+            "conversation_p50_ms": percentile(totals, 0.50) * 1e3,
+            "conversation_p99_ms": percentile(totals, 0.99) * 1e3,
+            "mean_turns": sum(turns) / len(turns),
+            # How often the questions found enough to match a prediction from the full set.
+            "agreement_rate": agree / len(patients),
+        }
+    }
+
+
+def bench_startup():
+    from startup_profile import CHILD
+    env = dict(os.environ, WARMUP_MODELS="0", MONGO_ENSURE_INDEXES="0", BLOB_GC="0")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", CHILD.format(skip_warmup=False)],
+                          cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "startup": {
+            "import_seconds": report["import_seconds"],
+            "warmup_seconds": report["warmup_seconds"],
+            "process_seconds": wall,
+        }
+    }
+
+
+# ---------------- Report ----------------
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, tolerance):
+    """Rows of (case, metric, baseline, current, change, regressed)."""
+    rows = []
+    for case, metrics in current["results"].items():
+        base = baseline["results"].get(case)
+        if not base:
+            continue
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if metric.endswith(LOWER_IS_BETTER):
+                regressed = change > tolerance
+            elif metric.endswith(HIGHER_IS_BETTER):
+                regressed = change < -tolerance
+            else:
+                continue
+            # Tail latencies are reported but too noisy on shared machines to fail a run.
+            regressed = regressed and "p99" not in metric
+            rows.append((case, metric, old, value, change, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated groups: {', '.join(GROUPS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every iteration count")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--encoder", choices=("auto", "real", "stub"), default="auto")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="compare against this report")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging, e.g. 0.25 = 25%%")
+    parser.add_argument("--save-baseline", metavar="PATH", help="also write the report as the new baseline")
+    args = parser.parse_args()
+
+    groups = [g for g in args.only.split(",") if g]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    results = {}
+    encoder = None
+    try:
+        if set(groups) & {"micro", "endpoint", "conversation"}:
+            if "endpoint" in groups or "conversation" in groups:
+                client, headers = make_app(workdir)
+            from chatbot import sym_utils as s
+            encoder = pick_encoder(s, args.encoder)
+            s.registry.warm_up(("forest", "mi_engine", "keyword_matcher", "semantic_index", "encoder"))
+        for group in groups:
+            started = time.perf_counter()
+            if group == "micro":
+                results.update(bench_micro(s, rng, args.scale))
+            elif group == "endpoint":
+                results.update(bench_endpoints(s, rng, args.scale, client, headers))
+            elif group == "conversation":
+                results.update(bench_conversation(s, rng, args.scale, client, headers))
+            else:
+                results.update(bench_startup())
+            print(f"{group}: {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        import pools
+        pools.shutdown(wait=False)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "encoder": encoder,
+            "scale": args.scale,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        base_encoder = baseline.get("meta", {}).get("encoder")
+        if encoder and base_encoder and encoder != base_encoder:
+            raise SystemExit(f"baseline was measured with encoder {base_encoder}, this run with {encoder}")
+        rows = compare(report, baseline, args.tolerance)
+        print(f"\n{'case':<40} {'metric':<22} {'baseline':>12} {'current':>12} {'change':>8}", file=sys.stderr)
+        for case, metric, old, new, change, regressed in rows:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{case:<40} {metric:<22} {old:>12.1f} {new:>12.1f} {change:>+8.1%}{flag}", file=sys.stderr)
+        if any(row[-1] for row in rows):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
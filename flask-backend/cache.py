@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional, Tuple
+
+import metrics
+
+CACHE_REQUESTS = metrics.counter(
+    "remedi_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"),
+)
+CACHE_EVICTIONS = metrics.counter(
+    "remedi_cache_evictions_total", "Cache entries dropped by cache and reason.", ("cache", "reason"),
+)
+CACHE_BYTES = metrics.gauge("remedi_cache_bytes", "Approximate bytes held by each cache.", ("cache",))
+
+
+def approx_size(value: Any) -> int:
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes) + 128
+    if hasattr(value, "element_size") and hasattr(value, "numel"):
+        return int(value.element_size() * value.numel()) + 128
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approx_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def files_fingerprint(paths: Iterable[str]) -> Tuple:
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            fingerprint.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            fingerprint.append((path, None, None))
+    return tuple(fingerprint)
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by an approximate byte budget.
+
+    Entries optionally expire after ``ttl`` seconds. When ``watch_paths`` is
+    given the whole cache is dropped as soon as any of those files changes;
+    the files are re-stat'ed at most once every ``check_interval`` seconds.
+    ``on_files_changed`` is called first, outside the cache's lock, to drop
+    whatever the entries were computed from.
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl: Optional[float] = None,
+                 watch_paths: Iterable[str] = (), check_interval: float = 1.0,
+                 on_files_changed: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self.watch_paths = tuple(watch_paths)
+        self.check_interval = check_interval
+        self.on_files_changed = on_files_changed
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._fingerprint = files_fingerprint(self.watch_paths)
+        self._next_check = time.monotonic() + check_interval
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            changed = self._files_changed(now)
+        if changed:
+            if self.on_files_changed is not None:
+                self.on_files_changed()
+            self.clear("invalidated")
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl and now - entry[2] > self.ttl:
+                self._drop(key, "expired")
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS.inc(cache=self.name, result="miss")
+                return None
+            self._data.move_to_end(key)
+        CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None) -> None:
+        nbytes = approx_size(value) if nbytes is None else nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key, None)
+            self._data[key] = (value, nbytes, time.monotonic())
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)), "size")
+            CACHE_BYTES.set(self._bytes, cache=self.name)
+
+    def pop(self, key: Hashable, reason: str = "invalidated") -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key, reason)
+                CACHE_BYTES.set(self._bytes, cache=self.name)
+
+    def clear(self, reason: str = "cleared") -> None:
+        with self._lock:
+            self._clear(reason)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": CACHE_REQUESTS.value(cache=self.name, result="hit"),
+            "misses": CACHE_REQUESTS.value(cache=self.name, result="miss"),
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _files_changed(self, now: float) -> bool:
+        if not self.watch_paths or now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        fingerprint = files_fingerprint(self.watch_paths)
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+        return True
+
+    def _clear(self, reason: str) -> None:
+        if self._data:
+            CACHE_EVICTIONS.inc(len(self._data), cache=self.name, reason=reason)
+        self._data.clear()
+        self._bytes = 0
+        CACHE_BYTES.set(0, cache=self.name)
+
+    def _drop(self, key: Hashable, reason: Optional[str]) -> None:
+        _, nbytes, _ = self._data.pop(key)
+        self._bytes -= nbytes
+        if reason:
+            CACHE_EVICTIONS.inc(cache=self.name, reason=reason)
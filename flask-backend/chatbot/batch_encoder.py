@@ -0,0 +1,90 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+import metrics
+
+MAX_BATCH_SIZE = int(os.environ.get("ENCODER_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("ENCODER_MAX_WAIT_MS", "5"))
+
+BATCH_SIZE = metrics.histogram(
+    "remedi_encoder_batch_size", "Texts per batched encode call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_DELAY = metrics.histogram(
+    "remedi_encoder_queue_delay_seconds", "Time an encode request waited before its batch started.",
+)
+BATCH_SECONDS = metrics.histogram(
+    "remedi_encoder_batch_seconds", "Wall time of one batched encode call.",
+)
+
+
+class BatchingEncoder:
+    """Coalesces concurrent single-text encodes into batched model calls.
+
+    Callers block on ``encode``; a worker thread collects requests until
+    ``max_batch_size`` is reached or ``max_wait_ms`` has passed since the
+    first one arrived, runs ``encode_batch`` once and hands each caller its row.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], Sequence], max_batch_size: int = MAX_BATCH_SIZE,
+                 max_wait_ms: float = MAX_WAIT_MS):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def encode(self, text: str):
+        if self.max_batch_size == 1:
+            return self._run([text])[0]
+
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_worker(self) -> None:
+        # Started on first use so forked workers each get their own thread.
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name="batch-encoder", daemon=True)
+                self._worker.start()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                QUEUE_DELAY.observe(started - enqueued)
+
+            try:
+                rows = self._run([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), row in zip(batch, rows):
+                future.set_result(row)
+
+    def _run(self, texts: List[str]):
+        started = time.perf_counter()
+        rows = self.encode_batch(texts)
+        BATCH_SECONDS.observe(time.perf_counter() - started)
+        BATCH_SIZE.observe(len(texts))
+        return rows
@@ -0,0 +1,206 @@
+"""Versioned, memory-mappable bundle of the chatbot's numeric artifacts.
+
+A bundle is a directory of plain ``.npy`` files plus ``manifest.json``::
+
+    manifest.json         version, string tables, per-array dtype/shape/sha256,
+                          and hashes of the source files it was built from
+    mi.npy                float32 MI matrix (rows/cols = manifest["mi_symptoms"])
+    embeddings.npy        float32 or float16 description embeddings, one row per
+                          description (labels = manifest["embedding_symptoms"],
+                          made by manifest["embedding_encoder"])
+    forest_<name>.npy     FlatForest node arrays
+
+Workers open the arrays with ``np.load(mmap_mode="r")`` so the OS shares the
+pages between processes instead of every worker holding its own copy.
+
+Build from flask-backend/:  python -m chatbot.bundle build [--embedding-dtype float16]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chatbot.encoders import BACKENDS
+from chatbot.forest import FOREST_ARRAYS, FlatForest
+from chatbot.semantic_index import description_rows
+
+log = logging.getLogger(__name__)
+
+BUNDLE_VERSION = 1
+BASE_DIR = os.path.dirname(__file__)
+DEFAULT_BUNDLE_DIR = os.path.join(BASE_DIR, "artifacts", f"bundle-v{BUNDLE_VERSION}")
+
+SOURCE_FILES = {
+    "rf_model": os.path.join(BASE_DIR, "random_forest_model.joblib"),
+    "mi_matrix": os.path.join(BASE_DIR, "mi_matrix.csv"),
+    "embeddings": os.path.join(BASE_DIR, "symptom_embeddings.npy"),
+    "descriptions": os.path.join(BASE_DIR, "sym_desc.json"),
+}
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def source_hashes(sources: Dict[str, str] = SOURCE_FILES) -> Dict[str, str]:
+    return {name: file_sha256(path) for name, path in sources.items() if os.path.exists(path)}
+
+
+class ArtifactBundle:
+    def __init__(self, path: str, manifest: dict, arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @property
+    def mi_symptoms(self) -> List[str]:
+        return self.manifest["mi_symptoms"]
+
+    @property
+    def embedding_symptoms(self) -> List[str]:
+        return self.manifest["embedding_symptoms"]
+
+    @property
+    def embedding_encoder(self) -> str:
+        # Bundles from before per-backend embeddings hold the shipped mpnet ones.
+        return self.manifest.get("embedding_encoder", BACKENDS["mpnet"].version)
+
+    @property
+    def mi(self) -> np.ndarray:
+        return self.arrays["mi"]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self.arrays["embeddings"]
+
+    def forest(self) -> FlatForest:
+        return FlatForest.from_arrays(
+            {name: self.arrays[f"forest_{name}"] for name in FOREST_ARRAYS},
+            classes=np.array(self.manifest["forest_classes"]),
+            feature_names=self.manifest["forest_feature_names"],
+        )
+
+    def verify(self) -> None:
+        for name, info in self.manifest["arrays"].items():
+            actual = file_sha256(os.path.join(self.path, info["file"]))
+            if actual != info["sha256"]:
+                raise ValueError(f"bundle array {name} checksum mismatch")
+
+
+def load_bundle(path: str = DEFAULT_BUNDLE_DIR, check_sources: bool = True) -> Optional[ArtifactBundle]:
+    """Memory-map a bundle, or return None if it is missing or stale."""
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != BUNDLE_VERSION:
+        log.warning("Ignoring artifact bundle %s: version %s != %s", path, manifest.get("version"), BUNDLE_VERSION)
+        return None
+    if check_sources and manifest.get("sources") != source_hashes():
+        log.warning("Ignoring artifact bundle %s: built from different source artifacts, rebuild it", path)
+        return None
+
+    arrays = {}
+    for name, info in manifest["arrays"].items():
+        array = np.load(os.path.join(path, info["file"]), mmap_mode="r", allow_pickle=False)
+        if list(array.shape) != info["shape"] or str(array.dtype) != info["dtype"]:
+            raise ValueError(f"bundle array {name} does not match its manifest entry")
+        arrays[name] = array
+    return ArtifactBundle(path, manifest, arrays)
+
+
+def write_bundle(path: str, arrays: Dict[str, np.ndarray], tables: dict, sources: Dict[str, str]) -> str:
+    """Write arrays + manifest to a temp dir and swap it into ``path``."""
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".bundle-", dir=parent)
+
+    manifest = {"version": BUNDLE_VERSION, "created": time.time(), "sources": sources, "arrays": {}, **tables}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        filename = f"{name}.npy"
+        np.save(os.path.join(staging, filename), array, allow_pickle=False)
+        manifest["arrays"][name] = {
+            "file": filename,
+            "dtype": str(array.dtype),
+            "shape": list(array.shape),
+            "sha256": file_sha256(os.path.join(staging, filename)),
+        }
+    with open(os.path.join(staging, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Readers keep their mappings of the old files; new readers see the new dir.
+    if os.path.exists(path):
+        old = path + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.rename(path, old)
+        os.rename(staging, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.rename(staging, path)
+    return path
+
+
+def build_from_sources(path: str = DEFAULT_BUNDLE_DIR, embedding_dtype: str = "float32") -> str:
+    import joblib
+    from chatbot.mi_engine import MIEngine
+
+    mi_engine = MIEngine.from_csv(SOURCE_FILES["mi_matrix"])
+    forest = FlatForest.from_sklearn(joblib.load(SOURCE_FILES["rf_model"]))
+    with open(SOURCE_FILES["descriptions"]) as f:
+        embedding_symptoms, _ = description_rows(json.load(f))
+    embeddings = np.load(SOURCE_FILES["embeddings"]).astype(embedding_dtype)
+
+    arrays = {"mi": mi_engine.matrix, "embeddings": embeddings}
+    arrays.update({f"forest_{name}": array for name, array in forest.arrays().items()})
+    tables = {
+        "mi_symptoms": mi_engine.symptoms,
+        "embedding_symptoms": embedding_symptoms,
+        "embedding_encoder": BACKENDS["mpnet"].version,
+        "forest_classes": [str(c) for c in forest.classes],
+        "forest_feature_names": forest.feature_names,
+    }
+    return write_bundle(path, arrays, tables, source_hashes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the chatbot artifact bundle.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the bundle from the shipped artifacts")
+    build.add_argument("--out", default=DEFAULT_BUNDLE_DIR)
+    build.add_argument("--embedding-dtype", choices=["float32", "float16"], default="float32")
+    info = sub.add_parser("info", help="print and verify a bundle's manifest")
+    info.add_argument("--path", default=DEFAULT_BUNDLE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Wrote {build_from_sources(args.out, args.embedding_dtype)}")
+    else:
+        bundle = load_bundle(args.path, check_sources=False)
+        if bundle is None:
+            raise SystemExit(f"No usable bundle at {args.path}")
+        bundle.verify()
+        for name, meta in bundle.manifest["arrays"].items():
+            print(f"{name:<22} {meta['dtype']:<8} {meta['shape']}")
+        print(f"version {bundle.version}, checksums OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Sentence-encoder backends and the description embeddings that go with them.
+
+ENCODER_BACKEND picks one of BACKENDS:
+
+    mpnet       all-mpnet-base-v2 in fp32, the model the shipped embeddings come from
+    mpnet-int8  the same weights with every Linear layer dynamically quantized
+                to int8 (weights stored int8, activations quantized per batch)
+    small       ENCODER_SMALL_MODEL, any sentence-transformers model name or local path
+
+Query and description embeddings are only comparable when they come from the
+same model, so every backend has its own embeddings file with a sidecar
+``.json`` recording the encoder and a hash of the description texts. A
+mismatch regenerates the file on load.
+
+ENCODER_THREADS sets torch's intra-op threads (0 leaves torch's default, one
+per core; with several workers per machine, cores / workers avoids
+oversubscription). ENCODER_MAX_SEQ_LENGTH, when set, caps query tokens:
+chat messages are short and attention cost grows with length (64 is
+plenty). Unset, queries get the model's own limit. Descriptions are always
+embedded at the model's full length, by a separate uncapped model instance.
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(__file__)
+# The shipped mpnet embeddings; other backends write theirs next to it.
+DEFAULT_EMBED_FILE = os.path.join(BASE_DIR, "symptom_embeddings.npy")
+
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "mpnet")
+ENCODER_SMALL_MODEL = os.environ.get("ENCODER_SMALL_MODEL", "all-MiniLM-L6-v2")
+ENCODER_THREADS = int(os.environ.get("ENCODER_THREADS", "0"))
+ENCODER_MAX_SEQ_LENGTH = int(os.environ.get("ENCODER_MAX_SEQ_LENGTH", "0"))
+
+
+@dataclass(frozen=True)
+class EncoderBackend:
+    name: str
+    model: str
+    quantize: bool = False
+
+    @property
+    def version(self) -> str:
+        """Identifies the embedding space; stored with every embeddings file."""
+        return f"{self.model}{'+int8' if self.quantize else ''}"
+
+    @property
+    def embeddings_path(self) -> str:
+        if self.name == "mpnet":
+            return DEFAULT_EMBED_FILE
+        return os.path.join(BASE_DIR, f"symptom_embeddings.{self.name}.npy")
+
+
+BACKENDS: Dict[str, EncoderBackend] = {
+    "mpnet": EncoderBackend("mpnet", "all-mpnet-base-v2"),
+    "mpnet-int8": EncoderBackend("mpnet-int8", "all-mpnet-base-v2", quantize=True),
+    "small": EncoderBackend("small", ENCODER_SMALL_MODEL),
+}
+
+
+def get_backend(name: str = ENCODER_BACKEND) -> EncoderBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"ENCODER_BACKEND must be one of {sorted(BACKENDS)}, not {name!r}") from None
+
+
+def load_model(backend: EncoderBackend, threads: int = ENCODER_THREADS,
+               max_seq_length: Optional[int] = ENCODER_MAX_SEQ_LENGTH):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(backend.model, device="cpu")
+    model.eval()
+    full_max_seq_length = model.max_seq_length
+    if max_seq_length:
+        model.max_seq_length = min(model.max_seq_length, max_seq_length)
+    if backend.quantize:
+        quantization = getattr(torch, "ao", torch).quantization
+        model = quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    # For encode_descriptions, which needs the full length.
+    model.encoder_backend = backend
+    model.full_max_seq_length = full_max_seq_length
+    return model
+
+
+# ---------------- Description Embeddings ----------------
+
+def texts_sha256(texts: Sequence[str]) -> str:
+    sha256 = hashlib.sha256()
+    for text in texts:
+        sha256.update(text.encode("utf-8"))
+        sha256.update(b"\0")
+    return sha256.hexdigest()
+
+
+def _sidecar(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def embeddings_meta(backend: EncoderBackend, texts: Sequence[str], shape) -> dict:
+    return {"encoder": backend.version, "texts_sha256": texts_sha256(texts), "shape": list(shape)}
+
+
+def load_embeddings(backend: EncoderBackend, texts: Sequence[str]) -> Optional[np.ndarray]:
+    """The stored embeddings of ``texts`` for ``backend``, or None if missing or stale."""
+    path = backend.embeddings_path
+    if not os.path.exists(path):
+        return None
+    embeddings = np.load(path)
+    sidecar = _sidecar(path)
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            meta = json.load(f)
+        if meta != embeddings_meta(backend, texts, embeddings.shape):
+            return None
+    elif backend.name != "mpnet" or embeddings.shape[0] != len(texts):
+        # Only the shipped mpnet file predates the sidecars.
+        return None
+    return embeddings
+
+
+def save_embeddings(backend: EncoderBackend, texts: Sequence[str], embeddings: np.ndarray) -> str:
+    path = backend.embeddings_path
+    np.save(path, embeddings)
+    with open(_sidecar(path), "w") as f:
+        json.dump(embeddings_meta(backend, texts, embeddings.shape), f, indent=2)
+    return path
+
+
+def encode_descriptions(model, texts: Sequence[str], batch_size: int = 64) -> np.ndarray:
+    """Embed ``texts`` at the model's full length.
+
+    A ``model`` loaded with a query cap is left alone, since queries may be
+    encoding on it concurrently; an uncapped instance does the work instead.
+    """
+    if model.max_seq_length < getattr(model, "full_max_seq_length", model.max_seq_length):
+        model = load_model(model.encoder_backend, max_seq_length=None)
+    return model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embed the symptom descriptions for an encoder backend.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=ENCODER_BACKEND)
+    parser.add_argument("--force", action="store_true", help="re-embed even if the stored embeddings are current")
+    args = parser.parse_args()
+
+    from chatbot.semantic_index import description_rows
+
+    backend = BACKENDS[args.backend]
+    with open(os.path.join(BASE_DIR, "sym_desc.json")) as f:
+        _, texts = description_rows(json.load(f))
+    if not args.force and load_embeddings(backend, texts) is not None:
+        print(f"{backend.embeddings_path} is current for {backend.version}")
+        return
+    embeddings = encode_descriptions(load_model(backend, max_seq_length=None), texts)
+    print(f"Wrote {save_embeddings(backend, texts, embeddings)} {embeddings.shape} for {backend.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import numpy as np
+from typing import Dict, Iterable, List, Sequence
+
+# Array names making up a flattened forest, in the order they are stored.
+FOREST_ARRAYS = ("feature", "threshold", "children", "leaf_proba", "roots")
+
+
+class FlatForest:
+    """A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    Every tree's nodes are concatenated; ``children[2 * i]`` / ``children[2 * i + 1]``
+    are node ``i``'s left/right child and leaves point at themselves, so a
+    batch is walked through all trees at once with one vectorized step per
+    level, dropping (row, tree) pairs as they reach a leaf.
+    ``leaf_proba`` holds each node's normalized class distribution, summed in
+    tree order exactly as sklearn's ``predict_proba`` does, so predictions
+    match ``rf_model.predict`` bit for bit.
+    """
+
+    def __init__(self, feature, threshold, children, leaf_proba, roots, classes, feature_names):
+        # No copies when the arrays already have these dtypes (e.g. memory-mapped).
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.children = np.ascontiguousarray(children, dtype=np.intp)
+        self.leaf_proba = np.ascontiguousarray(leaf_proba, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.classes = np.asarray(classes)
+        self.feature_names = [str(f) for f in feature_names]
+        self.feature_index: Dict[str, int] = {f: i for i, f in enumerate(self.feature_names)}
+
+    @classmethod
+    def from_sklearn(cls, rf_model) -> "FlatForest":
+        features, thresholds, children, probas, roots = [], [], [], [], []
+        offset = 0
+        for est in rf_model.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            ids = np.arange(offset, offset + n)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            left = np.where(is_leaf, ids, tree.children_left + offset)
+            right = np.where(is_leaf, ids, tree.children_right + offset)
+            children.append(np.stack([left, right], axis=1).ravel())
+
+            # Same normalization as DecisionTreeClassifier.predict_proba.
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            probas.append(proba / normalizer)
+
+            roots.append(offset)
+            offset += n
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(children),
+            np.concatenate(probas), np.array(roots),
+            rf_model.classes_, rf_model.feature_names_in_,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], classes, feature_names) -> "FlatForest":
+        return cls(*(arrays[name] for name in FOREST_ARRAYS), classes, feature_names)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in FOREST_ARRAYS}
+
+    @property
+    def n_features(self) -> int:
+        return len(self.feature_names)
+
+    # ---------------- Input Encoding ----------------
+    def encode(self, symptom_sets: Iterable[Iterable[str]]) -> np.ndarray:
+        symptom_sets = list(symptom_sets)
+        X = np.zeros((len(symptom_sets), self.n_features), dtype=np.float32)
+        for row, symptoms in enumerate(symptom_sets):
+            cols = [self.feature_index[s] for s in symptoms if s in self.feature_index]
+            X[row, cols] = 1.0
+        return X
+
+    def bitset(self, symptoms: Iterable[str]) -> int:
+        """The symptom set as an int with bit ``i`` set for feature ``i``; unknown symptoms are ignored."""
+        key = 0
+        for s in symptoms:
+            i = self.feature_index.get(s)
+            if i is not None:
+                key |= 1 << i
+        return key
+
+    def decode_bitsets(self, keys: Sequence[int]) -> np.ndarray:
+        """Rows of ``encode`` for bitsets made by ``bitset``."""
+        n_bytes = (self.n_features + 7) // 8
+        packed = np.frombuffer(b"".join(k.to_bytes(n_bytes, "little") for k in keys), dtype=np.uint8)
+        bits = np.unpackbits(packed.reshape(len(keys), n_bytes), axis=1, count=self.n_features, bitorder="little")
+        return bits.astype(np.float32)
+
+    # ---------------- Inference ----------------
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_trees = X.shape[0], self.roots.size
+        flat_x = X.ravel()
+
+        # One slot per (row, tree); slots drop out of the walk once they hit a leaf.
+        out = np.empty(n_rows * n_trees, dtype=np.intp)
+        slot = np.arange(n_rows * n_trees)
+        cur = np.tile(self.roots, n_rows)
+        x_base = np.repeat(np.arange(n_rows, dtype=np.intp) * X.shape[1], n_trees)
+        while slot.size:
+            go_right = flat_x[x_base + self.feature[cur]] > self.threshold[cur]
+            nxt = self.children[2 * cur + go_right]
+            done = nxt == cur
+            if done.any():
+                out[slot[done]] = cur[done]
+                keep = ~done
+                slot, nxt, x_base = slot[keep], nxt[keep], x_base[keep]
+            cur = nxt
+        return out.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float32)
+        if X.shape[0] > 1 and np.all((X == 0) | (X == 1)):
+            # Symptom bitsets repeat a lot; walk each distinct row once.
+            _, first, inverse = np.unique(np.packbits(X == 1, axis=1), axis=0, return_index=True, return_inverse=True)
+            if first.size < X.shape[0]:
+                return self._predict_proba(X[first])[inverse.ravel()]
+        return self._predict_proba(X)
+
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        node = self.leaves(X)
+        proba = np.zeros((node.shape[0], self.classes.size), dtype=np.float64)
+        for t in range(node.shape[1]):
+            proba += self.leaf_proba[node[:, t]]
+        proba /= node.shape[1]
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    def predict_symptoms(self, symptom_sets: Sequence[Iterable[str]]) -> List[str]:
+        return [str(c) for c in self.predict(self.encode(symptom_sets))]
@@ -0,0 +1,157 @@
+import numpy as np
+from typing import Dict, Iterable, Optional
+
+from chatbot.forest import FlatForest
+from chatbot.mi_engine import MAX_QUESTIONS
+
+# Pseudo-count (in trees' worth of a disease's samples) pulling sparse
+# P(symptom | disease) estimates towards the symptom's overall rate.
+LIKELIHOOD_PRIOR_STRENGTH = 0.1
+# Floor/ceiling on P(symptom | disease): a patient may answer against their
+# disease's profile, and one such answer must not rule the disease out.
+ANSWER_NOISE = 0.02
+
+
+def left_shares(forest: FlatForest) -> np.ndarray:
+    """Share of each internal node's samples sent to its left child (0 at leaves).
+
+    A node's class distribution is its children's mixed by that share, so
+    it is the least-squares fit of one to the other.
+    """
+    ids = np.arange(forest.feature.size)
+    left, right = forest.children[0::2], forest.children[1::2]
+    internal = left != ids
+    node, lnode, rnode = ids[internal], left[internal], right[internal]
+    proba = forest.leaf_proba
+
+    # proba[node] = share * proba[left] + (1 - share) * proba[right]
+    diff = proba[lnode] - proba[rnode]
+    share = np.einsum("ij,ij->i", proba[node] - proba[rnode], diff)
+    share = np.clip(share / np.maximum(np.einsum("ij,ij->i", diff, diff), 1e-300), 0.0, 1.0)
+    left_share = np.zeros(ids.size)
+    left_share[node] = share
+    return left_share
+
+
+def symptom_likelihoods(forest: FlatForest, prior_strength: float = LIKELIHOOD_PRIOR_STRENGTH,
+                        noise: float = ANSWER_NOISE) -> np.ndarray:
+    """(classes x features) P(symptom present | disease), read off the forest.
+
+    Every split on a symptom sends the samples that have it right, so the
+    share of a disease's samples going right estimates P(symptom | disease).
+    The flattened forest keeps each node's class distribution but not its
+    sample count; since a node's distribution is its children's mixed by
+    their share of its samples, that share is recovered by least squares and
+    multiplied down from the roots.
+    """
+    n_nodes = forest.feature.size
+    ids = np.arange(n_nodes)
+    left, right = forest.children[0::2], forest.children[1::2]
+    internal = left != ids
+    node, rnode = ids[internal], right[internal]
+    proba = forest.leaf_proba
+    left_share = left_shares(forest)
+
+    # Fraction of its tree's samples reaching each node, one level at a time.
+    reach = np.zeros(n_nodes)
+    reach[forest.roots] = 1.0
+    level = forest.roots
+    while level.size:
+        level = level[internal[level]]
+        reach[left[level]] = reach[level] * left_share[level]
+        reach[right[level]] = reach[level] * (1.0 - left_share[level])
+        level = np.concatenate([left[level], right[level]])
+
+    n_classes = forest.classes.size
+    seen = np.zeros((forest.n_features, n_classes))
+    present = np.zeros((forest.n_features, n_classes))
+    np.add.at(seen, forest.feature[node], reach[node, np.newaxis] * proba[node])
+    np.add.at(present, forest.feature[node], reach[rnode, np.newaxis] * proba[rnode])
+
+    # In units of one tree's worth of each disease's samples.
+    class_mass = forest.roots.size * np.maximum(proba[forest.roots].mean(axis=0), 1e-12)
+    seen /= class_mass
+    present /= class_mass
+    overall = present.sum(axis=1) / np.maximum(seen.sum(axis=1), 1e-12)
+    likelihood = (present + prior_strength * overall[:, np.newaxis]) / (seen + prior_strength)
+    return np.clip(likelihood.T, noise, 1.0 - noise)
+
+
+def entropy_bits(p: np.ndarray, axis: int = 0) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(p > 0, p * np.log2(p), 0.0)
+    return -terms.sum(axis=axis)
+
+
+class InfoGainSelector:
+    """Asks the symptom whose answer is expected to shrink the diagnosis
+    entropy the most, and stops once the posterior is confident.
+
+    The posterior is the forest's class prior updated with every answer, yes
+    and no, through ``symptom_likelihoods``. The forest's own
+    ``predict_proba`` is not used mid-conversation: it reads every symptom
+    not asked yet as absent, so after a couple of answers it is confidently
+    wrong and stops too early. Gains for all candidates come from one
+    (classes x symptoms) product.
+    """
+
+    def __init__(self, forest: FlatForest, likelihood: np.ndarray, confidence: float = 0.95,
+                 min_gain_bits: float = 0.01, max_questions: int = MAX_QUESTIONS):
+        if likelihood.shape != (forest.classes.size, forest.n_features):
+            raise ValueError(f"likelihood shape {likelihood.shape} does not match the forest")
+        self.classes = forest.classes
+        self.symptoms = forest.feature_names
+        self.index: Dict[str, int] = forest.feature_index
+        self.likelihood = np.ascontiguousarray(likelihood, dtype=np.float64)
+        self.log_yes = np.log(self.likelihood)
+        self.log_no = np.log1p(-self.likelihood)
+        # Class shares in the (bootstrapped) training data.
+        prior = forest.leaf_proba[forest.roots].mean(axis=0)
+        self.log_prior = np.log(np.maximum(prior / prior.sum(), 1e-12))
+        self.confidence = confidence
+        self.min_gain_bits = min_gain_bits
+        self.max_questions = max_questions
+
+    @classmethod
+    def from_forest(cls, forest: FlatForest, **kwargs) -> "InfoGainSelector":
+        return cls(forest, symptom_likelihoods(forest), **kwargs)
+
+    def indices(self, symptoms: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.index[s] for s in symptoms if s in self.index), dtype=np.intp)
+
+    def posterior(self, confirmed: Iterable[str], denied: Iterable[str] = ()) -> np.ndarray:
+        log_p = (self.log_prior + self.log_yes[:, self.indices(confirmed)].sum(axis=1)
+                 + self.log_no[:, self.indices(denied)].sum(axis=1))
+        p = np.exp(log_p - log_p.max())
+        return p / p.sum()
+
+    def gains(self, posterior: np.ndarray, asked_mask: np.ndarray) -> np.ndarray:
+        """Expected entropy reduction (bits) of asking each symptom; -inf once asked."""
+        yes = posterior[:, np.newaxis] * self.likelihood
+        no = posterior[:, np.newaxis] - yes
+        p_yes = yes.sum(axis=0)
+        p_no = 1.0 - p_yes
+        with np.errstate(divide="ignore", invalid="ignore"):
+            h_yes = entropy_bits(yes / p_yes)
+            h_no = entropy_bits(no / p_no)
+        expected = p_yes * h_yes + p_no * h_no
+        return np.where(asked_mask, -np.inf, entropy_bits(posterior) - expected)
+
+    def next_best(self, confirmed: Iterable[str], asked: Iterable[str]) -> Optional[str]:
+        confirmed = set(confirmed)
+        asked = set(asked) | confirmed
+        if len(asked) > self.max_questions:
+            return None
+        posterior = self.posterior(confirmed, asked - confirmed)
+        if posterior.max() >= self.confidence:
+            return None
+
+        mask = np.zeros(len(self.symptoms), dtype=bool)
+        mask[self.indices(asked)] = True
+        if mask.all():
+            return None
+        scores = self.gains(posterior, mask)
+        best = int(np.argmax(scores))
+        if scores[best] < self.min_gain_bits:
+            return None
+        return self.symptoms[best]
@@ -0,0 +1,91 @@
+import string
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+punct_table = str.maketrans("", "", string.punctuation)
+
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().translate(punct_table).split()
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over word tokens for symptom phrases.
+
+    Patterns are token sequences, so matches always fall on word boundaries.
+    Each symptom is indexed both as written ("pain in anal region") and with
+    stopwords removed ("pain anal region"). ``match`` walks the input once,
+    feeding every token to one automaton state and only the non-stopword
+    tokens to a second one, so phrases are found whether or not stopword
+    removal split them up.
+    """
+
+    def __init__(self, symptoms: Sequence[str], stop_words: Iterable[str] = (),
+                 variants: Optional[Callable[[str], Iterable[Sequence[str]]]] = None):
+        self.symptoms = list(symptoms)
+        self.stop_words: Set[str] = set(stop_words)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[int]] = [set()]
+
+        variants = variants or self._default_variants
+        for idx, symptom in enumerate(self.symptoms):
+            for tokens in variants(symptom):
+                if tokens:
+                    self._add(tokens, idx)
+        self._link()
+
+    def _default_variants(self, symptom: str) -> List[List[str]]:
+        tokens = tokenize(symptom.replace("_", " "))
+        cleaned = [t for t in tokens if t not in self.stop_words]
+        return [tokens, cleaned] if cleaned != tokens else [tokens]
+
+    def _add(self, tokens: Sequence[str], idx: int) -> None:
+        node = 0
+        for token in tokens:
+            nxt = self._goto[node].get(token)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][token] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            node = nxt
+        self._out[node].add(idx)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._out[child] |= self._out[self._fail[child]]
+
+    def _step(self, node: int, token: str) -> int:
+        while node and token not in self._goto[node]:
+            node = self._fail[node]
+        return self._goto[node].get(token, 0)
+
+    def find(self, tokens: Iterable[str]) -> Set[int]:
+        found: Set[int] = set()
+        full = cleaned = 0
+        for token in tokens:
+            full = self._step(full, token)
+            if self._out[full]:
+                found |= self._out[full]
+            if token not in self.stop_words:
+                cleaned = self._step(cleaned, token)
+                if self._out[cleaned]:
+                    found |= self._out[cleaned]
+        return found
+
+    def match(self, text: str) -> List[str]:
+        # Vocabulary order, like the substring scan this replaces.
+        return [self.symptoms[i] for i in sorted(self.find(tokenize(text)))]
+
+    def __len__(self) -> int:
+        return len(self._goto)
@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+MAX_QUESTIONS = 10
+
+
+class MIEngine:
+    """Dense float32 MI matrix with a symptom -> row index map."""
+
+    def __init__(self, symptoms: List[str], matrix: np.ndarray):
+        if matrix.shape != (len(symptoms), len(symptoms)):
+            raise ValueError(f"MI matrix shape {matrix.shape} does not match {len(symptoms)} symptoms")
+        self.symptoms = list(symptoms)
+        self.index: Dict[str, int] = {s: i for i, s in enumerate(self.symptoms)}
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MIEngine":
+        import pandas as pd
+
+        df = pd.read_csv(path, index_col=0)
+        return cls(list(df.index), df.to_numpy(dtype=np.float32))
+
+    def indices(self, symptoms: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.index[s] for s in symptoms if s in self.index), dtype=np.intp)
+
+    def score(self, confirmed: Iterable[str]) -> Optional[np.ndarray]:
+        rows = self.indices(confirmed)
+        if rows.size == 0:
+            return None
+        return self.matrix[rows].sum(axis=0, dtype=np.float32) / np.float32(rows.size)
+
+    def next_best(self, confirmed: Iterable[str], asked: Iterable[str], threshold: float = 0.01) -> Optional[str]:
+        asked = list(asked)
+        rows = self.indices(confirmed)
+        if rows.size == 0:
+            return None
+
+        mask = np.zeros(len(self.symptoms), dtype=bool)
+        mask[self.indices(asked)] = True
+        mi_sum = self.matrix[rows].sum(axis=0, dtype=np.float32)
+        return self.pick(mi_sum, rows.size, mask, len(asked), threshold)
+
+    def pick(self, mi_sum: np.ndarray, n_confirmed: int, asked_mask: np.ndarray, n_asked: int,
+             threshold: float = 0.01) -> Optional[str]:
+        """Next question from a running MI sum over the confirmed symptoms."""
+        if n_confirmed == 0 or asked_mask.all():
+            return None
+
+        scores = np.where(asked_mask, -np.inf, mi_sum / np.float32(n_confirmed))
+        best = int(np.argmax(scores))
+        if scores[best] < threshold or n_asked > MAX_QUESTIONS:
+            return None
+        return self.symptoms[best]
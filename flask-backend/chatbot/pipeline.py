@@ -0,0 +1,270 @@
+"""Offline build of every chatbot artifact from the symptom/disease training table.
+
+    python -m chatbot.pipeline --table Training.csv [--jobs 4] [--mi-csv] [--mi-json]
+
+The table has one 0/1 column per symptom and a disease column (``prognosis``
+by default), as a CSV, or for large data an ``.npz`` holding a scipy sparse
+matrix (``data``, ``indices``, ``indptr``, ``shape`` in CSR form) with
+``symptoms`` and ``labels`` arrays. From it the pipeline writes, in order:
+
+    random_forest_model.joblib  the disease classifier
+    symptom_embeddings.npy      description embeddings (kept when still current)
+    artifacts/bundle-v1/        the bundle the app memory-maps (see bundle.py),
+                                holding the pairwise normalized mutual
+                                information of the symptoms as float32
+    mi_matrix.csv               the same MI matrix as text, with --mi-csv only
+
+The forest and CSV go to --out-dir (chatbot/ by default, replacing the
+shipped files); a bundle built elsewhere is ignored by an app whose files
+differ. The CSV is what the app reads when it runs without a bundle, but at
+10k symptoms it is 100M numbers, up to gigabytes of text, so by default the
+matrix only goes into the bundle.
+
+Symptoms are sorted by name and every random step is seeded, so the same
+table gives the same arrays. The MI matrix comes from co-occurrence counts:
+with X the (rows x symptoms) 0/1 matrix, ``X.T @ X`` counts every pair
+present together, and the other three cells of each pair's 2x2 table follow
+from the column counts. Columns are split into blocks computed in parallel
+processes, each writing its part of the (symmetric) matrix straight into a
+shared memory-mapped file, so only the lower triangle is ever computed and
+nothing is copied back. X stays sparse throughout: a million rows of a few
+symptoms each is a few million non-zeros whatever the number of symptoms.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from chatbot.bundle import BUNDLE_VERSION, DEFAULT_BUNDLE_DIR, SOURCE_FILES, file_sha256, source_hashes, write_bundle
+from chatbot.encoders import BACKENDS, encode_descriptions, load_embeddings, load_model, save_embeddings
+from chatbot.forest import FlatForest
+from chatbot.semantic_index import description_rows
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(__file__)
+LABEL_COLUMN = "prognosis"
+MI_BLOCK = 256
+FOREST_TREES = 50
+FOREST_SEED = 42
+
+
+# ---------------- Training Table ----------------
+
+def load_table(path: str, label_column: str = LABEL_COLUMN) -> Tuple[sparse.csr_matrix, np.ndarray, List[str]]:
+    """(X as sparse 0/1 float32, labels, symptom names), columns sorted by name."""
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as f:
+            X = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            labels, symptoms = f["labels"].astype(str), [str(s) for s in f["symptoms"]]
+    else:
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        df = df.loc[:, ~df.columns.str.startswith("Unnamed:")]
+        labels = df.pop(label_column).astype(str).str.strip().to_numpy()
+        symptoms = [str(c) for c in df.columns]
+        X = sparse.csr_matrix(df.to_numpy(dtype=np.float32))
+    order = np.argsort(symptoms, kind="stable")
+    X = (X[:, order] != 0).astype(np.float32)
+    return X.tocsr(), labels, [symptoms[i] for i in order]
+
+
+# ---------------- Mutual Information ----------------
+
+def _entropy_terms(p: np.ndarray) -> np.ndarray:
+    # -p log p, with 0 log 0 = 0.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(p > 0, -p * np.log(p), 0.0)
+
+
+def nmi_block(X: sparse.csc_matrix, counts: np.ndarray, start: int, stop: int) -> np.ndarray:
+    """Normalized MI of symptoms [0, stop) against [start, stop): I(x; y) / mean(H(x), H(y)),
+    as sklearn's ``normalized_mutual_info_score`` gives for each pair of columns, except that
+    a symptom never (or always) present scores 0 against everything."""
+    n = float(X.shape[0])
+    both = (X[:, :stop].T @ X[:, start:stop]).toarray().astype(np.float64)
+    ci = counts[:stop, np.newaxis]
+    cj = counts[np.newaxis, start:stop]
+    joint = (_entropy_terms(both / n) + _entropy_terms((ci - both) / n)
+             + _entropy_terms((cj - both) / n) + _entropy_terms((n - ci - cj + both) / n))
+    h = _entropy_terms(counts / n) + _entropy_terms(1.0 - counts / n)
+    hi, hj = h[:stop, np.newaxis], h[np.newaxis, start:stop]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nmi = np.where(hi + hj > 0, 2.0 * (hi + hj - joint) / (hi + hj), 0.0)
+    return np.clip(nmi, 0.0, 1.0)
+
+
+_worker = {}
+
+
+def _init_worker(X: sparse.csc_matrix, counts: np.ndarray, out_path: str) -> None:
+    d = X.shape[1]
+    _worker.update(X=X, counts=counts, out=np.memmap(out_path, dtype=np.float32, mode="r+", shape=(d, d)))
+
+
+def _fill_block(start: int, stop: int) -> None:
+    out = _worker["out"]
+    block = nmi_block(_worker["X"], _worker["counts"], start, stop).astype(np.float32)
+    # Rows [0, stop) x columns [start, stop), mirrored; no other block writes these cells.
+    out[:stop, start:stop] = block
+    out[start:stop, :stop] = block.T
+
+
+def mutual_information(X: sparse.spmatrix, jobs: int = 1, block: int = MI_BLOCK,
+                       out_path: Optional[str] = None) -> np.ndarray:
+    """(symptoms x symptoms) float32 normalized MI, zero on the diagonal.
+
+    The result is memory-mapped from ``out_path`` (a temp file if not given).
+    Blocks are fixed by ``block`` alone, so ``jobs`` never changes the values.
+    """
+    X = sparse.csc_matrix(X, dtype=np.float32)
+    d = X.shape[1]
+    counts = np.asarray(X.sum(axis=0), dtype=np.float64).ravel()
+    if out_path is None:
+        fd, out_path = tempfile.mkstemp(suffix=".mi.f32")
+        os.close(fd)
+    np.memmap(out_path, dtype=np.float32, mode="w+", shape=(d, d)).flush()
+
+    # Later blocks cover more rows; handing them out first keeps the workers evenly loaded.
+    starts = list(range(0, d, block))[::-1]
+    if jobs <= 1:
+        _init_worker(X, counts, out_path)
+        for start in starts:
+            _fill_block(start, min(start + block, d))
+    else:
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(X, counts, out_path)) as pool:
+            list(pool.map(_fill_block, starts, [min(s + block, d) for s in starts]))
+    _worker.clear()
+
+    mi = np.memmap(out_path, dtype=np.float32, mode="r+", shape=(d, d))
+    np.fill_diagonal(mi, 0.0)
+    mi.flush()
+    return mi
+
+
+# ---------------- Forest and Embeddings ----------------
+
+def train_forest(X: sparse.spmatrix, labels: np.ndarray, symptoms: List[str], jobs: int = 1):
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    model = RandomForestClassifier(n_estimators=FOREST_TREES, random_state=FOREST_SEED, n_jobs=jobs)
+    if X.shape[0] * X.shape[1] <= 50_000_000:
+        # Dense with names, so the model carries feature_names_in_ like the shipped one.
+        model.fit(pd.DataFrame(X.toarray(), columns=symptoms), labels)
+    else:
+        model.fit(sparse.csc_matrix(X), labels)
+        model.feature_names_in_ = np.array(symptoms, dtype=object)
+    # Saved with the model; the same table should give the same file whatever --jobs was.
+    model.set_params(n_jobs=None)
+    return model
+
+
+def description_embeddings(backend_name: str, reencode: bool = False) -> Tuple[List[str], np.ndarray]:
+    """(row labels, embeddings) of the symptom descriptions; stored ones are reused while current."""
+    backend = BACKENDS[backend_name]
+    with open(SOURCE_FILES["descriptions"]) as f:
+        labels, texts = description_rows(json.load(f))
+    embeddings = None if reencode else load_embeddings(backend, texts)
+    if embeddings is None:
+        embeddings = encode_descriptions(load_model(backend, max_seq_length=None), texts)
+        save_embeddings(backend, texts, embeddings)
+    return labels, embeddings
+
+
+# ---------------- Build ----------------
+
+def build(table: str, jobs: int = 1, out_dir: str = BASE_DIR, bundle_dir: str = DEFAULT_BUNDLE_DIR,
+          label_column: str = LABEL_COLUMN, embedding_dtype: str = "float32", reencode: bool = False,
+          mi_csv: bool = False, mi_json: bool = False, timings: Optional[dict] = None) -> str:
+    """Write the forest (and with ``mi_csv`` the MI matrix) to ``out_dir`` and the bundle to ``bundle_dir``."""
+    import joblib
+    import pandas as pd
+
+    # The bundle records the hashes of the files it was built from, these two among them.
+    sources = dict(SOURCE_FILES, **{name: os.path.join(out_dir, os.path.basename(SOURCE_FILES[name]))
+                                    for name in ("mi_matrix", "rf_model")})
+    os.makedirs(out_dir, exist_ok=True)
+    # Seconds per stage, also filled into the caller's dict if given.
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    X, labels, symptoms = load_table(table, label_column)
+    timings["load"] = time.perf_counter() - start
+    log.info("Loaded %d rows x %d symptoms, %d diseases", X.shape[0], X.shape[1], np.unique(labels).size)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as scratch:
+        mi = np.array(mutual_information(X, jobs, out_path=os.path.join(scratch, "mi.f32")))
+    timings["mutual_information"] = time.perf_counter() - start
+    if mi_csv:
+        start = time.perf_counter()
+        # %.9g round-trips float32, which is what the app parses it back into.
+        pd.DataFrame(mi, index=symptoms, columns=symptoms).to_csv(sources["mi_matrix"], float_format="%.9g")
+        timings["mi_csv"] = time.perf_counter() - start
+    elif os.path.exists(sources["mi_matrix"]):
+        log.warning("%s is left as it was and no longer matches the bundle; the app only reads it "
+                    "without a bundle. Pass --mi-csv to rewrite it.", sources["mi_matrix"])
+    if mi_json:
+        # Same matrix as nested {symptom: {symptom: mi}}; nothing in the app reads it.
+        with open(os.path.join(out_dir, "mi_matrix.json"), "w") as f:
+            json.dump({a: dict(zip(symptoms, map(float, row))) for a, row in zip(symptoms, mi)}, f, indent=2)
+
+    start = time.perf_counter()
+    model = train_forest(X, labels, symptoms, jobs)
+    joblib.dump(model, sources["rf_model"])
+    forest = FlatForest.from_sklearn(model)
+    timings["forest"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # The bundle's embeddings are the shipped mpnet ones (see bundle.build_from_sources).
+    embedding_symptoms, embeddings = description_embeddings("mpnet", reencode)
+    timings["embeddings"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = {"mi": mi, "embeddings": embeddings.astype(embedding_dtype)}
+    arrays.update({f"forest_{name}": array for name, array in forest.arrays().items()})
+    tables = {
+        "mi_symptoms": symptoms,
+        "embedding_symptoms": embedding_symptoms,
+        "embedding_encoder": BACKENDS["mpnet"].version,
+        "forest_classes": [str(c) for c in forest.classes],
+        "forest_feature_names": forest.feature_names,
+        "build": {"table_sha256": file_sha256(table), "rows": int(X.shape[0]),
+                  "forest_trees": FOREST_TREES, "forest_seed": FOREST_SEED},
+    }
+    path = write_bundle(bundle_dir, arrays, tables, source_hashes(sources))
+    timings["bundle"] = time.perf_counter() - start
+    log.info("Built bundle v%d in %s: %s", BUNDLE_VERSION, path,
+             " ".join(f"{name}={seconds:.1f}s" for name, seconds in timings.items()))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the chatbot's artifacts from the training table.")
+    parser.add_argument("--table", required=True, help="CSV (symptom columns + disease column) or sparse .npz")
+    parser.add_argument("--label-column", default=LABEL_COLUMN)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="processes for MI and the forest")
+    parser.add_argument("--out-dir", default=BASE_DIR, help="where the forest (and mi_matrix.csv) are written")
+    parser.add_argument("--bundle", default=DEFAULT_BUNDLE_DIR)
+    parser.add_argument("--embedding-dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--reencode", action="store_true", help="re-embed the descriptions even if current")
+    parser.add_argument("--mi-csv", action="store_true", help="also write mi_matrix.csv to --out-dir")
+    parser.add_argument("--mi-json", action="store_true", help="also write mi_matrix.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    path = build(args.table, args.jobs, args.out_dir, args.bundle, args.label_column, args.embedding_dtype,
+                 args.reencode, args.mi_csv, args.mi_json)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
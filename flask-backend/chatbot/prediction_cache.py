@@ -0,0 +1,70 @@
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cache import LRUCache
+from chatbot.forest import FlatForest
+
+# (disease, probability), most likely first.
+Ranked = Tuple[Tuple[str, float], ...]
+
+
+def top_classes(classes: np.ndarray, proba: np.ndarray, k: int) -> Ranked:
+    # Stable, so ties resolve to the lowest class index exactly as argmax does.
+    order = np.argsort(-proba, kind="stable")[:k]
+    return tuple((str(classes[i]), float(proba[i])) for i in order)
+
+
+class PredictionCache:
+    """Forest predictions memoized by symptom set.
+
+    The confirmed symptoms at the end of a conversation repeat a lot across
+    users, so each distinct set is run through the forest once. Keys are the
+    sets as ``FlatForest.bitset`` ints, stored with the top ``top_k`` classes
+    of ``predict_proba`` so callers wanting the runners-up get them for free.
+    Entries belong to one model version; asking with another drops them all
+    (and keys carry the version, so a request racing the switch can't mix them).
+    """
+
+    def __init__(self, max_bytes: int, top_k: int = 3, name: str = "prediction"):
+        self.top_k = max(1, top_k)
+        self._cache = LRUCache(name, max_bytes)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._cache.clear("invalidated")
+                    self._version = version
+
+    def rank(self, forest: FlatForest, version: str, symptom_sets: Sequence[Iterable[str]]) -> List[Ranked]:
+        self._check_version(version)
+        keys = [(version, forest.bitset(symptoms)) for symptoms in symptom_sets]
+        ranked = [self._cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, r in zip(keys, ranked) if r is None))
+        if missing:
+            proba = forest.predict_proba(forest.decode_bitsets([bits for _, bits in missing]))
+            computed = {}
+            for key, row in zip(missing, proba):
+                computed[key] = top_classes(forest.classes, row, self.top_k)
+                self._cache.put(key, computed[key])
+            ranked = [r if r is not None else computed[key] for key, r in zip(keys, ranked)]
+        return ranked
+
+    def peek(self, forest: FlatForest, version: str, symptoms: Iterable[str]) -> Optional[Ranked]:
+        """The cached ranking of ``symptoms``, or None without running the forest."""
+        if version != self._version:
+            return None
+        return self._cache.get((version, forest.bitset(symptoms)))
+
+    def predict(self, forest: FlatForest, version: str, symptoms: Iterable[str]) -> str:
+        return self.rank(forest, version, [symptoms])[0][0][0]
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
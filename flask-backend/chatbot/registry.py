@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+class ArtifactRegistry:
+    """Loads named artifacts on first use and records how long each took.
+
+    Loaders may depend on each other through ``get``; every artifact has its
+    own lock, so a slow load (the sentence transformer) never blocks callers
+    of an artifact that is already loaded.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._serving: List[str] = []
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._errors: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+        self._warmup: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any], serving: bool = True) -> None:
+        # Non-serving artifacts are only loaded on demand, never by warm-up/readiness.
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        if serving:
+            self._serving.append(name)
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        with self._locks[name]:
+            if name not in self._values:
+                start = time.perf_counter()
+                try:
+                    value = self._loaders[name]()
+                except Exception as e:
+                    self._errors[name] = f"{type(e).__name__}: {e}"
+                    raise
+                # Includes any dependencies the loader pulled in on the way.
+                self.timings[name] = time.perf_counter() - start
+                self._errors.pop(name, None)
+                self._values[name] = value
+        return self._values[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._loaders
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def invalidate(self, *names: str) -> None:
+        for name in names:
+            with self._locks[name]:
+                self._values.pop(name, None)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> None:
+        for name in names or list(self._serving):
+            try:
+                self.get(name)
+            except Exception as e:
+                log.warning("Warm-up failed for %s: %s", name, e)
+
+    def start_warm_up(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        if self._warmup is None or not self._warmup.is_alive():
+            names = list(names) if names is not None else None
+            self._warmup = threading.Thread(target=self.warm_up, args=(names,), name="artifact-warmup", daemon=True)
+            self._warmup.start()
+        return self._warmup
+
+    def ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        return all(self.is_loaded(name) for name in (names or self._serving))
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "loaded": self.is_loaded(name),
+                "seconds": round(self.timings[name], 4) if name in self.timings else None,
+                **({"error": self._errors[name]} if name in self._errors else {}),
+            }
+            for name in self._loaders
+        }
@@ -0,0 +1,178 @@
+"""Symptom retrieval over the description embeddings (SEMANTIC_INDEX).
+
+``exact`` scores every float32 row with one BLAS product and is the fastest
+at this app's size. ``int8`` and ``float16`` trade query time for memory:
+numpy has no fast kernel for either, so every query converts each block to
+float32 before scoring. int8 stays within about 2x of exact; float16 is
+8-10x slower (5.6 ms vs 0.7 ms p50 at 2000 rows in
+benchmarks/bench_semantic_index.py), so use it only where memory matters
+and latency does not. ``ivf`` scores the rows
+of the clusters closest to the query, which is approximate.
+"""
+import os
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+SEMANTIC_INDEX = os.environ.get("SEMANTIC_INDEX", "exact")
+SEMANTIC_IVF_NPROBE = int(os.environ.get("SEMANTIC_IVF_NPROBE", "8"))
+
+# Rows scored per block when dequantizing, to keep the float32 copy in cache.
+BLOCK_ROWS = 4096
+
+
+def description_rows(descriptions: Dict[str, Union[str, Sequence[str]]]) -> Tuple[List[str], List[str]]:
+    """Flatten {symptom: description or [descriptions]} into parallel row lists."""
+    labels, texts = [], []
+    for symptom, value in descriptions.items():
+        for text in ([value] if isinstance(value, str) else value):
+            labels.append(symptom)
+            texts.append(text)
+    return labels, texts
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    if np.allclose(norms, 1.0, atol=1e-4):
+        # Already unit length (mpnet output is); keep memory-mapped arrays shared.
+        return vectors
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def as_vector(query) -> np.ndarray:
+    if hasattr(query, "detach"):
+        query = query.detach().cpu().numpy()
+    return normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+
+
+class SemanticIndex:
+    """Cosine top-k over description rows, returning canonical symptom names.
+
+    Several rows (synonyms, lay descriptions) may share a label; ``search``
+    over-fetches rows until it has ``top_k`` distinct labels.
+    """
+
+    def __init__(self, labels: Sequence[str]):
+        self.labels = list(labels)
+        self._label_ids = {}
+        self.row_label = np.array([self._label_ids.setdefault(l, len(self._label_ids)) for l in self.labels], dtype=np.intp)
+        self.label_names = list(self._label_ids)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def search_rows(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def search(self, query, top_k: int = 5) -> List[str]:
+        query = as_vector(query)
+        top_k = min(top_k, len(self.label_names))
+        fetch = top_k
+        while True:
+            rows, _ = self.search_rows(query, min(fetch, len(self)))
+            names = list(dict.fromkeys(self.row_label[rows].tolist()))
+            if len(names) >= top_k or fetch >= len(self):
+                return [self.label_names[i] for i in names[:top_k]]
+            fetch *= 4
+
+
+def _top_rows(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    k = min(k, scores.size)
+    part = np.argpartition(-scores, k - 1)[:k] if k < scores.size else np.arange(scores.size)
+    order = part[np.argsort(-scores[part], kind="stable")]
+    return rows[order], scores[order]
+
+
+class ExactIndex(SemanticIndex):
+    def __init__(self, embeddings: np.ndarray, labels: Sequence[str]):
+        super().__init__(labels)
+        self.vectors = normalize(embeddings)
+
+    def search_rows(self, query, k):
+        return _top_rows(self.vectors @ query, np.arange(len(self)), k)
+
+
+class QuantizedIndex(SemanticIndex):
+    """Exact search over pre-normalized float16 or int8 (per-row scale) vectors.
+
+    Each query converts the vectors to float32 block by block, so these save
+    memory, not time; float16 in particular is memory-only (see above).
+    """
+
+    def __init__(self, embeddings: np.ndarray, labels: Sequence[str], dtype: str = "int8"):
+        super().__init__(labels)
+        vectors = normalize(embeddings)
+        self.dtype = dtype
+        if dtype == "int8":
+            self.scale = (np.abs(vectors).max(axis=1) / 127.0).astype(np.float32)
+            self.scale[self.scale == 0] = 1.0
+            self.vectors = np.round(vectors / self.scale[:, np.newaxis]).astype(np.int8)
+        elif dtype == "float16":
+            self.scale = None
+            self.vectors = vectors.astype(np.float16)
+        else:
+            raise ValueError(f"unsupported quantized dtype: {dtype}")
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS].astype(np.float32)
+            out[start:start + BLOCK_ROWS] = block @ query
+        if self.scale is not None:
+            out *= self.scale
+        return out
+
+    def search_rows(self, query, k):
+        return _top_rows(self.scores(query), np.arange(len(self)), k)
+
+
+class IVFIndex(SemanticIndex):
+    """Inverted-file index: k-means coarse clusters, exact scoring inside the
+    ``nprobe`` clusters closest to the query."""
+
+    def __init__(self, embeddings: np.ndarray, labels: Sequence[str], nlist: int = 0,
+                 nprobe: int = SEMANTIC_IVF_NPROBE, iterations: int = 10, seed: int = 0):
+        super().__init__(labels)
+        vectors = normalize(embeddings)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        self.nprobe = nprobe
+        self.centroids = self._kmeans(vectors, min(nlist, len(vectors)), iterations, np.random.default_rng(seed))
+
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        # Rows stored cluster by cluster, so each probe scores one contiguous slice.
+        self.vectors = vectors[order]
+        self.rows = order
+        self.offsets = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+
+    @staticmethod
+    def _kmeans(vectors, k, iterations, rng):
+        sample = vectors[rng.choice(len(vectors), size=min(len(vectors), k * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=k, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=k) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
+
+    def search_rows(self, query, k):
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        slices = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes]
+        positions = np.concatenate(slices) if slices else np.empty(0, dtype=np.intp)
+        if positions.size == 0:
+            return positions, np.empty(0, dtype=np.float32)
+        return _top_rows(self.vectors[positions] @ query, self.rows[positions], k)
+
+
+def build_index(kind: str, embeddings: np.ndarray, labels: Sequence[str], **options) -> SemanticIndex:
+    if kind == "exact":
+        return ExactIndex(embeddings, labels)
+    if kind in ("int8", "float16"):
+        return QuantizedIndex(embeddings, labels, dtype=kind)
+    if kind == "ivf":
+        return IVFIndex(embeddings, labels, **options)
+    raise ValueError(f"unknown semantic index: {kind}")
@@ -0,0 +1,293 @@
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+import metrics
+from chatbot.info_gain import InfoGainSelector
+from chatbot.mi_engine import MIEngine
+
+log = logging.getLogger(__name__)
+
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_TTL_SECONDS", "1800"))
+CHAT_SESSION_MAX = int(os.environ.get("CHAT_SESSION_MAX", "10000"))
+CHAT_SESSION_FLUSH_SECONDS = float(os.environ.get("CHAT_SESSION_FLUSH_SECONDS", "2"))
+CHAT_SESSION_FLUSH_BATCH = int(os.environ.get("CHAT_SESSION_FLUSH_BATCH", "500"))
+
+SESSIONS_ACTIVE = metrics.gauge("remedi_chat_sessions_active", "Chat sessions held in this process.")
+SESSION_EVENTS = metrics.counter(
+    "remedi_chat_session_events_total", "Chat session lifecycle events.", ("event",),
+)
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class ChatSession:
+    """One symptom conversation: a running MI sum over the confirmed symptoms
+    plus an asked-symptom mask, so an answer is an O(V) update and the next
+    question a single masked argmax. With an info-gain ``selector`` the
+    questions come from it instead."""
+
+    def __init__(self, session_id: str, user_id: str, engine: MIEngine,
+                 selector: Optional[InfoGainSelector] = None):
+        self.id = session_id
+        self.user_id = user_id
+        self.engine = engine
+        self.selector = selector
+        self.mi_sum = np.zeros(len(engine.symptoms), dtype=np.float32)
+        self.asked_mask = np.zeros(len(engine.symptoms), dtype=bool)
+        self.answers: Dict[str, int] = {}
+        self.n_confirmed = 0
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def confirmed(self) -> List[str]:
+        return [s for s, v in self.answers.items() if v == 1]
+
+    @property
+    def denied(self) -> List[str]:
+        return [s for s, v in self.answers.items() if v == 0]
+
+    def answer(self, symptom: str, present: int) -> None:
+        present = 1 if present else 0
+        previous = self.answers.get(symptom)
+        if previous == present:
+            return
+        self.answers[symptom] = present
+
+        idx = self.engine.index.get(symptom)
+        if idx is None:
+            return
+        self.asked_mask[idx] = True
+        # Re-answering flips the symptom's contribution rather than double-counting.
+        delta = present - (previous or 0)
+        if delta:
+            self.mi_sum += delta * self.engine.matrix[idx]
+            self.n_confirmed += delta
+
+    def next_question(self, threshold: float = 0.01) -> Optional[str]:
+        if self.selector is not None:
+            with metrics.stage("info_gain"):
+                return self.selector.next_best(self.confirmed, self.answers)
+        with metrics.stage("mi_score"):
+            return self.engine.pick(self.mi_sum, self.n_confirmed, self.asked_mask, len(self.answers), threshold)
+
+    def to_document(self, ttl: float) -> dict:
+        now = datetime.now(timezone.utc)
+        return {
+            "_id": self.id,
+            "user_id": self.user_id,
+            "answers": dict(self.answers),
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=ttl),
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict, engine: MIEngine,
+                      selector: Optional[InfoGainSelector] = None) -> "ChatSession":
+        session = cls(doc["_id"], doc["user_id"], engine, selector)
+        for symptom, present in doc.get("answers", {}).items():
+            session.answer(symptom, present)
+        return session
+
+
+class SessionPersistence:
+    """Where sessions go when they are flushed; the in-process store is authoritative."""
+
+    def save_many(self, documents: List[dict]) -> None:
+        pass
+
+    def load(self, session_id: str) -> Optional[dict]:
+        return None
+
+    def delete_many(self, session_ids: List[str]) -> None:
+        pass
+
+
+class MongoSessionPersistence(SessionPersistence):
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexed = False
+
+    def _ensure_indexes(self) -> None:
+        if not self._indexed:
+            # Mongo drops documents once expires_at has passed.
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def save_many(self, documents):
+        from pymongo import ReplaceOne
+
+        if not documents:
+            return
+        self._ensure_indexes()
+        self.collection.bulk_write(
+            [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in documents], ordered=False,
+        )
+
+    def load(self, session_id):
+        return self.collection.find_one(
+            {"_id": session_id, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+            {"user_id": 1, "answers": 1},
+        )
+
+    def delete_many(self, session_ids):
+        if session_ids:
+            self.collection.delete_many({"_id": {"$in": list(session_ids)}})
+
+
+class SessionStore:
+    """In-process session store with idle TTL, a session cap and batched
+    write-behind persistence.
+
+    Persistence lets a session survive a restart or move to another worker;
+    with several workers, route a session id to the same worker so the
+    in-memory copy stays the live one.
+    """
+
+    def __init__(self, engine: Callable[[], MIEngine], persistence: Optional[SessionPersistence] = None,
+                 selector: Optional[Callable[[], InfoGainSelector]] = None, ttl: float = CHAT_SESSION_TTL_SECONDS, max_sessions: int = CHAT_SESSION_MAX,
+                 flush_interval: float = CHAT_SESSION_FLUSH_SECONDS, flush_batch: int = CHAT_SESSION_FLUSH_BATCH):
+        self._engine = engine
+        self._selector = selector
+        self.persistence = persistence or SessionPersistence()
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._dirty: Dict[str, None] = {}
+        self._deleted: Dict[str, None] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    def create(self, user_id: str) -> ChatSession:
+        session = ChatSession(secrets.token_urlsafe(16), user_id, self._engine(), self._new_selector())
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            if len(self._sessions) >= self.max_sessions:
+                SESSION_EVENTS.inc(event="rejected")
+                raise SessionLimitError("Too many active chat sessions")
+            self._sessions[session.id] = session
+            SESSIONS_ACTIVE.set(len(self._sessions))
+        SESSION_EVENTS.inc(event="created")
+        return session
+
+    def get(self, session_id: str, user_id: str) -> Optional[ChatSession]:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.touched > self.ttl:
+                self._drop_locked(session_id, delete=False)
+                session = None
+            if session is not None:
+                session.touched = now
+                self._sessions.move_to_end(session_id)
+
+        if session is None:
+            session = self._restore(session_id)
+        if session is None or session.user_id != user_id:
+            return None
+        return session
+
+    def mark_dirty(self, session: ChatSession) -> None:
+        with self._lock:
+            self._dirty[session.id] = None
+        self._ensure_flusher()
+
+    def end(self, session_id: str) -> None:
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop_locked(session_id, delete=True)
+        self._ensure_flusher()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            dirty = [self._sessions[sid] for sid in list(self._dirty)[:self.flush_batch] if sid in self._sessions]
+            for session in dirty:
+                self._dirty.pop(session.id, None)
+            deleted = list(self._deleted)[:self.flush_batch]
+            for sid in deleted:
+                self._deleted.pop(sid, None)
+
+        documents = []
+        for session in dirty:
+            with session.lock:
+                documents.append(session.to_document(self.ttl))
+        try:
+            self.persistence.save_many(documents)
+            self.persistence.delete_many(deleted)
+            SESSION_EVENTS.inc(len(documents), event="persisted")
+        except Exception:
+            log.exception("Chat session flush failed")
+            with self._lock:
+                for session in dirty:
+                    self._dirty[session.id] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _restore(self, session_id: str) -> Optional[ChatSession]:
+        try:
+            doc = self.persistence.load(session_id)
+        except Exception:
+            log.exception("Chat session restore failed")
+            return None
+        if doc is None:
+            return None
+
+        session = ChatSession.from_document(doc, self._engine(), self._new_selector())
+        with self._lock:
+            existing = self._sessions.get(session_id)
+            if existing is not None:
+                return existing
+            self._expire_locked(time.monotonic())
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError("Too many active chat sessions")
+            self._sessions[session_id] = session
+            SESSIONS_ACTIVE.set(len(self._sessions))
+        SESSION_EVENTS.inc(event="restored")
+        return session
+
+    def _new_selector(self) -> Optional[InfoGainSelector]:
+        return self._selector() if self._selector is not None else None
+
+    def _expire_locked(self, now: float) -> None:
+        # Sessions are kept in touch order, so expired ones are at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.touched <= self.ttl:
+                break
+            self._drop_locked(session_id, delete=False)
+            SESSION_EVENTS.inc(event="expired")
+
+    def _drop_locked(self, session_id: str, delete: bool) -> None:
+        # Expired sessions are left to the persistence layer's own TTL.
+        self._sessions.pop(session_id, None)
+        self._dirty.pop(session_id, None)
+        if delete:
+            self._deleted[session_id] = None
+        SESSIONS_ACTIVE.set(len(self._sessions))
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name="chat-session-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
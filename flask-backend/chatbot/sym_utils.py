@@ -2,12 +2,19 @@ import os
 import json
 import string
 import numpy as np
-import pandas as pd
-import joblib
-import torch
-from typing import List, Dict, Optional
-from sentence_transformers import SentenceTransformer, util
-from nltk.corpus import stopwords
+from typing import List, Dict, Optional, Tuple
+from chatbot.registry import ArtifactRegistry
+from chatbot.mi_engine import MIEngine
+from chatbot.forest import FlatForest
+from chatbot.info_gain import InfoGainSelector
+from chatbot.bundle import DEFAULT_BUNDLE_DIR, file_sha256, load_bundle
+from chatbot.batch_encoder import BatchingEncoder
+from chatbot.encoders import encode_descriptions, get_backend, load_embeddings, load_model, save_embeddings
+from chatbot.keyword_matcher import KeywordMatcher
+from chatbot.prediction_cache import PredictionCache, top_classes
+from chatbot.semantic_index import SEMANTIC_INDEX, build_index, description_rows
+from cache import LRUCache
+from metrics import stage
 
 BASE_DIR = os.path.dirname(__file__)
 
@@ -15,6 +22,7 @@ RF_MODEL_PATH = os.path.join(BASE_DIR, "random_forest_model.joblib")
 DESC_FILE = os.path.join(BASE_DIR, "sym_desc.json")
 EMBED_FILE = os.path.join(BASE_DIR, "symptom_embeddings.npy")
 MI_MATRIX_PATH = os.path.join(BASE_DIR, "mi_matrix.csv")
+BUNDLE_DIR = os.environ.get("ARTIFACT_BUNDLE_DIR", DEFAULT_BUNDLE_DIR)
 
 for name, path in {
     "Random Forest Model": RF_MODEL_PATH,
@@ -25,78 +33,219 @@ for name, path in {
     if not os.path.exists(path):
         raise FileNotFoundError(f"{name} file not found: {path}")
 
-rf_model = joblib.load(RF_MODEL_PATH)
-MI_MATRIX = pd.read_csv(MI_MATRIX_PATH, index_col=0)
-
-stop_words = set(stopwords.words('english'))
 punct_table = str.maketrans("", "", string.punctuation)
-MODEL_NAME = "all-mpnet-base-v2"
+ENCODER = get_backend()
+MODEL_NAME = ENCODER.version
+MATCH_CACHE_MAX_BYTES = int(os.environ.get("MATCH_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+MATCH_CACHE_TTL_SECONDS = float(os.environ.get("MATCH_CACHE_TTL_SECONDS", "0"))
+PREDICTION_CACHE_MAX_BYTES = int(os.environ.get("PREDICTION_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+PREDICTION_TOP_K = int(os.environ.get("PREDICTION_TOP_K", "3"))
+# "mi" (average MI with the confirmed symptoms) or "info_gain" (expected entropy reduction, see chatbot/info_gain.py).
+QUESTION_SELECTOR = os.environ.get("QUESTION_SELECTOR", "mi")
+INFO_GAIN_CONFIDENCE = float(os.environ.get("INFO_GAIN_CONFIDENCE", "0.95"))
+INFO_GAIN_MIN_BITS = float(os.environ.get("INFO_GAIN_MIN_BITS", "0.01"))
+if QUESTION_SELECTOR not in ("mi", "info_gain"):
+    raise ValueError(f"QUESTION_SELECTOR must be 'mi' or 'info_gain', not {QUESTION_SELECTOR!r}")
+
+# ---------------- Artifact Loaders ----------------
+# Everything heavy (torch, the sentence transformer, sklearn, NLTK, pandas) is
+# loaded on first use so importing this module - and the app - stays cheap.
+registry = ArtifactRegistry()
+
+def _load_bundle():
+    # Memory-mapped bundle shared across workers; None falls back to the loose files.
+    if not BUNDLE_DIR:
+        return None
+    return load_bundle(BUNDLE_DIR)
+
+def _load_forest():
+    bundle = registry.get("bundle")
+    if bundle is not None:
+        return bundle.forest()
+    return FlatForest.from_sklearn(registry.get("rf_model"))
+
+def _load_forest_version():
+    # The hash of the model the forest was flattened from; prediction cache entries are tied to it.
+    bundle = registry.get("bundle")
+    if bundle is not None and "rf_model" in bundle.manifest.get("sources", {}):
+        return bundle.manifest["sources"]["rf_model"]
+    return file_sha256(RF_MODEL_PATH)
+
+def _load_mi_engine():
+    bundle = registry.get("bundle")
+    if bundle is not None:
+        return MIEngine(bundle.mi_symptoms, bundle.mi)
+    return MIEngine.from_csv(MI_MATRIX_PATH)
+
+def _load_stop_words():
+    from nltk.corpus import stopwords
+    return set(stopwords.words('english'))
+
+def _load_description_source():
+    # sym_desc.json maps each symptom to one description or a list of them
+    # (synonyms, lay phrasings); every description is one embedding row.
+    with open(DESC_FILE, "r") as f:
+        return json.load(f)
+
+def _load_symptom_descriptions():
+    return {
+        symptom: value if isinstance(value, str) else value[0]
+        for symptom, value in registry.get("description_source").items()
+    }
+
+def _load_desc_embeddings():
+    # Queries are only comparable with descriptions embedded by the same encoder backend.
+    bundle = registry.get("bundle")
+    if (bundle is not None and bundle.embedding_symptoms == registry.get("description_labels")
+            and bundle.embedding_encoder == ENCODER.version):
+        return bundle.embeddings
+    texts = registry.get("description_texts")
+    desc_embeddings = load_embeddings(ENCODER, texts)
+    if desc_embeddings is None:
+        desc_embeddings = encode_descriptions(registry.get("model"), texts)
+        save_embeddings(ENCODER, texts, desc_embeddings)
+    return desc_embeddings
+
+def _load_desc_embeddings_tensor():
+    import torch
+    import warnings
+
+    desc_embeddings = registry.get("desc_embeddings")
+    if desc_embeddings.dtype != np.float32:
+        return torch.tensor(desc_embeddings, dtype=torch.float32)
+    # Zero-copy view of the (possibly read-only, memory-mapped) array.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(desc_embeddings)
+
+def _load_rf_model():
+    import joblib
+    return joblib.load(RF_MODEL_PATH)
+
+registry.register("bundle", _load_bundle)
+registry.register("rf_model", _load_rf_model, serving=False)
+registry.register("forest", _load_forest)
+registry.register("forest_version", _load_forest_version)
+registry.register("mi_engine", _load_mi_engine)
+registry.register("info_gain", lambda: InfoGainSelector.from_forest(
+    registry.get("forest"), confidence=INFO_GAIN_CONFIDENCE, min_gain_bits=INFO_GAIN_MIN_BITS,
+), serving=QUESTION_SELECTOR == "info_gain")
+registry.register("stop_words", _load_stop_words)
+registry.register("description_source", _load_description_source)
+registry.register("symptom_descriptions", _load_symptom_descriptions)
+registry.register("symptom_names", lambda: list(registry.get("symptom_descriptions").keys()))
+registry.register("description_labels", lambda: description_rows(registry.get("description_source"))[0])
+registry.register("description_texts", lambda: description_rows(registry.get("description_source"))[1])
+registry.register("keyword_matcher", lambda: KeywordMatcher(registry.get("symptom_names"), registry.get("stop_words")))
+registry.register("model", lambda: load_model(ENCODER))
+registry.register("desc_embeddings", _load_desc_embeddings)
+registry.register("desc_embeddings_tensor", _load_desc_embeddings_tensor, serving=False)
+registry.register("semantic_index", lambda: build_index(
+    SEMANTIC_INDEX, registry.get("desc_embeddings"), registry.get("description_labels")
+))
+registry.register("encoder", lambda: BatchingEncoder(
+    lambda texts: registry.get("model").encode(texts, convert_to_numpy=True)
+))
+
+def __getattr__(name):
+    # Keeps `sym_utils.rf_model`, `sym_utils.symptom_descriptions`, ... working.
+    if name in registry:
+        return registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Everything built from sym_desc.json and the description embeddings.
+DESCRIPTION_ARTIFACTS = (
+    "description_source", "symptom_descriptions", "symptom_names", "description_labels", "description_texts",
+    "keyword_matcher", "desc_embeddings", "desc_embeddings_tensor", "semantic_index",
+)
+
+def _reload_descriptions():
+    registry.invalidate(*DESCRIPTION_ARTIFACTS)
+    registry.start_warm_up([name for name in DESCRIPTION_ARTIFACTS if name != "desc_embeddings_tensor"])
+
+# (cleaned text, top_k) -> (query embedding, candidates). When the description
+# files change, the artifacts built from them are reloaded and the cache dropped.
+match_cache = LRUCache(
+    "symptom_match", MATCH_CACHE_MAX_BYTES, ttl=MATCH_CACHE_TTL_SECONDS,
+    watch_paths=(DESC_FILE, ENCODER.embeddings_path), on_files_changed=_reload_descriptions,
+)
+
+# Confirmed-symptom bitset -> top PREDICTION_TOP_K diseases; tied to the forest version.
+prediction_cache = PredictionCache(PREDICTION_CACHE_MAX_BYTES, top_k=PREDICTION_TOP_K)
 
 # ---------------- Text Cleaning ----------------
 def clean_text(text: str) -> str:
+    stop_words = registry.get("stop_words")
     text = text.lower().translate(punct_table)
     words = text.split()
     return " ".join(w for w in words if w not in stop_words)
 
-# ---------------- Load Symptom Descriptions ----------------
-with open(DESC_FILE, "r") as f:
-    symptom_descriptions = json.load(f)
-
-symptom_names = list(symptom_descriptions.keys())
-description_texts = [symptom_descriptions[s] for s in symptom_names]
-
-model = SentenceTransformer(MODEL_NAME)
-if os.path.exists(EMBED_FILE):
-    desc_embeddings = np.load(EMBED_FILE)
-else:
-    desc_embeddings = model.encode(description_texts, convert_to_numpy=True)
-    np.save(EMBED_FILE, desc_embeddings)
-
-desc_embeddings_tensor = torch.tensor(desc_embeddings)
-
 # ---------------- Symptom Matching ----------------
 def hybrid_symptom_match(user_input: str, top_k: int = 5) -> List[str]:
     cleaned = clean_text(user_input)
-    
-    keyword_matches = [s for s in symptom_names if s.replace("_", " ") in cleaned]
-
-    user_embedding = model.encode(cleaned, convert_to_tensor=True)
-    scores = util.cos_sim(user_embedding, desc_embeddings_tensor)[0]
-    top_indices = scores.topk(top_k).indices.tolist()
-    semantic_matches = [symptom_names[i] for i in top_indices]
+    cached = match_cache.get((cleaned, top_k))
+    if cached is not None:
+        return list(cached[1])
+
+    # Any phrase found in the raw text is also found in its cleaned form, so the cache key still holds.
+    keyword_matcher = registry.get("keyword_matcher")
+    with stage("keyword_match"):
+        keyword_matches = keyword_matcher.match(user_input)
+
+    encoder = registry.get("encoder")
+    with stage("encode"):
+        user_embedding = encoder.encode(cleaned)
+    semantic_index = registry.get("semantic_index")
+    with stage("semantic_topk"):
+        semantic_matches = semantic_index.search(user_embedding, top_k)
 
     combined = list(dict.fromkeys(keyword_matches + semantic_matches))[:top_k]
+    match_cache.put((cleaned, top_k), (user_embedding, tuple(combined)))
     return combined
 
 # ---------------- Next Best Symptom ----------------
 def find_next_best_symptom(symptom_weights: Dict[str, int], asked_symptoms: List[str], threshold=0.01) -> Optional[str]:
     confirmed_symptoms = [s for s, present in symptom_weights.items() if present == 1]
-    if not confirmed_symptoms:
-        print("No confirmed symptoms yet.")
-        return None
+    if QUESTION_SELECTOR == "info_gain":
+        selector = registry.get("info_gain")
+        with stage("info_gain"):
+            return selector.next_best(confirmed_symptoms, asked_symptoms)
+    mi_engine = registry.get("mi_engine")
+    with stage("mi_score"):
+        return mi_engine.next_best(confirmed_symptoms, asked_symptoms, threshold=threshold)
 
-    potential_symptoms = set(MI_MATRIX.index) - set(asked_symptoms)
-    if not potential_symptoms:
-        print("No more potential symptoms to ask.")
-        return None
+# ---------------- Prediction ----------------
+def predict_top(user_symptoms: List[str]) -> List[Tuple[str, float]]:
+    """The PREDICTION_TOP_K most likely diseases with their forest probabilities, best first."""
+    forest = registry.get("forest")
+    with stage("forest_predict"):
+        return list(prediction_cache.rank(forest, registry.get("forest_version"), [user_symptoms])[0])
 
-    scores = {}
-    for potential in potential_symptoms:
-        total_mi = sum(MI_MATRIX.loc[conf, potential] for conf in confirmed_symptoms)
-        avg_mi = total_mi / len(confirmed_symptoms)
-        scores[potential] = avg_mi
-        print(f"Potential: {potential}, Avg MI: {avg_mi:.4f}")
-
-    next_symptom, next_score = max(scores.items(), key=lambda x: x[1])
-    print(f"Next candidate: {next_symptom}, Score: {next_score:.4f}")
-    if next_score < threshold or len(asked_symptoms) > 10:
-        print("Score below threshold or too many questions asked, stopping.")
+def predict(user_symptoms: List[str]) -> str:
+    return predict_top(user_symptoms)[0][0]
+
+def diagnose_top(confirmed: List[str], denied: List[str] = ()) -> List[Tuple[str, float]]:
+    """The final answer of a conversation, with the runners-up. The info-gain
+    selector stops on its own posterior, which also weighs the denied
+    symptoms, so it answers from that."""
+    if QUESTION_SELECTOR == "info_gain":
+        selector = registry.get("info_gain")
+        with stage("info_gain"):
+            return list(top_classes(selector.classes, selector.posterior(confirmed, denied), PREDICTION_TOP_K))
+    return predict_top(confirmed)
+
+def cached_diagnosis(confirmed: List[str], denied: List[str] = ()) -> Optional[List[Tuple[str, float]]]:
+    """``diagnose_top`` if it needs no inference (an already-seen set), else None."""
+    if QUESTION_SELECTOR == "info_gain" or not registry.is_loaded("forest_version"):
         return None
+    ranked = prediction_cache.peek(registry.get("forest"), registry.get("forest_version"), confirmed)
+    return list(ranked) if ranked is not None else None
 
-    return next_symptom
+def diagnose(confirmed: List[str], denied: List[str] = ()) -> str:
+    return diagnose_top(confirmed, denied)[0][0]
 
-# ---------------- Prediction ----------------
-def predict(user_symptoms: List[str]) -> str:
-    all_symptoms = rf_model.feature_names_in_
-    vector = [1 if s in user_symptoms else 0 for s in all_symptoms]
-    return rf_model.predict([vector])[0]
+def predict_batch(symptom_sets: List[List[str]]) -> List[str]:
+    # Not through prediction_cache: one large batch of one-off sets would evict the conversations' entries.
+    forest = registry.get("forest")
+    with stage("forest_predict"):
+        return forest.predict_symptoms(symptom_sets)
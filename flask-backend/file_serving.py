@@ -0,0 +1,161 @@
+"""Serving stored files: conditional GET, byte ranges, front-server offload and thumbnails.
+
+Stored files never change (blobs are named by their SHA-256), so their hash
+is a strong ETag: a client revalidating a file it already has gets a 304
+with no body, and a PDF viewer can fetch byte ranges of a large file.
+
+With FILE_SENDFILE set, the response carries only headers and the front
+server sends the bytes itself: "x-sendfile" (Apache mod_xsendfile,
+lighttpd) names the absolute path, "x-accel-redirect" (nginx) names the
+file under FILE_ACCEL_PREFIX, an ``internal`` location aliased to the
+upload directory. Ranges are then the front server's job.
+
+Previews for the listing view are downscaled once per file content and
+kept on disk next to the uploads. They need Pillow; without it, or for
+PDFs, there is no preview.
+"""
+import logging
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from flask import current_app, request, send_file
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+FILE_SENDFILE = os.environ.get("FILE_SENDFILE", "").lower()
+FILE_ACCEL_PREFIX = os.environ.get("FILE_ACCEL_PREFIX", "/protected-uploads/")
+# Files are per user: browsers may keep them this long, shared caches never.
+FILE_CACHE_MAX_AGE = int(os.environ.get("FILE_CACHE_MAX_AGE", "0"))
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "80"))
+
+if FILE_SENDFILE not in ("", "x-sendfile", "x-accel-redirect"):
+    raise ValueError(f"FILE_SENDFILE must be empty, 'x-sendfile' or 'x-accel-redirect', not {FILE_SENDFILE!r}")
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+THUMBNAILS = metrics.counter(
+    "remedi_thumbnails_total", "Thumbnail requests, by whether the preview was already on disk.", ("result",),
+)
+
+# Extensions Pillow can make a preview of.
+THUMBNAIL_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+# ---------------- Files ----------------
+
+def send_stored_file(path: str, root: str, mimetype: str, etag: Optional[str] = None):
+    """Send ``path`` (somewhere under ``root``) with validators for conditional
+    and range requests. ``etag`` should be the content hash when known."""
+    response = _offload_response(path, root, mimetype, etag) if FILE_SENDFILE else None
+    if response is None:
+        # Without a hash werkzeug derives the ETag from mtime, size and path.
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag or True, max_age=None)
+    response.cache_control.private = True
+    if FILE_CACHE_MAX_AGE > 0:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = FILE_CACHE_MAX_AGE
+    return response
+
+
+def _offload_response(path: str, root: str, mimetype: str, etag: Optional[str]):
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, "/")
+    if FILE_SENDFILE == "x-accel-redirect" and relative.startswith("../"):
+        return None  # outside the aliased directory; nginx could not find it
+    stat = os.stat(path)
+    response = current_app.response_class(mimetype=mimetype)
+    if FILE_SENDFILE == "x-sendfile":
+        response.headers["X-Sendfile"] = os.path.abspath(path)
+    else:
+        response.headers["X-Accel-Redirect"] = FILE_ACCEL_PREFIX.rstrip("/") + "/" + relative
+    response.set_etag(etag or f"{stat.st_mtime_ns}-{stat.st_size}")
+    response.last_modified = stat.st_mtime
+    response.cache_control.no_cache = True
+    # 304s are answered here; 200s and ranges by the front server.
+    response = response.make_conditional(request.environ)
+    if response.status_code == 304:
+        response.headers.pop("X-Sendfile", None)
+        response.headers.pop("X-Accel-Redirect", None)
+    return response
+
+
+# ---------------- Thumbnails ----------------
+
+class ThumbnailCache:
+    """JPEG previews under ``root/ab/cd/<sha256>-<size>.jpg``.
+
+    Keyed by content, so prescriptions sharing a blob share its preview.
+    Each preview is written to a temp file and renamed into place; a striped
+    lock keeps concurrent requests in this process from making it twice.
+    """
+
+    def __init__(self, root: str, size: int = THUMBNAIL_SIZE, quality: int = THUMBNAIL_QUALITY):
+        self.root = root
+        self.size = size
+        self.quality = quality
+        os.makedirs(root, exist_ok=True)
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    @staticmethod
+    def supports(extension: str) -> bool:
+        return Image is not None and extension.lower() in THUMBNAIL_EXTENSIONS
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}-{self.size}.jpg")
+
+    def get(self, sha256: str, source: str, extension: str) -> Optional[str]:
+        """Path of the preview of ``source``, making it on first use; None if there can't be one."""
+        if not self.supports(extension):
+            return None
+        path = self.path(sha256)
+        if os.path.exists(path):
+            THUMBNAILS.inc(result="hit")
+            return path
+
+        with self._locks[int(sha256[:4], 16) % len(self._locks)]:
+            if os.path.exists(path):
+                THUMBNAILS.inc(result="hit")
+                return path
+            try:
+                with metrics.stage("thumbnail"):
+                    self._render(source, path)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # Unreadable or hostile image: no preview, the file itself is still served.
+                log.warning("Thumbnail failed for %s: %s", sha256, e)
+                THUMBNAILS.inc(result="error")
+                return None
+        THUMBNAILS.inc(result="made")
+        return path
+
+    def _render(self, source: str, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with Image.open(source) as image:
+            # JPEGs decode straight at a fraction of their size, far cheaper than resizing afterwards.
+            image.draft("RGB", (self.size, self.size))
+            image.thumbnail((self.size, self.size))
+            if image.mode != "RGB":
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, "JPEG", quality=self.quality, optimize=True)
+                os.replace(temp, path)
+            except BaseException:
+                os.remove(temp)
+                raise
+
+    def discard(self, sha256: str) -> None:
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,133 @@
+"""Indexes the request paths rely on, created at startup and verifiable on demand.
+
+``ensure_indexes`` is idempotent: creating an index that already exists
+with the same keys and options is a no-op on the server. ``verify_indexes``
+checks the indexes are present and that the hot queries are planned as
+index scans, with no collection scan and no in-memory sort.
+
+Run from flask-backend/ against the configured DB_URI:
+    python indexes.py            # create, then verify
+    python indexes.py --verify   # verify only
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from pagination import KEYSET_SORT, encode_cursor, keyset_filter
+
+log = logging.getLogger(__name__)
+
+MONGO_ENSURE_INDEXES = os.environ.get("MONGO_ENSURE_INDEXES", "1") == "1"
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # signup/login look users up by email; unique also closes the signup race.
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "prescriptions": [
+        # Listing: equality on user and flag, then the keyset sort order.
+        IndexModel([("user_id", ASCENDING), ("metadata.is_deleted", ASCENDING),
+                    ("upload_date", DESCENDING), ("_id", DESCENDING)]),
+    ],
+    "upload_sessions": [
+        # Expiry sweep; every other lookup is by _id.
+        IndexModel([("expires_at", ASCENDING)]),
+    ],
+}
+
+
+def ensure_indexes(db) -> List[str]:
+    """Create every index in INDEXES; returns the failures instead of raising."""
+    problems = []
+    for name, models in INDEXES.items():
+        try:
+            db[name].create_indexes(models)
+        except PyMongoError as e:
+            # e.g. duplicate emails already stored: the unique index can't build.
+            problems.append(f"{name}: {e}")
+    return problems
+
+
+def ensure_indexes_in_background(db) -> None:
+    def run():
+        for problem in ensure_indexes(db):
+            log.error("Index creation failed: %s", problem)
+
+    threading.Thread(target=run, name="ensure-indexes", daemon=True).start()
+
+
+def _stages(plan: dict) -> List[dict]:
+    stages = [plan]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(_stages(child))
+    return stages
+
+
+def _hot_queries(db) -> Dict[str, object]:
+    sample_user = ObjectId()
+    live = {"user_id": sample_user, "metadata.is_deleted": False}
+    next_page = keyset_filter(live, encode_cursor({"upload_date": datetime.utcnow(), "_id": ObjectId()}))
+    prescriptions = db["prescriptions"]
+    return {
+        "users by email": db["users"].find({"email": "nobody@example.com"}, {"_id": 1}).limit(1),
+        "prescriptions first page": prescriptions.find(live, {"_id": 1}).sort(KEYSET_SORT).limit(20),
+        "prescriptions next page": prescriptions.find(next_page, {"_id": 1}).sort(KEYSET_SORT).limit(20),
+    }
+
+
+def verify_indexes(db) -> List[str]:
+    """Problems with the indexes or query plans; an empty list means all good."""
+    problems = []
+    for name, models in INDEXES.items():
+        existing = {tuple(info["key"]): info for info in db[name].index_information().values()}
+        for model in models:
+            spec = model.document
+            keys = tuple((field, direction) for field, direction in spec["key"].items())
+            info = existing.get(keys)
+            if info is None:
+                problems.append(f"{name}: missing index {spec['name']}")
+            elif spec.get("unique") and not info.get("unique"):
+                problems.append(f"{name}: index {spec['name']} is not unique")
+
+    for label, cursor in _hot_queries(db).items():
+        if not hasattr(cursor, "explain"):
+            log.info("%s: skipped, this client cannot explain queries", label)
+            continue
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = {stage["stage"] for stage in _stages(plan.get("queryPlan", plan))}
+        if "COLLSCAN" in stages:
+            problems.append(f"{label}: collection scan")
+        elif not stages & {"IXSCAN", "EXPRESS_IXSCAN", "IDHACK"}:
+            problems.append(f"{label}: no index scan in plan {sorted(stages)}")
+        if "SORT" in stages:
+            problems.append(f"{label}: sorted in memory")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes.")
+    parser.add_argument("--verify", action="store_true", help="only verify, don't create")
+    args = parser.parse_args()
+
+    from dbConnect import db
+
+    problems = [] if args.verify else ensure_indexes(db)
+    problems += verify_indexes(db)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("Indexes OK")
+
+
+if __name__ == "__main__":
+    main()
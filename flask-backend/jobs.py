@@ -0,0 +1,379 @@
+"""Background OCR jobs for uploaded prescriptions.
+
+Uploads are stored with ``status: "pending_ocr"``. Workers claim them
+straight from the prescriptions collection with an atomic find-and-modify
+that also takes a lease. The lease is renewed while the job runs, and an
+expired lease makes the job claimable again, so a crashed worker's jobs are
+picked up elsewhere. Results are written only while the lease still belongs
+to the worker, so a job is never committed twice, whichever process or node
+runs it.
+
+Status flow: pending_ocr -> processing_ocr -> ocr_complete
+                                           -> pending_ocr (retry with backoff)
+                                           -> ocr_failed (dead-lettered)
+
+Run workers from flask-backend/ (any number, on any node):
+    python jobs.py [--workers 4]
+"""
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+
+import metrics
+import pools
+
+log = logging.getLogger(__name__)
+
+OCR_PROCESSOR = os.environ.get("OCR_PROCESSOR", "stub")
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "2"))
+OCR_LEASE_SECONDS = float(os.environ.get("OCR_LEASE_SECONDS", "300"))
+OCR_MAX_ATTEMPTS = int(os.environ.get("OCR_MAX_ATTEMPTS", "5"))
+OCR_BACKOFF_SECONDS = float(os.environ.get("OCR_BACKOFF_SECONDS", "30"))
+OCR_BACKOFF_MAX_SECONDS = float(os.environ.get("OCR_BACKOFF_MAX_SECONDS", "3600"))
+OCR_POLL_SECONDS = float(os.environ.get("OCR_POLL_SECONDS", "2"))
+
+PENDING, PROCESSING, COMPLETE, FAILED = "pending_ocr", "processing_ocr", "ocr_complete", "ocr_failed"
+
+JOB_RESULTS = metrics.counter(
+    "remedi_ocr_jobs_total", "OCR jobs finished, by outcome.", ("result",),
+)
+JOB_STAGE_SECONDS = metrics.histogram(
+    "remedi_ocr_stage_seconds", "Time spent in each OCR job stage.", ("stage",),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0),
+)
+QUEUE_DEPTH = metrics.gauge(
+    "remedi_ocr_queue_depth", "Prescriptions waiting for OCR, by status.", ("status",),
+)
+
+
+# ---------------- PROCESSORS ----------------
+
+def stub_processor(path: str, file_type: str) -> dict:
+    """Stand-in OCR: reads the file and returns placeholder text."""
+    with open(path, "rb") as f:
+        size = len(f.read())
+    return {"engine": "stub", "text": "", "pages": 1, "bytes": size}
+
+
+def tesseract_processor(path: str, file_type: str) -> dict:
+    import pytesseract
+    from PIL import Image
+
+    if file_type == ".pdf":
+        from pdf2image import convert_from_path
+        pages = convert_from_path(path)
+    else:
+        pages = [Image.open(path)]
+    texts = [pytesseract.image_to_string(page) for page in pages]
+    return {"engine": "tesseract", "text": "\n\f".join(texts), "pages": len(texts)}
+
+
+PROCESSORS: Dict[str, Callable[[str, str], dict]] = {
+    "stub": stub_processor,
+    "tesseract": tesseract_processor,
+}
+
+
+def load_processor(spec: str) -> Callable[[str, str], dict]:
+    """A registered name, or "package.module:function" for a custom processor."""
+    if spec in PROCESSORS:
+        return PROCESSORS[spec]
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"unknown OCR processor: {spec}")
+    return getattr(importlib.import_module(module), name)
+
+
+def run_processor(spec: str, path: str, file_type: str):
+    # Runs in a pool process; returns the result with the time OCR took there.
+    start = time.perf_counter()
+    result = load_processor(spec)(path, file_type)
+    return result, time.perf_counter() - start
+
+
+# ---------------- WORKER ----------------
+
+def backoff_seconds(attempt: int, base: float = OCR_BACKOFF_SECONDS, cap: float = OCR_BACKOFF_MAX_SECONDS) -> float:
+    # Exponential with full jitter, so retries from a failure burst spread out.
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class JobWorker:
+    def __init__(self, collection, dead_letters=None, processor: str = OCR_PROCESSOR, workers: int = OCR_WORKERS,
+                 lease: float = OCR_LEASE_SECONDS, max_attempts: int = OCR_MAX_ATTEMPTS,
+                 poll_interval: float = OCR_POLL_SECONDS, executor=None):
+        self.collection = collection
+        self.dead_letters = dead_letters
+        self.processor = processor
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = executor
+        self._in_flight: Dict[object, Future] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        load_processor(processor)  # fail fast on a bad OCR_PROCESSOR
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index([("status", 1), ("job.next_attempt_at", 1)])
+        self.collection.create_index([("status", 1), ("job.lease_expires", 1)])
+
+    def _now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def _claimable(self, now: datetime) -> dict:
+        return {
+            "metadata.is_deleted": False,
+            "$or": [
+                {"status": PENDING, "job.next_attempt_at": {"$not": {"$gt": now}}},
+                # Lease ran out: the worker holding it died or stalled.
+                {"status": PROCESSING, "job.lease_expires": {"$lt": now}},
+            ],
+        }
+
+    def dead_letter_exhausted(self) -> int:
+        """Dead-letter claimable jobs that have used up their attempts.
+
+        A job whose last attempt never reported back (its process died, or
+        the worker did) is left with an expired lease; claiming it again
+        would run it past OCR_MAX_ATTEMPTS.
+        """
+        now = self._now()
+        exhausted = 0
+        while True:
+            doc = self.collection.find_one_and_update(
+                {**self._claimable(now), "job.attempts": {"$gte": self.max_attempts}},
+                {
+                    "$set": {"status": FAILED, "job.finished_at": now},
+                    "$unset": {"job.lease_owner": "", "job.lease_expires": ""},
+                },
+                projection={"job": 1},
+            )
+            if doc is None:
+                return exhausted
+            job = doc.get("job", {})
+            error = job.get("last_error") or "Lease expired on the last attempt"
+            self._record_dead_letter(doc["_id"], job.get("attempts", self.max_attempts), error, now)
+            exhausted += 1
+
+    def claim(self) -> Optional[dict]:
+        self.dead_letter_exhausted()
+        now = self._now()
+        start = time.perf_counter()
+        doc = self.collection.find_one_and_update(
+            {**self._claimable(now), "job.attempts": {"$not": {"$gte": self.max_attempts}}},
+            {
+                "$set": {
+                    "status": PROCESSING,
+                    "job.lease_owner": self.worker_id,
+                    "job.lease_expires": now + timedelta(seconds=self.lease),
+                    "job.started_at": now,
+                },
+                "$inc": {"job.attempts": 1},
+            },
+            projection={"secure_path": 1, "file_type": 1, "job": 1, "upload_date": 1},
+            sort=[("upload_date", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        JOB_STAGE_SECONDS.observe(time.perf_counter() - start, stage="claim")
+        if doc is not None and doc["job"]["attempts"] == 1 and doc.get("upload_date") is not None:
+            # upload_date is naive UTC, as the upload route writes it.
+            waited = datetime.utcnow() - doc["upload_date"].replace(tzinfo=None)
+            JOB_STAGE_SECONDS.observe(max(waited.total_seconds(), 0.0), stage="queued")
+        return doc
+
+    def _owned(self, job_id) -> dict:
+        return {"_id": job_id, "status": PROCESSING, "job.lease_owner": self.worker_id}
+
+    def renew_leases(self) -> None:
+        with self._lock:
+            job_ids = list(self._in_flight)
+        expires = self._now() + timedelta(seconds=self.lease)
+        for job_id in job_ids:
+            self.collection.update_one(self._owned(job_id), {"$set": {"job.lease_expires": expires}})
+
+    def complete(self, job: dict, result: dict) -> bool:
+        start = time.perf_counter()
+        updated = self.collection.update_one(
+            self._owned(job["_id"]),
+            {
+                "$set": {"status": COMPLETE, "ocr_data": result, "job.finished_at": self._now()},
+                "$unset": {"job.lease_owner": "", "job.lease_expires": "", "job.last_error": ""},
+            },
+        )
+        JOB_STAGE_SECONDS.observe(time.perf_counter() - start, stage="store")
+        if updated.matched_count:
+            JOB_RESULTS.inc(result="complete")
+        else:
+            # Lease lost to another worker; its run owns the result now.
+            JOB_RESULTS.inc(result="lease_lost")
+        return bool(updated.matched_count)
+
+    def fail(self, job: dict, error: str) -> None:
+        attempts = job.get("job", {}).get("attempts", 1)
+        now = self._now()
+        if attempts >= self.max_attempts:
+            updated = self.collection.update_one(
+                self._owned(job["_id"]),
+                {
+                    "$set": {"status": FAILED, "job.last_error": error, "job.finished_at": now},
+                    "$unset": {"job.lease_owner": "", "job.lease_expires": ""},
+                },
+            )
+            if updated.matched_count:
+                self._record_dead_letter(job["_id"], attempts, error, now)
+            return
+
+        self.collection.update_one(
+            self._owned(job["_id"]),
+            {
+                "$set": {
+                    "status": PENDING,
+                    "job.last_error": error,
+                    "job.next_attempt_at": now + timedelta(seconds=backoff_seconds(attempts)),
+                },
+                "$unset": {"job.lease_owner": "", "job.lease_expires": ""},
+            },
+        )
+        JOB_RESULTS.inc(result="retried")
+
+    def _record_dead_letter(self, job_id, attempts: int, error: str, now: datetime) -> None:
+        if self.dead_letters is not None:
+            self.dead_letters.insert_one({
+                "prescription_id": job_id, "attempts": attempts, "error": error, "failed_at": now,
+            })
+        JOB_RESULTS.inc(result="dead_lettered")
+
+    def _executor_or_start(self):
+        with self._lock:
+            if self._executor is None:
+                # Never fork: with OCR_WORKER_IN_APP=1 this is the threaded web process.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(pools.POOL_START_METHOD),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor) -> None:
+        # A pool process died (OOM, segfault): the pool refuses all work from
+        # then on, so the next submit starts a fresh one.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        log.warning("OCR process pool broke; starting a new one")
+        executor.shutdown(wait=False)
+
+    def submit(self, job: dict) -> Optional[Future]:
+        executor = self._executor_or_start()
+        try:
+            future = executor.submit(run_processor, self.processor, job["secure_path"], job.get("file_type", ""))
+        except BrokenProcessPool as e:
+            self._discard_executor(executor)
+            # Already claimed, attempt counted: give it back like any other failure.
+            self.fail(job, f"{type(e).__name__}: {e}")
+            return None
+        with self._lock:
+            self._in_flight[job["_id"]] = future
+        future.add_done_callback(lambda f, job=job, executor=executor: self._finished(job, f, executor))
+        return future
+
+    def _finished(self, job: dict, future: Future, executor=None) -> None:
+        try:
+            result, seconds = future.result()
+            JOB_STAGE_SECONDS.observe(seconds, stage="ocr")
+            self.complete(job, result)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._discard_executor(executor)
+            self.fail(job, f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(job["_id"], None)
+
+    def update_queue_depth(self) -> None:
+        for status in (PENDING, PROCESSING, FAILED):
+            QUEUE_DEPTH.set(self.collection.count_documents({"status": status, "metadata.is_deleted": False}), status=status)
+
+    def run_once(self) -> int:
+        """Claim jobs until the pool is full or the queue is empty."""
+        claimed = 0
+        while not self._stop.is_set():
+            with self._lock:
+                if len(self._in_flight) >= self.workers:
+                    break
+            job = self.claim()
+            if job is None:
+                break
+            if self.submit(job) is None:
+                break
+            claimed += 1
+        return claimed
+
+    def run_forever(self) -> None:
+        self.ensure_indexes()
+        last_renewal = last_depth = 0.0
+        log.info("OCR worker %s started (%d processes, processor %s)", self.worker_id, self.workers, self.processor)
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+                now = time.monotonic()
+                if now - last_renewal >= self.lease / 3:
+                    self.renew_leases()
+                    last_renewal = now
+                if now - last_depth >= self.poll_interval * 5:
+                    self.update_queue_depth()
+                    last_depth = now
+            except Exception:
+                log.exception("OCR worker loop failed")
+                claimed = 0
+            if not claimed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self.run_forever, name="ocr-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        if self._thread is not None and wait:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an OCR job worker.")
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS)
+    parser.add_argument("--processor", default=OCR_PROCESSOR)
+    args = parser.parse_args()
+
+    import observability
+    observability.setup_logging()
+    from dbConnect import db
+
+    worker = JobWorker(db["prescriptions"], db["ocr_dead_letters"], processor=args.processor, workers=args.workers)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
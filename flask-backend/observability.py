@@ -0,0 +1,157 @@
+"""Logging, request timing and slow-request profiles.
+
+Logging goes through a queue: request threads only enqueue records and a
+single listener thread formats and writes them, so a slow stderr or disk
+never stalls a request. Level and destination come from LOG_LEVEL and
+LOG_FILE.
+
+``instrument(app)`` times every request into remedi_request_seconds and
+collects the per-stage times recorded with ``metrics.stage`` (and the
+MongoDB commands, via ``MongoCommandTimer``) while it runs. Requests slower
+than SLOW_REQUEST_SECONDS are logged with that stage breakdown. A
+PROFILE_SAMPLE_RATE fraction of requests also run under cProfile, and the
+slow ones among them are dumped to PROFILE_DIR for ``python -m pstats``.
+"""
+import atexit
+import cProfile
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import monitoring
+
+import metrics
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("LOG_FILE")
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_MAX_DUMPS = int(os.environ.get("PROFILE_MAX_DUMPS", "100"))
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+
+REQUEST_SECONDS = metrics.histogram(
+    "remedi_request_seconds", "HTTP request latency, by route.", ("method", "route", "status"),
+)
+MONGO_COMMAND_SECONDS = metrics.histogram(
+    "remedi_mongo_command_seconds", "MongoDB command latency as seen by the driver.", ("command", "result"),
+    buckets=metrics.STAGE_BUCKETS,
+)
+SLOW_REQUESTS = metrics.counter(
+    "remedi_slow_requests_total", "Requests slower than SLOW_REQUEST_SECONDS, by route.", ("route",),
+)
+
+log = logging.getLogger("remedi.requests")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+_profile_dumps = 0
+
+
+# ---------------- Logging ----------------
+
+def setup_logging(level: str = LOG_LEVEL, filename: Optional[str] = LOG_FILE) -> None:
+    """Route the root logger through a non-blocking queue. Idempotent."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        target = logging.FileHandler(filename) if filename else logging.StreamHandler()
+        target.setFormatter(logging.Formatter(LOG_FORMAT))
+        records: queue.Queue = queue.Queue(-1)
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(logging.handlers.QueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+# ---------------- MongoDB ----------------
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every driver command. Events fire on the thread that issued
+    the command, so the time also lands on the current request's "mongo" stage."""
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name, result="ok")
+        metrics.record_stage("mongo", seconds)
+
+    def failed(self, event) -> None:
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_SECONDS.observe(seconds, command=event.command_name, result="error")
+        metrics.record_stage("mongo", seconds)
+
+
+# ---------------- Requests ----------------
+
+def _dump_profile(profiler: cProfile.Profile, route: str) -> Optional[str]:
+    global _profile_dumps
+    with _lock:
+        if _profile_dumps >= PROFILE_MAX_DUMPS:
+            return None
+        _profile_dumps += 1
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    slug = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "root"
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{slug}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+def instrument(app) -> None:
+    from flask import g, request
+
+    @app.before_request
+    def _start_timing():
+        g.request_started = time.perf_counter()
+        g.stage_token = metrics.begin_request()
+        g.profiler = None
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.profiler = profiler
+            except ValueError:
+                pass  # another profiler is already active on this thread
+
+    @app.after_request
+    def _finish_timing(response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(seconds, method=request.method, route=route, status=str(response.status_code))
+        if seconds >= SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc(route=route)
+            token = g.pop("stage_token", None)
+            stages = metrics.end_request(token) if token is not None else {}
+            breakdown = " ".join(f"{name}={secs * 1000:.1f}ms" for name, secs in sorted(stages.items(), key=lambda kv: -kv[1]))
+            dumped = _dump_profile(profiler, route) if profiler is not None else None
+            log.warning("slow request %s %s %d %.0fms %s%s", request.method, route, response.status_code,
+                        seconds * 1000, breakdown, f" profile={dumped}" if dumped else "")
+        return response
+
+    @app.teardown_request
+    def _reset_stages(_error):
+        token = g.pop("stage_token", None)
+        if token is not None:
+            metrics.end_request(token)
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
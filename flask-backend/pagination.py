@@ -0,0 +1,52 @@
+"""Keyset (cursor) pagination over ``(upload_date, _id)``, newest first.
+
+A page is fetched by seeking past the last row of the previous one rather
+than skipping rows, so page N costs the same as page 1 as long as the query
+is served by an index ending in ``upload_date: -1, _id: -1``. The cursor is
+opaque to clients: "<upload_date in ms>.<_id hex>".
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from bson import ObjectId
+
+KEYSET_SORT = [("upload_date", -1), ("_id", -1)]
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 100
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(doc: dict) -> str:
+    # MongoDB stores datetimes at millisecond precision, so this round-trips exactly.
+    upload_date = doc["upload_date"].replace(tzinfo=None)
+    millis = (upload_date - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}.{doc['_id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Raises ValueError on anything encode_cursor could not have produced."""
+    millis, _, oid = cursor.partition(".")
+    if not ObjectId.is_valid(oid):
+        raise ValueError("invalid cursor")
+    return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(oid)
+
+
+def keyset_filter(query: dict, cursor: Optional[str]) -> dict:
+    """``query`` narrowed to the rows after ``cursor`` in KEYSET_SORT order."""
+    if not cursor:
+        return query
+    upload_date, oid = decode_cursor(cursor)
+    return {
+        **query,
+        "$or": [
+            {"upload_date": {"$lt": upload_date}},
+            {"upload_date": upload_date, "_id": {"$lt": oid}},
+        ],
+    }
+
+
+def page_size(value: Optional[str]) -> int:
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(value), MAX_PAGE_SIZE))
@@ -0,0 +1,62 @@
+"""Password hashing off the request threads.
+
+Hashing and verifying are deliberately slow KDFs, so they run in the
+bounded "password" process pool: a login storm can use at most
+PASSWORD_POOL_SIZE cores and queue PASSWORD_POOL_QUEUE logins, after which
+callers get PoolSaturatedError (a 503 with Retry-After) instead of tying up
+the threads that serve the chatbot.
+
+Hashes record the method they were made with. When PASSWORD_HASH_METHOD
+changes, a successful login returns a fresh hash for the caller to store,
+so users move to the new parameters as they sign in.
+"""
+import os
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import pools
+from metrics import stage
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# 0 hashes on the request thread, as before; kept for comparison and tiny deployments.
+PASSWORD_HASH_OFFLOAD = os.environ.get("PASSWORD_HASH_OFFLOAD", "1") == "1"
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method: str) -> str:
+    # werkzeug fills in defaults (e.g. pbkdf2 iterations), so compare against
+    # what it actually writes rather than the configured string. Once per process.
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def needs_rehash(stored_hash: str, method: str = PASSWORD_HASH_METHOD) -> bool:
+    return stored_hash.split("$", 1)[0] != _method_prefix(method)
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored_hash: str, password: str, method: str) -> Tuple[bool, Optional[str]]:
+    if not check_password_hash(stored_hash, password):
+        return False, None
+    return True, _hash(password, method) if needs_rehash(stored_hash, method) else None
+
+
+def hash_password(password: str) -> str:
+    """Raises PoolSaturatedError when too many hashes are already queued."""
+    with stage("password_hash"):
+        if not PASSWORD_HASH_OFFLOAD:
+            return _hash(password, PASSWORD_HASH_METHOD)
+        return pools.run("password", _hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(stored_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash to store or None). Rehashing happens in the same
+    pool task, so an upgrade costs the login no extra round trip."""
+    with stage("password_hash"):
+        if not PASSWORD_HASH_OFFLOAD:
+            return _verify(stored_hash, password, PASSWORD_HASH_METHOD)
+        return pools.run("password", _verify, stored_hash, password, PASSWORD_HASH_METHOD)
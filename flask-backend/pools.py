@@ -0,0 +1,193 @@
+"""Bounded executors for work that should not run on a request thread.
+
+Each named pool caps both the number of workers and the number of queued
+tasks, so a burst of requests waits in a short queue (or is turned away with
+PoolSaturatedError) instead of piling unbounded work onto the CPU. Sizes come
+from the environment, e.g. INFERENCE_POOL_SIZE / INFERENCE_POOL_QUEUE /
+INFERENCE_POOL_KIND for the "inference" pool.
+"""
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Threads waiting on the batching encoder are cheap, and more concurrent
+# callers means fuller encoder batches, so the default matches its batch size.
+DEFAULT_POOLS = {
+    "inference": {"size": 16, "queue": 256, "kind": "thread"},
+    # KDFs are pure CPU: leave at least half the cores to everything else, and
+    # keep the queue short so a queued login waits seconds, not tens of them.
+    "password": {"size": max(1, (os.cpu_count() or 2) // 2), "queue": 8 * max(1, (os.cpu_count() or 2) // 2),
+                 "kind": "process"},
+}
+POOL_TIMEOUT_SECONDS = float(os.environ.get("POOL_TIMEOUT_SECONDS", "30"))
+# Forking the threaded server can copy a lock some other thread holds into the
+# child; process pools start workers from a clean interpreter instead.
+POOL_START_METHOD = os.environ.get(
+    "POOL_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+POOL_TASKS = metrics.counter(
+    "remedi_pool_tasks_total", "Tasks submitted to bounded pools.", ("pool", "result"),
+)
+POOL_PENDING = metrics.gauge(
+    "remedi_pool_pending", "Tasks queued or running in a bounded pool.", ("pool",),
+)
+POOL_WAIT = metrics.histogram(
+    "remedi_pool_queue_delay_seconds", "Time tasks spend queued before a worker picks them up.", ("pool",),
+)
+
+
+class PoolSaturatedError(Exception):
+    def __init__(self, pool: str, retry_after: int = 1):
+        super().__init__(f"{pool} pool is saturated")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+def _timed_call(name: str, queued_at: float, fn: Callable, args, kwargs):
+    POOL_WAIT.observe(time.perf_counter() - queued_at, pool=name)
+    return fn(*args, **kwargs)
+
+
+class BoundedPool:
+    def __init__(self, name: str, size: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"unknown pool kind: {kind}")
+        self.name = name
+        self.size = size
+        self.max_queue = max_queue
+        self.kind = kind
+        self._slots = threading.BoundedSemaphore(size + max_queue)
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @classmethod
+    def from_env(cls, name: str, size: int, queue: int, kind: str = "thread") -> "BoundedPool":
+        prefix = name.upper()
+        return cls(
+            name,
+            size=int(os.environ.get(f"{prefix}_POOL_SIZE", size)),
+            max_queue=int(os.environ.get(f"{prefix}_POOL_QUEUE", queue)),
+            kind=os.environ.get(f"{prefix}_POOL_KIND", kind),
+        )
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        # Workers open the artifact bundle memory-mapped, so
+                        # each process shares the model pages instead of copying.
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.size, mp_context=multiprocessing.get_context(POOL_START_METHOD),
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f"{self.name}-pool")
+        return self._executor
+
+    def _discard_executor(self, executor: Executor) -> None:
+        # A worker process died (OOM, a signal): the pool refuses all work
+        # from then on, so the next task starts a fresh one.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        log.warning("%s pool broke; starting a new one", self.name)
+        executor.shutdown(wait=False)
+
+    def _submit_process(self, fn: Callable, args, kwargs) -> Future:
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(fn, *args, **kwargs)
+
+        def check_broken(f: Future) -> None:
+            if not f.cancelled() and isinstance(f.exception(), BrokenProcessPool):
+                self._discard_executor(executor)
+
+        future.add_done_callback(check_broken)
+        return future
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            POOL_TASKS.inc(pool=self.name, result="rejected")
+            raise PoolSaturatedError(self.name)
+
+        with self._lock:
+            self._pending += 1
+            POOL_PENDING.set(self._pending, pool=self.name)
+        try:
+            if self.kind == "process":
+                future = self._submit_process(fn, args, kwargs)
+            else:
+                # In the caller's context, so stage timings land on the request that queued the task.
+                future = self._get_executor().submit(
+                    contextvars.copy_context().run, _timed_call, self.name, time.perf_counter(), fn, args, kwargs,
+                )
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        POOL_TASKS.inc(pool=self.name, result="submitted")
+        return future
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+            POOL_PENDING.set(self._pending, pool=self.name)
+        self._slots.release()
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Run ``fn`` on the pool and block until it finishes."""
+        try:
+            return self.submit(fn, *args, **kwargs).result(timeout=POOL_TIMEOUT_SECONDS)
+        except BrokenProcessPool:
+            # Its worker died with the task; run it once more on a new pool.
+            POOL_TASKS.inc(pool=self.name, result="retried")
+            return self.submit(fn, *args, **kwargs).result(timeout=POOL_TIMEOUT_SECONDS)
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+_pools: Dict[str, BoundedPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get(name: str) -> BoundedPool:
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                defaults = DEFAULT_POOLS.get(name, {"size": os.cpu_count() or 1, "queue": 64})
+                pool = _pools[name] = BoundedPool.from_env(name, **defaults)
+    return pool
+
+
+def run(name: str, fn: Callable, *args, **kwargs):
+    return get(name).run(fn, *args, **kwargs)
+
+
+def shutdown(wait: bool = True) -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.shutdown(wait=wait)
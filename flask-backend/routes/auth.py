@@ -1,9 +1,13 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from bson import ObjectId
 import dbConnect
-from utils import decode_jwt, generate_jwt
+import jwt
+from pymongo.errors import DuplicateKeyError
+from utils import generate_jwt
+import passwords
+from pools import PoolSaturatedError
+import auth_cache
 
 auth_bp = Blueprint('auth', __name__)
 users_collection = dbConnect.users_collection
@@ -12,21 +16,25 @@ users_collection = dbConnect.users_collection
 def auth_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        token = request.headers.get("Authorization")
+        token = auth_cache.bearer_token(request.headers.get("Authorization"))
         if not token:
             return jsonify({"msg": "Token missing"}), 401
 
-        if token.startswith("Bearer "):
-            token = token[7:]
-
-        payload = decode_jwt(token)
-        if not payload:
+        try:
+            payload = auth_cache.verify_token(token)
+        except jwt.InvalidTokenError:
             return jsonify({"msg": "Invalid or expired token"}), 401
 
         return f(payload["user_id"], *args, **kwargs)
     return wrapper
 
 
+def busy_response(error: PoolSaturatedError):
+    return jsonify({
+        "msg": "Too many sign-ins right now. Please try again shortly."
+    }), 503, {"Retry-After": str(error.retry_after)}
+
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     try:
@@ -53,10 +61,10 @@ def signup():
         except:
             return jsonify({"msg": "Invalid age"}), 400
 
-        if users_collection.find_one({"email": email}):
+        if users_collection.find_one({"email": email}, {"_id": 1}):
             return jsonify({"msg": "Email already exists"}), 409
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = passwords.hash_password(password)
 
         user_doc = {
             "name": name,
@@ -68,7 +76,11 @@ def signup():
             "medications": ""
         }
 
-        result = users_collection.insert_one(user_doc)
+        try:
+            result = users_collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            # Lost a race with a concurrent signup for the same email.
+            return jsonify({"msg": "Email already exists"}), 409
         user_id = result.inserted_id
 
         token = generate_jwt(user_id, email)
@@ -85,6 +97,8 @@ def signup():
             }
         }), 201
 
+    except PoolSaturatedError as e:
+        return busy_response(e)
     except:
         return jsonify({"msg": "Server error"}), 500
 
@@ -102,9 +116,22 @@ def login():
         if not email or not password:
             return jsonify({"msg": "Email and password required"}), 400
 
-        user = users_collection.find_one({"email": email})
-        if not user or not check_password_hash(user["password"], password):
+        user = users_collection.find_one(
+            {"email": email},
+            {"password": 1, "name": 1, "email": 1, "age": 1, "gender": 1}
+        )
+        if not user:
+            return jsonify({"msg": "Invalid email or password"}), 401
+
+        matches, new_hash = passwords.verify_password(user["password"], password)
+        if not matches:
             return jsonify({"msg": "Invalid email or password"}), 401
+        if new_hash:
+            # Hash parameters changed since this one was made; upgrade it now.
+            users_collection.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": new_hash}}
+            )
 
         token = generate_jwt(user["_id"], user["email"])
 
@@ -120,6 +147,8 @@ def login():
             }
         }), 200
 
+    except PoolSaturatedError as e:
+        return busy_response(e)
     except:
         return jsonify({"msg": "Server error"}), 500
 
@@ -128,7 +157,10 @@ def login():
 @auth_required
 def get_profile(user_id):
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        user = users_collection.find_one(
+            {"_id": ObjectId(user_id)},
+            {"name": 1, "email": 1, "age": 1, "gender": 1, "ailments": 1, "medications": 1}
+        )
         if not user:
             return jsonify({"msg": "User not found"}), 404
 
@@ -187,6 +219,7 @@ def update_profile(user_id):
             {"_id": ObjectId(user_id)},
             {"$set": update_fields}
         )
+        auth_cache.invalidate_user(user_id)
 
         return jsonify({"msg": "Profile updated"}), 200
 
@@ -1,13 +1,88 @@
 from flask import Blueprint, request, jsonify
 from routes.auth import auth_required
 from chatbot import sym_utils as s
+from chatbot.sessions import SessionStore, SessionLimitError, MongoSessionPersistence
+from functools import wraps
 from typing import Dict, List
+import logging
+import os
+import dbConnect
+import pools
+from admission import AdmissionController, AdmissionRejected, CHATBOT_ADMISSION
+from pools import PoolSaturatedError
 
 chatbot_bp = Blueprint('chatbot', __name__)
+log = logging.getLogger(__name__)
+
+MAX_PREDICT_BATCH = 10000
+
+session_store = SessionStore(
+    lambda: s.registry.get("mi_engine"),
+    persistence=MongoSessionPersistence(dbConnect.db['chat_sessions'])
+    if os.environ.get("CHAT_SESSION_PERSIST", "1") == "1" else None,
+    selector=(lambda: s.registry.get("info_gain")) if s.QUESTION_SELECTOR == "info_gain" else None,
+)
+
+admission = AdmissionController.from_env("chatbot") if CHATBOT_ADMISSION else None
+
+
+def busy_response(error: PoolSaturatedError):
+    return jsonify({
+        "message": "The chatbot is busy. Please try again shortly."
+    }), 503, {"Retry-After": str(error.retry_after)}
+
+
+def shed_response(error: AdmissionRejected):
+    message = ("Too many requests from you at once. Please wait for the previous ones."
+               if error.status == 429 else "The chatbot is busy. Please try again shortly.")
+    return jsonify({"message": message}), error.status, {"Retry-After": str(error.retry_after)}
+
+
+def admitted(f):
+    # Below auth_required, so requests are queued and limited per user_id.
+    if admission is None:
+        return f
+
+    @wraps(f)
+    def wrapper(user_id, *args, **kwargs):
+        try:
+            with admission.admit(user_id):
+                return f(user_id, *args, **kwargs)
+        except AdmissionRejected as e:
+            return shed_response(e)
+    return wrapper
+
+
+def next_step_response(next_symptom, confirmed_symptoms, denied_symptoms=(), **extra):
+    # Termination case → predict disease
+    if not next_symptom:
+        # Sets seen before are answered from the prediction cache without a trip to the pool.
+        ranked = (s.cached_diagnosis(confirmed_symptoms, denied_symptoms)
+                  or pools.run("inference", s.diagnose_top, confirmed_symptoms, list(denied_symptoms)))
+        predicted_disease = ranked[0][0]
+        return {
+            "message": f"Based on your confirmed symptoms, I predict: {predicted_disease}.",
+            "next_symptom": None,
+            "predicted_disease": predicted_disease,
+            "top_predictions": [{"disease": disease, "probability": round(p, 4)} for disease, p in ranked],
+            **extra
+        }
+
+    # Continue questioning
+    return {
+        "next_symptom": next_symptom,
+        "suggestion_score": 1.0,
+        "message": f"Do you experience '{next_symptom.replace('_', ' ')}'?",
+        "description": s.symptom_descriptions.get(
+            next_symptom, "No description available."
+        ),
+        **extra
+    }
 
 # ---------------- INITIAL SYMPTOMS ----------------
 @chatbot_bp.route('/extract_symptoms/initial', methods=['POST'])
 @auth_required
+@admitted
 def extract_initial_symptoms(email):
     try:
         data = request.get_json()
@@ -19,7 +94,7 @@ def extract_initial_symptoms(email):
             }), 400
 
         # Get top symptom candidates
-        symptom_candidates = s.hybrid_symptom_match(user_text, top_k=5)
+        symptom_candidates = pools.run("inference", s.hybrid_symptom_match, user_text, top_k=5)
 
         # Prepare descriptions
         symptom_descriptions = {sym: s.symptom_descriptions.get(sym, "No description available")
@@ -32,15 +107,17 @@ def extract_initial_symptoms(email):
                         if symptom_candidates else "No symptoms found. Please describe your symptoms differently."
         })
 
+    except PoolSaturatedError as e:
+        return busy_response(e)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Chatbot request failed")
         return jsonify({"error": f"{type(e).__name__}: {str(e)}"}), 500
 
 
 # ---------------- NEXT SYMPTOM ----------------
 @chatbot_bp.route('/extract_symptoms/next', methods=['POST'])
 @auth_required
+@admitted
 def extract_next_symptom(email):
     try:
         data = request.get_json()
@@ -57,32 +134,149 @@ def extract_next_symptom(email):
             symptom_weights=symptom_weights,
             asked_symptoms=asked_symptoms
         )
-        # Termination case → predict disease
-        if not next_symptom:
-            confirmed_symptoms = list(symptom_weights.keys())
-            all_symptoms = s.rf_model.feature_names_in_
-            vector = [1 if sym in confirmed_symptoms else 0 for sym in all_symptoms]
-            predicted_disease = s.rf_model.predict([vector])[0]
+        denied_symptoms = [sym for sym, v in symptom_state.items() if v != 1]
+        return jsonify(next_step_response(next_symptom, list(symptom_weights.keys()), denied_symptoms))
+
+    except PoolSaturatedError as e:
+        return busy_response(e)
+    except Exception as e:
+        log.exception("Chatbot request failed")
+        return jsonify({
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+
+
+# ---------------- CONVERSATION SESSIONS ----------------
+def parse_answers(data):
+    # One answer ({symptom, present}) or several ({answers: {symptom: 0|1}}).
+    answers = data.get("answers")
+    if answers is None and "symptom" in data:
+        answers = {data["symptom"]: data.get("present", 0)}
+    if not isinstance(answers, dict):
+        return None
+    return {str(symptom): 1 if present == 1 else 0 for symptom, present in answers.items()}
+
+
+@chatbot_bp.route('/session', methods=['POST'])
+@auth_required
+@admitted
+def create_session(user_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        answers = parse_answers(data) if data else {}
+        if answers is None:
+            return jsonify({
+                "message": "answers must map symptoms to 0 or 1."
+            }), 400
+
+        try:
+            session = session_store.create(user_id)
+        except SessionLimitError:
+            return jsonify({
+                "message": "The chatbot is busy. Please try again shortly."
+            }), 429
+
+        if not answers:
+            return jsonify({"session_id": session.id, "next_symptom": None}), 201
+
+        with session.lock:
+            for symptom, present in answers.items():
+                session.answer(symptom, present)
+            response = next_step_response(session.next_question(), session.confirmed, session.denied,
+                                          session_id=session.id)
+
+        session_store.mark_dirty(session)
+        return jsonify(response), 201
+
+    except PoolSaturatedError as e:
+        return busy_response(e)
+    except Exception as e:
+        log.exception("Chatbot request failed")
+        return jsonify({
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+
+
+@chatbot_bp.route('/session/<session_id>/answer', methods=['POST'])
+@auth_required
+@admitted
+def answer_session(user_id, session_id):
+    try:
+        answers = parse_answers(request.get_json(silent=True) or {})
+        if answers is None:
+            return jsonify({
+                "message": "Send {symptom, present} or answers: {symptom: 0|1}."
+            }), 400
+
+        try:
+            session = session_store.get(session_id, user_id)
+        except SessionLimitError:
+            return jsonify({
+                "message": "The chatbot is busy. Please try again shortly."
+            }), 429
+        if session is None:
+            return jsonify({"message": "Session not found or expired."}), 404
+
+        with session.lock:
+            for symptom, present in answers.items():
+                session.answer(symptom, present)
+            response = next_step_response(session.next_question(), session.confirmed, session.denied,
+                                          session_id=session.id)
+
+        session_store.mark_dirty(session)
+        return jsonify(response)
+
+    except PoolSaturatedError as e:
+        return busy_response(e)
+    except Exception as e:
+        log.exception("Chatbot request failed")
+        return jsonify({
+            "error": f"{type(e).__name__}: {str(e)}"
+        }), 500
+
+
+@chatbot_bp.route('/session/<session_id>', methods=['DELETE'])
+@auth_required
+def end_session(user_id, session_id):
+    try:
+        session = session_store.get(session_id, user_id)
+    except SessionLimitError:
+        return jsonify({
+            "message": "The chatbot is busy. Please try again shortly."
+        }), 429
+    if session is None:
+        return jsonify({"message": "Session not found or expired."}), 404
+    session_store.end(session_id)
+    return jsonify({"message": "Session ended"}), 200
 
+
+# ---------------- BATCH PREDICTION ----------------
+@chatbot_bp.route('/predict_batch', methods=['POST'])
+@auth_required
+@admitted
+def predict_batch(email):
+    try:
+        data = request.get_json() or {}
+        symptom_sets = data.get("symptom_sets")
+
+        if not isinstance(symptom_sets, list) or not all(isinstance(x, list) for x in symptom_sets):
             return jsonify({
-                "message": f"Based on your confirmed symptoms, I predict: {predicted_disease}.",
-                "next_symptom": None,
-                "predicted_disease": predicted_disease
-            })
+                "message": "symptom_sets must be a list of symptom lists."
+            }), 400
+
+        if len(symptom_sets) > MAX_PREDICT_BATCH:
+            return jsonify({
+                "message": f"At most {MAX_PREDICT_BATCH} symptom sets per request."
+            }), 400
 
-        # Continue questioning
         return jsonify({
-            "next_symptom": next_symptom,
-            "suggestion_score": 1.0,
-            "message": f"Do you experience '{next_symptom.replace('_', ' ')}'?",
-            "description": s.symptom_descriptions.get(
-                next_symptom, "No description available."
-            )
+            "predictions": pools.run("inference", s.predict_batch, symptom_sets) if symptom_sets else []
         })
 
+    except PoolSaturatedError as e:
+        return busy_response(e)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Chatbot request failed")
         return jsonify({
             "error": f"{type(e).__name__}: {str(e)}"
         }), 500
@@ -1,16 +1,24 @@
-from flask import Blueprint, request, jsonify, send_file, abort
+from flask import Blueprint, request, jsonify
 from functools import wraps
 from datetime import datetime
 from bson import ObjectId
+from bson.errors import InvalidId
 import os
-import hashlib
-import secrets
+import mimetypes
+import logging
 import jwt
 from flask_cors import CORS
 
 from dbConnect import db, users_collection
+from auth_cache import verify_token, get_user
+from storage import BlobStore, UploadRejected, ingest_multipart, is_sha256, MAX_FORM_FIELD_BYTES
+from pagination import KEYSET_SORT, encode_cursor, keyset_filter, page_size
+from metrics import stage
+from file_serving import ThumbnailCache, send_stored_file
+from upload_sessions import UploadSessionStore, UPLOAD_MIN_CHUNK_BYTES, UPLOAD_MAX_CHUNK_BYTES
 
 upload_bp = Blueprint('upload', __name__)
+log = logging.getLogger(__name__)
 CORS(upload_bp, supports_credentials=True)
 
 prescriptions_collection = db['prescriptions']
@@ -18,9 +26,20 @@ prescriptions_collection = db['prescriptions']
 UPLOAD_DIR = "secure_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Files are stored once per content hash and shared between prescriptions.
+blob_store = BlobStore(os.path.join(UPLOAD_DIR, "blobs"), db['blobs'])
+# Listing previews, one per file content; dropped with the blob.
+thumbnails = ThumbnailCache(os.path.join(UPLOAD_DIR, "thumbnails"))
+blob_store.reclaim_hooks.append(thumbnails.discard)
+
 MAX_FILE_SIZE = 10 * 1024 * 1024
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.pdf'}
-JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")
+
+# Chunked, resumable uploads of one or more files; see upload_sessions.
+upload_sessions = UploadSessionStore(os.path.join(UPLOAD_DIR, "sessions"), db['upload_sessions'],
+                                     blob_store, MAX_FILE_SIZE, ALLOWED_EXTENSIONS)
+LISTING_PROJECTION = {"original_filename": 1, "upload_date": 1, "status": 1, "file_size": 1, "file_type": 1}
+FILE_PROJECTION = {"secure_path": 1, "file_type": 1, "file_hash": 1}
 
 
 # ---------------- AUTH DECORATOR ----------------
@@ -42,9 +61,8 @@ def token_required(f):
             return jsonify({'message': 'Token is missing'}), 401
 
         try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            user_id = data['user_id']
-            current_user = users_collection.find_one({"_id": ObjectId(user_id)})
+            data = verify_token(token)
+            current_user = get_user(data['user_id'], users_collection)
             if not current_user:
                 return jsonify({'message': 'User not found'}), 401
 
@@ -59,25 +77,67 @@ def token_required(f):
     return decorated
 
 
-# ---------------- HELPERS ----------------
+def token_user_id(f):
+    """Like token_required but passes only the token's user id, without the
+    user lookup: for upload chunks, whose session was created (and will be
+    finalized) by a request that did the full check."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        try:
+            token = request.headers['Authorization'].split(" ")[1]
+        except (KeyError, IndexError):
+            return jsonify({'message': 'Token is missing'}), 401
+        try:
+            user_id = ObjectId(verify_token(token)['user_id'])
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Token has expired'}), 401
+        except Exception:
+            return jsonify({'message': 'Token is invalid'}), 401
+        return f(user_id, *args, **kwargs)
+    return decorated
 
-def allowed_file(filename):
-    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_secure_filename(user_id, original_filename):
-    ext = os.path.splitext(original_filename)[1].lower()
-    random_name = secrets.token_urlsafe(32)
-    user_hash = hashlib.sha256(user_id.encode()).hexdigest()[:16]
-    user_folder = os.path.join(UPLOAD_DIR, user_hash)
-    os.makedirs(user_folder, exist_ok=True)
-    return os.path.join(user_folder, f"{random_name}{ext}")
+# ---------------- HELPERS ----------------
 
-def get_file_hash(file_path):
-    sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for block in iter(lambda: f.read(4096), b""):
-            sha256.update(block)
-    return sha256.hexdigest()
+def file_mimetype(prescription):
+    # From the validated extension, never the client-supplied content type;
+    # blob paths have no extension for send_file to guess from.
+    return mimetypes.guess_type(f"file{prescription.get('file_type', '')}")[0] or "application/octet-stream"
+
+def find_own_prescription(current_user, prescription_id, projection):
+    try:
+        prescription_id = ObjectId(prescription_id)
+    except (InvalidId, TypeError):
+        return None
+    return prescriptions_collection.find_one(
+        {"_id": prescription_id, "user_id": current_user["_id"], "metadata.is_deleted": False},
+        projection,
+    )
+
+def prescription_doc(user_id, stored, secure_path):
+    return {
+        "user_id": user_id,
+        "original_filename": stored.filename,
+        "secure_path": secure_path,
+        "blob_id": stored.sha256,
+        "file_hash": stored.sha256,
+        "file_size": stored.size,
+        "file_type": stored.extension,
+        "upload_date": datetime.utcnow(),
+        "status": "pending_ocr",
+        "ocr_data": None,
+        "metadata": {"content_type": stored.content_type, "is_deleted": False}
+    }
+
+def session_response(session):
+    return {
+        "session_id": str(session["_id"]),
+        "state": session["state"],
+        "expires_at": session["expires_at"].isoformat(),
+        "min_chunk_bytes": UPLOAD_MIN_CHUNK_BYTES,
+        "max_chunk_bytes": UPLOAD_MAX_CHUNK_BYTES,
+        "files": upload_sessions.progress(session),
+    }
 
 
 # ---------------- ROUTES ----------------
@@ -88,65 +148,164 @@ def upload_prescription(current_user):
     if request.method == 'OPTIONS':
         return jsonify({"message": "CORS OK"}), 200
 
-    if 'file' not in request.files:
-        return jsonify({'message': 'No file provided'}), 400
-
-    file = request.files['file']
-    if file.filename == '' or not allowed_file(file.filename):
-        return jsonify({'message': 'Invalid or missing file'}), 400
-
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)
-
-    if file_size == 0:
-        return jsonify({'message': 'File is empty'}), 400
-    if file_size > MAX_FILE_SIZE:
+    # Multipart headers and boundaries add a little on top of the file itself.
+    if request.content_length and request.content_length > MAX_FILE_SIZE + MAX_FORM_FIELD_BYTES:
         return jsonify({'message': 'File too large'}), 400
 
+    # A client that already knows the file's hash lets us skip writing
+    # content we have; the bytes are still hashed to prove it has them.
+    expected_hash = (request.headers.get('X-Content-SHA256') or '').strip().lower() or None
+    if expected_hash and not is_sha256(expected_hash):
+        return jsonify({'message': 'Invalid X-Content-SHA256 header'}), 400
+
+    user_id = str(current_user["_id"])
     try:
-        user_id = str(current_user["_id"])
-        secure_path = generate_secure_filename(user_id, file.filename)
-
-        file.save(secure_path)
-        file_hash = get_file_hash(secure_path)
-
-        doc = {
-            "user_id": ObjectId(user_id),
-            "original_filename": file.filename,
-            "secure_path": secure_path,
-            "file_hash": file_hash,
-            "file_size": file_size,
-            "file_type": os.path.splitext(file.filename)[1].lower(),
-            "upload_date": datetime.utcnow(),
-            "status": "pending_ocr",
-            "ocr_data": None,
-            "metadata": {"content_type": file.content_type, "is_deleted": False}
-        }
+        hash_only = expected_hash is not None and blob_store.exists(expected_hash)
+        # One pass over the body: validated, hashed and (unless known) written as it arrives.
+        with stage("upload_ingest"):
+            stored = ingest_multipart(
+                request.stream, request.content_type, field='file',
+                allowed_extensions=ALLOWED_EXTENSIONS,
+                open_writer=lambda ext: blob_store.writer(ext, MAX_FILE_SIZE, hash_only=hash_only),
+            )
+        if expected_hash and stored.sha256 != expected_hash:
+            stored.discard()
+            return jsonify({'message': 'File content does not match X-Content-SHA256'}), 400
+        with stage("blob_put"):
+            secure_path = blob_store.put(stored)
+    except UploadRejected as e:
+        return jsonify({'message': e.message}), e.status
+    except Exception as e:
+        return jsonify({'message': f'Upload failed: {str(e)}'}), 500
 
+    try:
+        doc = prescription_doc(ObjectId(user_id), stored, secure_path)
         result = prescriptions_collection.insert_one(doc)
 
         return jsonify({
             "message": "Prescription uploaded successfully",
             "prescription_id": str(result.inserted_id),
-            "filename": file.filename,
+            "filename": stored.filename,
             "upload_date": doc["upload_date"].isoformat(),
             "status": "pending_ocr"
         }), 201
 
     except Exception as e:
-        if os.path.exists(secure_path):
-            os.remove(secure_path)
+        blob_store.release(stored.sha256)
+        return jsonify({'message': f'Upload failed: {str(e)}'}), 500
+
+
+# ---------------- UPLOAD SESSIONS ----------------
+# Create with the files' names and sizes, PUT each file's chunks at
+# ?offset= in any order, GET to see what is still missing after an
+# interruption, then finalize with each file's SHA-256.
+
+@upload_bp.route('/sessions', methods=['POST', 'OPTIONS'])
+@token_required
+def create_upload_session(current_user):
+    body = request.get_json(silent=True) or {}
+    try:
+        session = upload_sessions.create(current_user["_id"], body.get("files"))
+    except UploadRejected as e:
+        return jsonify({'message': e.message}), e.status
+    except Exception as e:
         return jsonify({'message': f'Upload failed: {str(e)}'}), 500
+    return jsonify(session_response(session)), 201
+
+
+@upload_bp.route('/sessions/<session_id>', methods=['GET'])
+@token_required
+def get_upload_session(current_user, session_id):
+    session_oid = upload_sessions.parse_id(session_id)
+    session = upload_sessions.get(session_oid, current_user["_id"]) if session_oid else None
+    if not session:
+        return jsonify({'message': 'Upload session not found'}), 404
+    return jsonify(session_response(session)), 200
+
+
+@upload_bp.route('/sessions/<session_id>/files/<int:index>', methods=['PUT'])
+@token_user_id
+def put_upload_chunk(user_id, session_id, index):
+    # The hot path: a cached token check, a cached session layout, the
+    # write, and one update committing the range.
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'message': 'offset is required'}), 400
+    if request.content_length is None:
+        return jsonify({'message': 'Content-Length is required'}), 411
+
+    session_oid = upload_sessions.parse_id(session_id)
+    session = upload_sessions.layout(session_oid, user_id) if session_oid else None
+    if not session:
+        return jsonify({'message': 'Upload session not found'}), 404
+    try:
+        received = upload_sessions.write_chunk(session, index, offset, request.content_length, request.stream.read)
+    except UploadRejected as e:
+        return jsonify({'message': e.message}), e.status
+    except Exception as e:
+        return jsonify({'message': f'Upload failed: {str(e)}'}), 500
+    return jsonify({"index": index, "offset": offset, "received": received}), 200
+
+
+@upload_bp.route('/sessions/<session_id>/finalize', methods=['POST'])
+@token_required
+def finalize_upload_session(current_user, session_id):
+    session_oid = upload_sessions.parse_id(session_id)
+    if not session_oid:
+        return jsonify({'message': 'Upload session not found'}), 404
+    # Optional here if given at creation: {"sha256": {"0": "<hex>", ...}}
+    hashes = (request.get_json(silent=True) or {}).get("sha256") or {}
+    try:
+        hashes = {int(k): str(v).strip().lower() for k, v in hashes.items()}
+    except (AttributeError, ValueError):
+        return jsonify({'message': 'sha256 must map file indexes to hashes'}), 400
+
+    user_id = current_user["_id"]
+    try:
+        with stage("upload_finalize"):
+            ids = upload_sessions.finalize(
+                session_oid, user_id, hashes,
+                make_doc=lambda stored, path: prescription_doc(user_id, stored, path),
+                # One round trip for every file in the session.
+                insert_many=lambda docs: prescriptions_collection.insert_many(docs).inserted_ids,
+            )
+    except UploadRejected as e:
+        return jsonify({'message': e.message, 'file_index': getattr(e, 'file_index', None)}), e.status
+    except Exception as e:
+        return jsonify({'message': f'Upload failed: {str(e)}'}), 500
+
+    return jsonify({
+        "message": "Prescriptions uploaded successfully",
+        "prescription_ids": [str(i) for i in ids],
+        "status": "pending_ocr"
+    }), 201
+
+
+@upload_bp.route('/sessions/<session_id>', methods=['DELETE'])
+@token_required
+def cancel_upload_session(current_user, session_id):
+    session_oid = upload_sessions.parse_id(session_id)
+    if not session_oid or not upload_sessions.cancel(session_oid, current_user["_id"]):
+        return jsonify({'message': 'Upload session not found or no longer open'}), 404
+    return jsonify({"message": "Upload session cancelled"}), 200
 
 
 @upload_bp.route('/prescriptions', methods=['GET'])
 @token_required
 def get_user_prescriptions(current_user):
-    prescriptions = prescriptions_collection.find({
-        "user_id": current_user["_id"],
-        "metadata.is_deleted": False
-    }).sort("upload_date", -1).limit(100)
+    # Keyset pagination: ?cursor= is the next_cursor of the previous page, so
+    # every page is an index seek whatever its depth.
+    try:
+        limit = page_size(request.args.get('limit'))
+        query = keyset_filter(
+            {"user_id": current_user["_id"], "metadata.is_deleted": False},
+            request.args.get('cursor'),
+        )
+    except ValueError:
+        return jsonify({'message': 'Invalid limit or cursor'}), 400
+
+    prescriptions = list(prescriptions_collection.find(query, LISTING_PROJECTION).sort(KEYSET_SORT).limit(limit))
 
     return jsonify({
         "prescriptions": [
@@ -156,13 +315,48 @@ def get_user_prescriptions(current_user):
                 "upload_date": p["upload_date"].isoformat(),
                 "status": p["status"],
                 "file_size": p["file_size"],
-                "file_type": p["file_type"]
+                "file_type": p["file_type"],
+                "thumbnail_url": f"/upload/prescriptions/{p['_id']}/thumbnail"
+                if ThumbnailCache.supports(p["file_type"]) else None
             }
             for p in prescriptions
-        ]
+        ],
+        "next_cursor": encode_cursor(prescriptions[-1]) if len(prescriptions) == limit else None
     }), 200
 
 
+@upload_bp.route('/prescriptions/<prescription_id>/status', methods=['GET'])
+@token_required
+def get_prescription_status(current_user, prescription_id):
+    # Cheap enough to poll: one _id lookup returning only the job fields.
+    projection = {"status": 1, "job.attempts": 1, "job.next_attempt_at": 1, "job.last_error": 1}
+    if request.args.get("include") == "ocr_data":
+        projection["ocr_data"] = 1
+    try:
+        prescription = prescriptions_collection.find_one(
+            {"_id": ObjectId(prescription_id), "user_id": current_user["_id"], "metadata.is_deleted": False},
+            projection,
+        )
+    except Exception:
+        prescription = None
+    if not prescription:
+        return jsonify({'message': 'Prescription not found'}), 404
+
+    job = prescription.get("job") or {}
+    response = {
+        "id": prescription_id,
+        "status": prescription["status"],
+        "attempts": job.get("attempts", 0),
+    }
+    if job.get("next_attempt_at"):
+        response["next_attempt_at"] = job["next_attempt_at"].isoformat()
+    if prescription["status"] == "ocr_failed":
+        response["error"] = job.get("last_error")
+    if "ocr_data" in prescription:
+        response["ocr_data"] = prescription["ocr_data"]
+    return jsonify(response), 200
+
+
 @upload_bp.route('/prescriptions/<prescription_id>', methods=['DELETE'])
 @token_required
 def delete_prescription(current_user, prescription_id):
@@ -170,27 +364,31 @@ def delete_prescription(current_user, prescription_id):
         prescription = prescriptions_collection.find_one({
             "_id": ObjectId(prescription_id),
             "user_id": current_user["_id"]
-        })
+        }, {"blob_id": 1, "secure_path": 1})
 
         if not prescription:
             return jsonify({'message': 'Prescription not found'}), 404
         
-        # Soft delete metadata
-        prescriptions_collection.update_one(
-            {"_id": ObjectId(prescription_id)},
+        # Soft delete metadata; only the request that flips the flag releases the file
+        result = prescriptions_collection.update_one(
+            {"_id": ObjectId(prescription_id), "metadata.is_deleted": False},
             {"$set": {
                 "metadata.is_deleted": True,
                 "metadata.deleted_at": datetime.utcnow()
             }}
         )
 
-        # Delete file if exists
-        file_path = prescription.get("secure_path")
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                print("File delete failed:", e)
+        if result.modified_count and prescription.get("blob_id"):
+            # Shared blob: drop our reference, the GC deletes it once unused
+            blob_store.release(prescription["blob_id"])
+        elif result.modified_count:
+            # Delete file if exists
+            file_path = prescription.get("secure_path")
+            if file_path and os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    log.exception("File delete failed")
 
         return jsonify({"message": "Prescription deleted successfully"}), 200
 
@@ -199,24 +397,44 @@ def delete_prescription(current_user, prescription_id):
 
 
 # ---------------- FILE SERVING ----------------
+# Conditional and range requests are answered from the stored hash and the
+# file itself; see file_serving for the front-server offload.
 @upload_bp.route('/prescriptions/<prescription_id>/file', methods=['GET'])
 @token_required
 def serve_prescription_file(current_user, prescription_id):
     try:
-        prescription = prescriptions_collection.find_one({
-            "_id": ObjectId(prescription_id),
-            "user_id": current_user["_id"],
-            "metadata.is_deleted": False
-        })
-
+        prescription = find_own_prescription(current_user, prescription_id, FILE_PROJECTION)
         if not prescription:
-            return abort(404)
+            return jsonify({'message': 'Prescription not found'}), 404
 
         file_path = prescription.get("secure_path")
         if not file_path or not os.path.exists(file_path):
-            return abort(404)
+            return jsonify({'message': 'File not found'}), 404
+
+        return send_stored_file(file_path, UPLOAD_DIR, file_mimetype(prescription), etag=prescription.get("file_hash"))
+
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+
+@upload_bp.route('/prescriptions/<prescription_id>/thumbnail', methods=['GET'])
+@token_required
+def serve_prescription_thumbnail(current_user, prescription_id):
+    try:
+        prescription = find_own_prescription(current_user, prescription_id, FILE_PROJECTION)
+        if not prescription:
+            return jsonify({'message': 'Prescription not found'}), 404
+
+        file_hash = prescription.get("file_hash")
+        file_path = prescription.get("secure_path")
+        if not file_hash or not file_path or not os.path.exists(file_path):
+            return jsonify({'message': 'No preview available'}), 404
+
+        thumbnail = thumbnails.get(file_hash, file_path, prescription.get("file_type", ""))
+        if thumbnail is None:
+            return jsonify({'message': 'No preview available'}), 404
+
+        return send_stored_file(thumbnail, UPLOAD_DIR, "image/jpeg", etag=f"{file_hash}-{thumbnails.size}")
 
-        return send_file(file_path, as_attachment=False)
-    
     except Exception as e:
         return jsonify({'message': str(e)}), 500
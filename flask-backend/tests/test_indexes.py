@@ -0,0 +1,80 @@
+"""Query plans of the hot queries, against a real mongod.
+
+mongomock cannot explain queries, so these are skipped unless a server
+answers at TEST_MONGO_URI (default mongodb://localhost:27017). Each run uses
+a throwaway database. Run from flask-backend/:
+    python -m pytest tests
+"""
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from indexes import _stages, ensure_indexes, verify_indexes  # noqa: E402
+from pagination import KEYSET_SORT, encode_cursor, keyset_filter  # noqa: E402
+
+TEST_MONGO_URI = os.environ.get("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="module")
+def db():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod at {TEST_MONGO_URI}")
+    name = f"remedi_test_{uuid.uuid4().hex[:8]}"
+    try:
+        yield client[name]
+    finally:
+        client.drop_database(name)
+        client.close()
+
+
+@pytest.fixture(scope="module")
+def prescriptions(db):
+    assert ensure_indexes(db) == []
+    # Enough users and rows that a collection scan would not win on cost.
+    start = datetime(2024, 1, 1)
+    users = [ObjectId() for _ in range(20)]
+    db["prescriptions"].insert_many([
+        {"user_id": users[i % len(users)], "metadata": {"is_deleted": i % 7 == 0},
+         "upload_date": start + timedelta(minutes=i // 3), "status": "pending_ocr"}
+        for i in range(2000)
+    ])
+    return db["prescriptions"], users[0]
+
+
+def plan_stages(cursor):
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    return {stage["stage"] for stage in _stages(plan.get("queryPlan", plan))}
+
+
+def test_verify_indexes_finds_no_problems(db, prescriptions):
+    assert verify_indexes(db) == []
+
+
+def test_keyset_next_page_is_an_index_scan_without_sort(prescriptions):
+    collection, user = prescriptions
+    live = {"user_id": user, "metadata.is_deleted": False}
+    first = list(collection.find(live).sort(KEYSET_SORT).limit(20))
+    assert len(first) == 20
+
+    # The $or seek past the last row, with upload_date ties on the boundary.
+    query = keyset_filter(live, encode_cursor(first[-1]))
+    assert "$or" in query
+    stages = plan_stages(collection.find(query, {"_id": 1}).sort(KEYSET_SORT).limit(20))
+    assert stages & {"IXSCAN", "EXPRESS_IXSCAN"}
+    assert "COLLSCAN" not in stages
+    assert "SORT" not in stages
+
+    second = list(collection.find(query).sort(KEYSET_SORT).limit(20))
+    assert {d["_id"] for d in first}.isdisjoint(d["_id"] for d in second)
+    assert (second[0]["upload_date"], second[0]["_id"]) < (first[-1]["upload_date"], first[-1]["_id"])
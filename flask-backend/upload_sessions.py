@@ -0,0 +1,361 @@
+"""Resumable, chunked upload sessions holding one or more files.
+
+A client declares the files (name, size, optionally SHA-256) up front, then
+PUTs each file's bytes in chunks at any offset, in any order and in
+parallel, and finally asks for the session to be finalized. Chunks are
+written in place into a preallocated part file per file, and each
+committed chunk's byte range is added to the session document in the
+same update that checks the session is still open and owned by the
+caller; parallel chunks never read-modify-write the document. After a
+dropped connection the session reports what is already committed, so the
+client sends only the rest.
+
+Finalizing hashes every file on the server, checks it against the SHA-256
+the client declared, moves it into the blob store and records every file
+with one ``insert_many``. Sessions expire UPLOAD_SESSION_TTL_SECONDS after
+their last chunk; ``collect`` deletes them and their part files.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import metrics
+from cache import LRUCache
+from storage import UPLOAD_CHUNK_SIZE, BlobStore, StoredFile, UploadRejected, is_sha256
+
+log = logging.getLogger(__name__)
+
+UPLOAD_SESSION_TTL_SECONDS = float(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", "86400"))
+UPLOAD_SESSION_MAX_FILES = int(os.environ.get("UPLOAD_SESSION_MAX_FILES", "20"))
+# Every chunk but a file's last must be at least this big, which bounds the
+# ranges stored per file; none may be bigger than the max.
+UPLOAD_MIN_CHUNK_BYTES = int(os.environ.get("UPLOAD_MIN_CHUNK_BYTES", str(256 * 1024)))
+UPLOAD_MAX_CHUNK_BYTES = int(os.environ.get("UPLOAD_MAX_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_GC_INTERVAL_SECONDS = float(os.environ.get("UPLOAD_SESSION_GC_INTERVAL_SECONDS", "900"))
+
+UPLOAD_SESSIONS = metrics.counter(
+    "remedi_upload_sessions_total", "Upload sessions by outcome.", ("result",),
+)
+UPLOAD_CHUNK_BYTES = metrics.counter(
+    "remedi_upload_chunk_bytes_total", "Bytes received in upload-session chunks.",
+)
+
+Range = Tuple[int, int]
+
+
+def merge_ranges(ranges: Sequence[Sequence[int]]) -> List[Range]:
+    """Sorted, non-overlapping [start, end) ranges covering the same bytes."""
+    merged: List[List[int]] = []
+    for start, end in sorted((int(s), int(e)) for s, e in ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def missing_ranges(ranges: Sequence[Sequence[int]], size: int) -> List[Range]:
+    missing, offset = [], 0
+    for start, end in merge_ranges(ranges):
+        if start > offset:
+            missing.append((offset, start))
+        offset = max(offset, end)
+    if offset < size:
+        missing.append((offset, size))
+    return missing
+
+
+class UploadSessionStore:
+    """Session documents in ``collection``, part files under ``root/<session id>/``."""
+
+    def __init__(self, root: str, collection, blob_store: BlobStore, max_file_size: int,
+                 allowed_extensions: Sequence[str], ttl: float = UPLOAD_SESSION_TTL_SECONDS):
+        self.root = root
+        self.collection = collection
+        self.blob_store = blob_store
+        self.max_file_size = max_file_size
+        self.allowed_extensions = set(allowed_extensions)
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+        # Owner and file sizes, which never change: a chunk needs no read of the session.
+        self._layouts = LRUCache("upload_session", 1024 * 1024, ttl=ttl)
+        self._gc_thread: Optional[threading.Thread] = None
+        self._gc_lock = threading.Lock()
+
+    def part_path(self, session_id, index: int) -> str:
+        return os.path.join(self.root, str(session_id), f"{index}.part")
+
+    @staticmethod
+    def parse_id(session_id: str) -> Optional[ObjectId]:
+        try:
+            return ObjectId(session_id)
+        except (InvalidId, TypeError):
+            return None
+
+    # ---------------- Create ----------------
+
+    def create(self, user_id: ObjectId, files: Sequence[dict]) -> dict:
+        if not isinstance(files, list) or not files:
+            raise UploadRejected("files must be a non-empty list")
+        if len(files) > UPLOAD_SESSION_MAX_FILES:
+            raise UploadRejected(f"At most {UPLOAD_SESSION_MAX_FILES} files per session")
+
+        entries = []
+        for f in files:
+            filename = str(f.get("filename") or "") if isinstance(f, dict) else ""
+            extension = os.path.splitext(filename)[1].lower()
+            size = f.get("size") if isinstance(f, dict) else None
+            sha256 = str(f.get("sha256") or "").strip().lower() if isinstance(f, dict) else ""
+            if extension not in self.allowed_extensions:
+                raise UploadRejected(f"Invalid file type: {filename or '(no name)'}")
+            if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+                raise UploadRejected(f"Invalid size for {filename}")
+            if size > self.max_file_size:
+                raise UploadRejected(f"File too large: {filename}")
+            if sha256 and not is_sha256(sha256):
+                raise UploadRejected(f"Invalid sha256 for {filename}")
+            entries.append({"filename": os.path.basename(filename), "extension": extension, "size": size,
+                            "sha256": sha256 or None, "ranges": []})
+
+        now = datetime.now(timezone.utc)
+        doc = {"_id": ObjectId(), "user_id": user_id, "state": "open", "files": entries,
+               "created_at": now, "expires_at": now + timedelta(seconds=self.ttl)}
+        # Sparse files of the declared size, so chunks can land at any offset.
+        os.makedirs(os.path.join(self.root, str(doc["_id"])))
+        for index, entry in enumerate(entries):
+            with open(self.part_path(doc["_id"], index), "wb") as part:
+                part.truncate(entry["size"])
+        self.collection.insert_one(doc)
+        UPLOAD_SESSIONS.inc(result="created")
+        return doc
+
+    # ---------------- Chunks ----------------
+
+    def get(self, session_id: ObjectId, user_id: ObjectId) -> Optional[dict]:
+        return self.collection.find_one({"_id": session_id, "user_id": user_id})
+
+    def layout(self, session_id: ObjectId, user_id: ObjectId) -> Optional[dict]:
+        """The session's owner and file sizes, from memory after the first chunk."""
+        layout = self._layouts.get(session_id)
+        if layout is None:
+            doc = self.collection.find_one({"_id": session_id}, {"user_id": 1, "files.size": 1})
+            if doc is None:
+                return None
+            layout = {"_id": session_id, "user_id": doc["user_id"], "files": doc["files"]}
+            self._layouts.put(session_id, layout, nbytes=128 + 32 * len(doc["files"]))
+        return layout if layout["user_id"] == user_id else None
+
+    def write_chunk(self, session: dict, index: int, offset: int, length: int,
+                    read: Callable[[int], bytes]) -> int:
+        """Write ``length`` bytes from ``read`` at ``offset`` of file ``index`` and commit the range.
+
+        ``session`` (see ``layout``) only supplies the file sizes; whether it
+        is still open is checked by the update that commits the range.
+        """
+        files = session["files"]
+        if not 0 <= index < len(files):
+            raise UploadRejected("No such file in this session", status=404)
+        size = files[index]["size"]
+        if offset < 0 or length <= 0 or offset + length > size:
+            raise UploadRejected(f"Chunk must lie within the file's {size} bytes", status=416)
+        if length > UPLOAD_MAX_CHUNK_BYTES:
+            raise UploadRejected(f"Chunks may be at most {UPLOAD_MAX_CHUNK_BYTES} bytes", status=413)
+        if length < UPLOAD_MIN_CHUNK_BYTES and offset + length != size:
+            raise UploadRejected(f"Chunks other than a file's last must be at least {UPLOAD_MIN_CHUNK_BYTES} bytes")
+
+        received = 0
+        try:
+            fd = os.open(self.part_path(session["_id"], index), os.O_WRONLY)
+        except FileNotFoundError:
+            # Finalized, cancelled or expired since ``session`` was cached.
+            raise self._closed(session["_id"])
+        try:
+            while received < length:
+                data = read(min(UPLOAD_CHUNK_SIZE, length - received))
+                if not data:
+                    break
+                os.pwrite(fd, data, offset + received)
+                received += len(data)
+        finally:
+            os.close(fd)
+        UPLOAD_CHUNK_BYTES.inc(received)
+        if received != length:
+            # Connection dropped mid-chunk: nothing is committed, the client resends it.
+            raise UploadRejected("Chunk ended early", status=400)
+
+        result = self.collection.update_one(
+            {"_id": session["_id"], "user_id": session["user_id"], "state": "open"},
+            # A resent chunk commits the same range again, not a second copy.
+            {"$addToSet": {f"files.{index}.ranges": [offset, offset + length]},
+             "$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)}},
+        )
+        if not result.matched_count:
+            raise self._closed(session["_id"])
+        return received
+
+    def _closed(self, session_id: ObjectId) -> UploadRejected:
+        """The error for a chunk sent to a session that is no longer open."""
+        self._layouts.pop(session_id)
+        doc = self.collection.find_one({"_id": session_id}, {"state": 1})
+        if doc is None:
+            return UploadRejected("Upload session not found", status=404)
+        return UploadRejected(f"Upload session is {doc['state']}, not open", status=409)
+
+    @staticmethod
+    def progress(session: dict) -> List[dict]:
+        report = []
+        for index, f in enumerate(session["files"]):
+            missing = missing_ranges(f["ranges"], f["size"])
+            report.append({
+                "index": index,
+                "filename": f["filename"],
+                "size": f["size"],
+                "received": f["size"] - sum(end - start for start, end in missing),
+                # Resume point for clients sending in order.
+                "committed_offset": missing[0][0] if missing else f["size"],
+                "missing": [list(r) for r in missing],
+            })
+        return report
+
+    # ---------------- Finalize ----------------
+
+    def finalize(self, session_id: ObjectId, user_id: ObjectId, hashes: Dict[int, str],
+                 make_doc: Callable[[StoredFile, str], dict], insert_many: Callable[[List[dict]], list]) -> list:
+        """Verify and store every file, then record them all with one ``insert_many``.
+
+        ``hashes`` (index -> SHA-256) adds to the hashes declared at creation;
+        every file needs one. Returns the inserted ids, also to a client
+        retrying a finalize that already succeeded. When a file is rejected
+        the session stays open and that file's ranges are cleared for a resend.
+        """
+        now = datetime.now(timezone.utc)
+        session = self.collection.find_one_and_update(
+            {"_id": session_id, "user_id": user_id, "state": "open"},
+            {"$set": {"state": "finalizing", "expires_at": now + timedelta(seconds=self.ttl)}},
+        )
+        if session is None:
+            done = self.collection.find_one({"_id": session_id, "user_id": user_id, "state": "finalized"},
+                                            {"prescription_ids": 1})
+            if done is not None:
+                return done["prescription_ids"]
+            raise UploadRejected("Upload session not found or no longer open", status=404)
+
+        stored: List[StoredFile] = []
+        taken: List[str] = []
+        try:
+            for index, f in enumerate(session["files"]):
+                expected = (hashes.get(index) or f.get("sha256") or "").lower()
+                if not is_sha256(expected):
+                    raise UploadRejected(f"Missing or invalid sha256 for file {index}")
+                if missing_ranges(f["ranges"], f["size"]):
+                    raise UploadRejected(f"File {index} is not fully uploaded", status=409)
+                stored.append(self._verify(session_id, index, f, expected))
+
+            docs = []
+            for file in stored:
+                path = self.blob_store.put(file)
+                taken.append(file.sha256)
+                docs.append(make_doc(file, path))
+            ids = insert_many(docs)
+        except Exception as e:
+            for file in stored:
+                file.discard()
+            self._reopen(session, taken, getattr(e, "file_index", None))
+            raise
+
+        self.collection.update_one({"_id": session_id}, {"$set": {"state": "finalized", "prescription_ids": ids}})
+        self._layouts.pop(session_id)
+        shutil.rmtree(os.path.join(self.root, str(session_id)), ignore_errors=True)
+        UPLOAD_SESSIONS.inc(result="finalized")
+        return ids
+
+    def _verify(self, session_id: ObjectId, index: int, f: dict, expected: str) -> StoredFile:
+        # Copied out through the same writer as single uploads, so what is
+        # hashed is exactly what gets stored even if a stray chunk lands on
+        # the part meanwhile, and the part survives a failed finalize.
+        hash_only = self.blob_store.exists(expected)
+        writer = self.blob_store.writer(f["extension"], self.max_file_size, hash_only=hash_only)
+        try:
+            with open(self.part_path(session_id, index), "rb") as part:
+                for block in iter(lambda: part.read(UPLOAD_CHUNK_SIZE), b""):
+                    writer.write(block)
+            stored = writer.finish()
+        except UploadRejected as e:
+            writer.abort()
+            e.file_index = index
+            raise
+        except Exception:
+            writer.abort()
+            raise
+        if stored.sha256 != expected:
+            stored.discard()
+            e = UploadRejected(f"File {index} does not match its sha256", status=422)
+            e.file_index = index
+            raise e
+        stored.filename = f["filename"]
+        return stored
+
+    def _reopen(self, session: dict, taken: List[str], bad_index: Optional[int]) -> None:
+        for sha256 in taken:
+            self.blob_store.release(sha256)
+        update = {"$set": {"state": "open"}}
+        if bad_index is not None:
+            # Its bytes are wrong somewhere; have them sent again.
+            update["$set"][f"files.{bad_index}.ranges"] = []
+        self.collection.update_one({"_id": session["_id"]}, update)
+        UPLOAD_SESSIONS.inc(result="rejected")
+
+    def cancel(self, session_id: ObjectId, user_id: ObjectId) -> bool:
+        deleted = self.collection.delete_one({"_id": session_id, "user_id": user_id, "state": "open"}).deleted_count
+        if deleted:
+            self._layouts.pop(session_id)
+            shutil.rmtree(os.path.join(self.root, str(session_id)), ignore_errors=True)
+            UPLOAD_SESSIONS.inc(result="cancelled")
+        return bool(deleted)
+
+    # ---------------- Expiry ----------------
+
+    def collect(self) -> int:
+        """Delete expired sessions and their part files; returns how many."""
+        now = datetime.now(timezone.utc)
+        expired = 0
+        for doc in self.collection.find({"state": {"$ne": "finalized"}, "expires_at": {"$lt": now}}, {"_id": 1}):
+            if self.collection.delete_one({"_id": doc["_id"], "expires_at": {"$lt": now}}).deleted_count:
+                self._layouts.pop(doc["_id"], reason="expired")
+                shutil.rmtree(os.path.join(self.root, str(doc["_id"])), ignore_errors=True)
+                expired += 1
+        # Finalized ones are kept a while for clients retrying the finalize call.
+        self.collection.delete_many({"state": "finalized", "expires_at": {"$lt": now}})
+        # Directories whose document is gone (a crash between the two steps).
+        for name in os.listdir(self.root):
+            session_id = self.parse_id(name)
+            path = os.path.join(self.root, name)
+            if (session_id is not None and time.time() - os.path.getmtime(path) > self.ttl
+                    and self.collection.find_one({"_id": session_id}, {"_id": 1}) is None):
+                shutil.rmtree(path, ignore_errors=True)
+        UPLOAD_SESSIONS.inc(expired, result="expired")
+        return expired
+
+    def start_gc(self, interval: float = UPLOAD_SESSION_GC_INTERVAL_SECONDS) -> None:
+        with self._gc_lock:
+            if self._gc_thread is None or not self._gc_thread.is_alive():
+                self._gc_thread = threading.Thread(target=self._gc_loop, args=(interval,),
+                                                   name="upload-session-gc", daemon=True)
+                self._gc_thread.start()
+
+    def _gc_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                expired = self.collect()
+                if expired:
+                    log.info("Upload session GC removed %d expired sessions", expired)
+            except Exception:
+                log.exception("Upload session GC failed")
@@ -14,6 +14,7 @@ const ChatBot = () => {
   const [symptomCandidates, setSymptomCandidates] = useState([]);
   const [currentSymptomWeights, setCurrentSymptomWeights] = useState({});
   const [symptomState, setSymptomState] = useState({});
+  const [sessionId, setSessionId] = useState(null);
 
   const [slidersLocked, setSlidersLocked] = useState(false);
   const chatContainerRef = useRef(null);
@@ -119,18 +120,30 @@ const ChatBot = () => {
     setSymptomState(updatedState);
 
     try {
-      const res = await fetch(`${server_url}/chatbot/extract_symptoms/next`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          Authorization: `Bearer ${localStorage.getItem("token")}`
-        },
-        body: JSON.stringify({
-          symptom_state: updatedState
-        })
-      });
+      const headers = {
+        "Content-Type": "application/json",
+        Authorization: `Bearer ${localStorage.getItem("token")}`
+      };
+
+      // The server keeps the conversation state, so only new answers are sent.
+      let res = null;
+      if (sessionId) {
+        res = await fetch(`${server_url}/chatbot/session/${sessionId}/answer`, {
+          method: "POST",
+          headers,
+          body: JSON.stringify({ answers: newlyAnswered })
+        });
+      }
+      if (!res || res.status === 404) {
+        res = await fetch(`${server_url}/chatbot/session`, {
+          method: "POST",
+          headers,
+          body: JSON.stringify({ answers: updatedState })
+        });
+      }
 
       const data = await res.json();
+      setSessionId(data.next_symptom ? data.session_id : null);
 
       if (data.next_symptom) {
         setSlidersLocked(false);
@@ -2,6 +2,13 @@ import React, { useState } from 'react';
 
 const server_url = import.meta.env.VITE_SERVER_URL;
 
+// Lets the server skip storing a file it already has.
+const sha256Hex = async (file) => {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+};
+
 const UploadButton = () => {
   const [uploading, setUploading] = useState(false);
   const [uploadStatus, setUploadStatus] = useState(null);
@@ -31,11 +38,15 @@ const UploadButton = () => {
       const formData = new FormData();
       formData.append('file', file);
 
+      const headers = {
+        Authorization: `Bearer ${localStorage.getItem('token')}`
+      };
+      const fileHash = await sha256Hex(file);
+      if (fileHash) headers['X-Content-SHA256'] = fileHash;
+
       const response = await fetch(`${server_url}/upload/prescription`, {
         method: 'POST',
-        headers: {
-          Authorization: `Bearer ${localStorage.getItem('token')}`
-        },
+        headers,
         body: formData
       });
 